@@ -13,13 +13,28 @@ It should next to all the other scripts.
 '''
 
 import numpy as np
-from scipy.stats import rankdata, linregress
+from scipy.stats import rankdata
+
+try:
+    from numba import njit
+
+except ImportError:
+    njit = None
+
+# Sums of squares of deviations that are smaller than this times those of
+# the deviations from another value are zero (see _get_effs_fsd).
+SSQ_RTOL = 1e-10
 
 
 class HMG3DModelEffsNaNs:
 
     _cmpt_effs_flag = False
 
+    # Compute NS, Ln. NS, KG, PC, SP and NS_DC together in one compiled pass
+    # (see _get_effs_fsd) in get_all_dict. Needs numba, the separate
+    # methods are used without it.
+    _fsd_effs_flag = njit is not None
+
     def __init__(
         self,
         ref,
@@ -78,11 +93,23 @@ class HMG3DModelEffsNaNs:
         self.ref_std = None
         self.ref_ranks = None
 
+        self.nnan_cnts = None
+        self.ref_dvs = None
+        self.ref_dvs_ssqs = None
+        self.ref_ranks_dvs = None
+        self.ref_ranks_dvs_ssqs = None
+        self.ref_ranks_dvs_cpt = None
+
         self.ref_cum = None
         self.ref_cum_mean = None
         self.ns_dc_demr = None
 
+        self.ref_mean64 = None
+        self.nnan_tidxs = None
+        self.nnan_diff_flag = None
+
         self.sim = None
+        self.sim_orig = None
         self.sim_cum = None
 
         if self._cmpt_effs_flag:
@@ -93,14 +120,30 @@ class HMG3DModelEffsNaNs:
 
         self.ref_mean = np.nanmean(self.ref, axis=0)
 
+        self.nnan_cnts = self.nnan_idxs.sum(axis=0)
+
+        # For the compiled pass. Time steps where any column is not NaN, and
+        # whether columns have NaNs at different time steps.
+        self.ref_mean64 = np.nanmean(self.ref, axis=0, dtype=np.float64)
+
+        self.nnan_tidxs = np.flatnonzero(self.nnan_idxs.any(axis=1))
+
+        self.nnan_diff_flag = bool(
+            (self.nnan_idxs != self.nnan_idxs[:, :1]).any())
+
+        if self.kg_flag or self.pc_flag or self.sp_flag:
+            self.ref_dvs, self.ref_dvs_ssqs, _ = self._get_dvs(self.ref)
+
+        # Constants of the reference are in float64, for sums that are as
+        # exact as those of _get_effs_fsd.
         if self.ns_flag:
-            self.ns_demr = np.nansum((self.ref - self.ref_mean) ** 2, axis=0)
+            self.ns_demr = np.nansum((self.ref - self.ref_mean64) ** 2, axis=0)
 
             assert (self.ns_demr > 0).all()
 
         if self.lns_flag:
             with np.errstate(divide='ignore'):
-                self.ref_ln = np.log(self.ref)
+                self.ref_ln = np.log(self.ref.astype(np.float64))
 
             ref_mean_ln = np.nanmean(self.ref_ln, axis=0)
 
@@ -116,9 +159,15 @@ class HMG3DModelEffsNaNs:
         if self.sc_flag:
             self.ref_ranks = rankdata(self.ref, axis=0, nan_policy='omit')
 
+            self.ref_ranks_dvs, self.ref_ranks_dvs_ssqs, _ = self._get_dvs(
+                self.ref_ranks)
+
+            # At the time steps of the compiled pass (see _get_sc_fsd).
+            self.ref_ranks_dvs_cpt = self.ref_ranks_dvs[self.nnan_tidxs]
+
         if self.ns_dc_flag:
             with np.errstate(divide='ignore'):
-                self.ref_cum = self.ref.copy()
+                self.ref_cum = self.ref.astype(np.float64)
 
             self.ref_cum[~self.nnan_idxs] = 0
             self.ref_cum = self.ref_cum.cumsum(axis=0)
@@ -154,12 +203,10 @@ class HMG3DModelEffsNaNs:
         else:
             self.sim = sim_orig
 
-        if self.ns_dc_flag:
-            self.sim_cum = sim_orig.copy()
-            self.sim_cum[~self.nnan_idxs] = 0
-            self.sim_cum = self.sim_cum.cumsum(axis=0)
-            self.sim_cum[~self.nnan_idxs] = np.nan
+        self.sim_orig = sim_orig
 
+        # Computed by get_ns_dc, when needed.
+        self.sim_cum = None
         return
 
     def get_ns(self):
@@ -189,23 +236,13 @@ class HMG3DModelEffsNaNs:
 
         assert self.kg_flag
 
-        r = np.empty(self.ref_shape[1])
-        b = np.empty(self.ref_shape[1])
-        g = np.empty(self.ref_shape[1])
-
-        for i in range(r.shape[0]):
-
-            ref = self.ref[self.nnan_idxs[:, i], i]
-            sim = self.sim[self.nnan_idxs[:, i], i]
+        sim_dvs, sim_dvs_ssqs, sim_mean = self._get_dvs(self.sim)
 
-            try:
-                r[i] = np.corrcoef(ref, sim)[0, 1]
+        r = self._get_ccs(
+            self.ref_dvs, self.ref_dvs_ssqs, sim_dvs, sim_dvs_ssqs)
 
-            except:
-                r[i] = -1.0
-
-            b[i] = np.mean(sim) / self.ref_mean[i]
-            g[i] = np.std(sim) / self.ref_std[i]
+        b = sim_mean / self.ref_mean
+        g = np.sqrt(sim_dvs_ssqs / self.nnan_cnts) / self.ref_std
 
         kg = 1 - ((r - 1) ** 2 + (b - 1) ** 2 + (g - 1) ** 2) ** 0.5
 
@@ -215,38 +252,44 @@ class HMG3DModelEffsNaNs:
 
         assert self.pc_flag
 
-        pc = np.empty(self.ref_shape[1])
-
-        for i in range(pc.shape[0]):
-            ref = self.ref[self.nnan_idxs[:, i], i]
-            sim = self.sim[self.nnan_idxs[:, i], i]
-
-            try:
-                pc[i] = np.corrcoef(ref, sim)[0, 1]
+        sim_dvs, sim_dvs_ssqs, _ = self._get_dvs(self.sim)
 
-            except:
-                pc[i] = -1.0
+        pc = self._get_ccs(
+            self.ref_dvs, self.ref_dvs_ssqs, sim_dvs, sim_dvs_ssqs)
 
         return pc
 
     def get_sc(self):
 
+        '''
+        Spearman correlation. sim is ranked at the time steps where ref is
+        not NaN only, as ref is. The ranks of ties are their mean.
+
+        With _fsd_effs_flag, the ranking is compiled (see _get_sc_fsd).
+        '''
+
         assert self.sc_flag
 
-        ref_ranks = self.ref_ranks
-        sim_ranks = rankdata(self.sim, axis=0, nan_policy='omit')
+        if self._fsd_effs_flag:
+            sc = _get_sc_fsd_nb(
+                self.ref_ranks_dvs_cpt,
+                self.ref_ranks_dvs_ssqs,
+                self.sim,
+                self.nnan_idxs,
+                self.nnan_tidxs,
+                self.nnan_diff_flag)
 
-        sc = np.empty(self.ref_shape[1])
+            return sc
 
-        for i in range(sc.shape[0]):
-            ref = ref_ranks[self.nnan_idxs[:, i], i]
-            sim = sim_ranks[self.nnan_idxs[:, i], i]
+        sim_ranks = rankdata(
+            np.where(self.nnan_idxs, self.sim, np.nan),
+            axis=0,
+            nan_policy='omit')
 
-            try:
-                sc[i] = np.corrcoef(ref, sim)[0, 1]
+        sim_dvs, sim_dvs_ssqs, _ = self._get_dvs(sim_ranks)
 
-            except:
-                sc[i] = -1.0
+        sc = self._get_ccs(
+            self.ref_ranks_dvs, self.ref_ranks_dvs_ssqs, sim_dvs, sim_dvs_ssqs)
 
         return sc
 
@@ -254,20 +297,56 @@ class HMG3DModelEffsNaNs:
 
         assert self.sp_flag
 
-        sp = np.empty(self.ref_shape[1])
+        sim_dvs, _, _ = self._get_dvs(self.sim)
 
-        for i in range(sp.shape[0]):
-            ref = self.ref[self.nnan_idxs[:, i], i]
-            sim = self.sim[self.nnan_idxs[:, i], i]
-
-            sp[i] = linregress(ref, sim).slope
+        # Slope of the least squares line of sim over ref.
+        sp = np.einsum('ij,ij->j', self.ref_dvs, sim_dvs) / self.ref_dvs_ssqs
 
         return sp
 
+    def _get_dvs(self, arr):
+
+        '''
+        Deviations of each column of arr from its mean, at the time steps
+        where ref is not NaN (zero at the rest), the sums of their squares
+        and the means. All columns at once, in float64.
+        '''
+
+        arr = np.where(self.nnan_idxs, arr, 0.0).astype(np.float64)
+
+        arr_mean = arr.sum(axis=0) / self.nnan_cnts
+
+        arr -= arr_mean
+        arr[~self.nnan_idxs] = 0.0
+
+        return arr, np.einsum('ij,ij->j', arr, arr), arr_mean
+
+    def _get_ccs(self, ref_dvs, ref_dvs_ssqs, sim_dvs, sim_dvs_ssqs):
+
+        '''
+        Pearson correlation of each column of ref and sim from their
+        deviations (see _get_dvs). -1 where it is not defined, e.g., for a
+        constant sim.
+        '''
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ccs = np.einsum('ij,ij->j', ref_dvs, sim_dvs) / np.sqrt(
+                ref_dvs_ssqs * sim_dvs_ssqs)
+
+        ccs[~np.isfinite(ccs)] = -1.0
+
+        return ccs
+
     def get_ns_dc(self):
 
         assert self.ns_dc_flag
 
+        if self.sim_cum is None:
+            self.sim_cum = self.sim_orig.copy()
+            self.sim_cum[~self.nnan_idxs] = 0
+            self.sim_cum = self.sim_cum.cumsum(axis=0)
+            self.sim_cum[~self.nnan_idxs] = np.nan
+
         ns_dc_numr = np.nansum((self.ref_cum - self.sim_cum) ** 2, axis=0)
 
         ns_dc = 1.0 - (ns_dc_numr / self.ns_dc_demr)
@@ -278,7 +357,25 @@ class HMG3DModelEffsNaNs:
 
         effs_dict = {}
 
-        if self._cmpt_effs_flag:
+        if self._cmpt_effs_flag and self._fsd_effs_flag and any([
+                self.ns_flag,
+                self.lns_flag,
+                self.kg_flag,
+                self.pc_flag,
+                self.sp_flag,
+                self.ns_dc_flag]):
+
+            fsd_dict = self.get_fsd_dict()
+
+            for eff_lbl in ('ns', 'lns', 'kg', 'pc', 'sc', 'sp', 'ns_dc'):
+
+                if eff_lbl in fsd_dict:
+                    effs_dict[eff_lbl] = fsd_dict[eff_lbl]
+
+                elif eff_lbl == 'sc' and self.sc_flag:
+                    effs_dict['sc'] = self.get_sc()
+
+        elif self._cmpt_effs_flag:
 
             if self.ns_flag:
                 effs_dict['ns'] = self.get_ns()
@@ -326,3 +423,739 @@ class HMG3DModelEffsNaNs:
                 effs_dict['ns_dc'] = objs
 
         return effs_dict
+
+    def get_fsd_dict(self):
+
+        '''
+        NS, Ln. NS, KG, PC, SP and NS_DC, those with their flags set, in one
+        pass over the time steps that are not NaN (see _get_effs_fsd). Sums
+        are in float64. Needs numba.
+        '''
+
+        assert self._fsd_effs_flag, 'numba could not be imported!'
+
+        effs_flgs = np.array([
+            self.ns_flag,
+            self.lns_flag,
+            self.kg_flag,
+            self.pc_flag,
+            self.sp_flag,
+            self.ns_dc_flag])
+
+        # Arrays that are not needed are not passed.
+        if self.lns_flag:
+            ref_ln = self.ref_ln
+
+        else:
+            ref_ln = self.ref[:0]
+
+        if self.ns_dc_flag:
+            ref_cum = self.ref_cum
+
+        else:
+            ref_cum = self.ref[:0]
+
+        effs = _get_effs_fsd_nb(
+            self.ref,
+            ref_ln,
+            ref_cum,
+            self.sim,
+            self.sim_orig,
+            self.nnan_idxs,
+            self.nnan_tidxs,
+            self.nnan_diff_flag,
+            self.ref_mean64,
+            np.ones(self.ref_shape[1]) if self.ns_demr is None else (
+                self.ns_demr.astype(np.float64)),
+            np.ones(self.ref_shape[1]) if self.lns_demr is None else (
+                self.lns_demr.astype(np.float64)),
+            np.ones(self.ref_shape[1]) if self.ns_dc_demr is None else (
+                self.ns_dc_demr.astype(np.float64)),
+            effs_flgs)
+
+        fsd_dict = {}
+        for i, eff_lbl in enumerate(('ns', 'lns', 'kg', 'pc', 'sp', 'ns_dc')):
+            if effs_flgs[i]:
+                fsd_dict[eff_lbl] = effs[i]
+
+        return fsd_dict
+
+    def get_bs_dict(self, n_rsps, blk_len=1, seed=None, chnk_size=2 ** 23):
+
+        '''
+        NS, Ln. NS, KG, PC and SP, those with their flags set, of n_rsps
+        bootstrap resamples of the time steps [resample, column], e.g., for
+        their quantiles. With blk_len > 1, blocks of blk_len consecutive
+        time steps are resampled (moving block bootstrap), for series with
+        autocorrelation. seed is that of the resamples.
+
+        A resample is a count of each time step in it (see _get_bs_wts).
+        The efficiencies come from sums of ref and sim over the time steps
+        (see _get_bs_ftrs), weighted with the counts. These are matrix
+        products for chnk_size counts at a time.
+
+        NS_DC (order of the time steps) and SC (ranks) are not
+        resampled.
+
+        Ln. NS leaves out the time steps whose logarithm is not finite
+        (e.g., zeros in sim). get_lns gives -inf for such a column instead.
+        '''
+
+        assert self._cmpt_effs_flag
+        assert self.sim is not None, 'set_sim first!'
+
+        assert n_rsps > 0, n_rsps
+        assert 0 < blk_len <= self.ref_shape[0], (blk_len, self.ref_shape)
+
+        rng = np.random.default_rng(seed)
+
+        ftrs = self._get_bs_ftrs()
+
+        n_stps = ftrs.shape[0]
+
+        sums = np.empty((n_rsps, ftrs.shape[1] * ftrs.shape[2]))
+
+        ftrs = ftrs.reshape(n_stps, -1)
+
+        n_rsps_chnk = max(1, chnk_size // n_stps)
+        for beg in range(0, n_rsps, n_rsps_chnk):
+            end = min(n_rsps, beg + n_rsps_chnk)
+
+            sums[beg:end] = _get_bs_wts(rng, end - beg, n_stps, blk_len) @ (
+                ftrs)
+
+        sums = sums.reshape(n_rsps, self.ref_shape[1], -1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cnts = sums[..., 0]
+
+            # Of deviations from the means.
+            ref_m2 = sums[..., 3] - (sums[..., 1] ** 2 / cnts)
+            sim_m2 = sums[..., 4] - (sums[..., 2] ** 2 / cnts)
+            crs = sums[..., 5] - (sums[..., 1] * sums[..., 2] / cnts)
+
+            pc = crs / np.sqrt(ref_m2 * sim_m2)
+
+        pc[~np.isfinite(pc)] = -1.0
+
+        bs_dict = {}
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+
+            if self.ns_flag:
+                bs_dict['ns'] = 1.0 - (sums[..., 6] / ref_m2)
+
+            if self.lns_flag:
+                bs_dict['lns'] = 1.0 - (sums[..., 10] / (
+                    sums[..., 9] - (sums[..., 8] ** 2 / sums[..., 7])))
+
+            if self.kg_flag:
+                b = (
+                    (sums[..., 2] / cnts) + self.ref_mean64) / (
+                    (sums[..., 1] / cnts) + self.ref_mean64)
+
+                g = np.sqrt(sim_m2 / ref_m2)
+
+                bs_dict['kg'] = 1 - (
+                    (pc - 1) ** 2 + (b - 1) ** 2 + (g - 1) ** 2) ** 0.5
+
+            if self.pc_flag:
+                bs_dict['pc'] = pc
+
+            if self.sp_flag:
+                bs_dict['sp'] = crs / ref_m2
+
+        return bs_dict
+
+    def _get_bs_ftrs(self):
+
+        '''
+        Values whose sums give the efficiencies of get_bs_dict [time step,
+        column, value]: 1, ref, sim, ref ** 2, sim ** 2, ref * sim and
+        (ref - sim) ** 2, at time steps where ref is not NaN (zero at the
+        rest). Then, with lns_flag, the same for the logarithms where they
+        are finite: 1, ref, ref ** 2 and (ref - sim) ** 2. ref and sim are
+        deviations from the mean of ref, for exact sums of squares.
+        '''
+
+        ftrs = np.zeros(
+            (self.ref_shape[0], self.ref_shape[1], 11 if self.lns_flag else 7))
+
+        ref = np.where(self.nnan_idxs, self.ref - self.ref_mean64, 0.0)
+        sim = np.where(self.nnan_idxs, self.sim - self.ref_mean64, 0.0)
+
+        ftrs[..., 0] = self.nnan_idxs
+        ftrs[..., 1] = ref
+        ftrs[..., 2] = sim
+        ftrs[..., 3] = ref ** 2
+        ftrs[..., 4] = sim ** 2
+        ftrs[..., 5] = ref * sim
+        ftrs[..., 6] = (ref - sim) ** 2
+
+        if self.lns_flag:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sim_ln = np.log(self.sim.astype(np.float64))
+
+                lns_idxs = (
+                    self.nnan_idxs &
+                    np.isfinite(self.ref_ln) &
+                    np.isfinite(sim_ln))
+
+                ref_ln_mean = np.nanmean(
+                    np.where(lns_idxs, self.ref_ln, np.nan), axis=0)
+
+            ref_ln = np.where(lns_idxs, self.ref_ln - ref_ln_mean, 0.0)
+            sim_ln = np.where(lns_idxs, sim_ln - ref_ln_mean, 0.0)
+
+            ftrs[..., 7] = lns_idxs
+            ftrs[..., 8] = ref_ln
+            ftrs[..., 9] = ref_ln ** 2
+            ftrs[..., 10] = (ref_ln - sim_ln) ** 2
+
+        return ftrs
+
+
+def _get_bs_wts(rng, n_rsps, n_stps, blk_len):
+
+    '''
+    Counts [resample, time step] of each of n_stps time steps in n_rsps
+    bootstrap resamples. Resamples consist of round(n_stps / blk_len)
+    blocks of blk_len consecutive time steps with random starts.
+    '''
+
+    n_blks = max(1, round(n_stps / blk_len))
+
+    blks_begs = rng.integers(0, n_stps - blk_len + 1, size=(n_rsps, n_blks))
+
+    # Number of blocks that start at each time step.
+    wts = np.bincount(
+        (blks_begs + (np.arange(n_rsps) * n_stps)[:, None]).ravel(),
+        minlength=n_rsps * n_stps).reshape(n_rsps, n_stps).astype(np.float64)
+
+    if blk_len > 1:
+        # Number of blocks that cover a time step, i.e., that start in the
+        # blk_len time steps till it.
+        wts = wts.cumsum(axis=1)
+        wts[:, blk_len:] -= wts[:, :-blk_len].copy()
+
+    return wts
+
+
+def _get_effs_fsd(
+        ref,
+        ref_ln,
+        ref_cum,
+        sim,
+        sim_orig,
+        nnan_idxs,
+        nnan_tidxs,
+        nnan_diff_flag,
+        ref_mean,
+        ns_demr,
+        lns_demr,
+        ns_dc_demr,
+        effs_flgs):
+
+    '''
+    NS, Ln. NS, KG, PC, SP and NS_DC [efficiency, column] in one pass over
+    the time steps nnan_tidxs (those where ref is not NaN in any column).
+    With nnan_diff_flag, each time step of a column is checked with
+    nnan_idxs too. Efficiencies without their flag in effs_flgs are NaN.
+
+    The sums of the correlations are of deviations from ref_mean (float64,
+    of each column), for the sums of squares to be exact. Terms of Ln. NS
+    that are NaN are left out, as nansum does. NS_DC takes sim_orig.
+    '''
+
+    n_cols = ref.shape[1]
+
+    ns_flag, lns_flag, kg_flag, pc_flag, sp_flag, ns_dc_flag = (
+        effs_flgs[0],
+        effs_flgs[1],
+        effs_flgs[2],
+        effs_flgs[3],
+        effs_flgs[4],
+        effs_flgs[5])
+
+    cc_flag = kg_flag or pc_flag or sp_flag
+
+    # Sums of each column.
+    cnts = np.zeros(n_cols)
+    ns_numr = np.zeros(n_cols)
+    lns_numr = np.zeros(n_cols)
+    ns_dc_numr = np.zeros(n_cols)
+    sim_cum = np.zeros(n_cols)
+
+    # Of deviations from ref_mean: ref, sim, ref**2, sim**2 and ref * sim.
+    ref_dvs_sum = np.zeros(n_cols)
+    sim_dvs_sum = np.zeros(n_cols)
+    ref_dvs_ssq = np.zeros(n_cols)
+    sim_dvs_ssq = np.zeros(n_cols)
+    crs_dvs_sum = np.zeros(n_cols)
+
+    for t in nnan_tidxs:
+        for i in range(n_cols):
+
+            if nnan_diff_flag and (not nnan_idxs[t, i]):
+                continue
+
+            ref_vle = np.float64(ref[t, i])
+            sim_vle = np.float64(sim[t, i])
+
+            cnts[i] += 1
+
+            if ns_flag:
+                ns_numr[i] += (ref_vle - sim_vle) ** 2
+
+            if lns_flag:
+                lns_term = (np.float64(ref_ln[t, i]) - np.log(sim_vle)) ** 2
+
+                if lns_term == lns_term:
+                    lns_numr[i] += lns_term
+
+            if cc_flag:
+                ref_dvn = ref_vle - ref_mean[i]
+                sim_dvn = sim_vle - ref_mean[i]
+
+                ref_dvs_sum[i] += ref_dvn
+                sim_dvs_sum[i] += sim_dvn
+                ref_dvs_ssq[i] += ref_dvn * ref_dvn
+                sim_dvs_ssq[i] += sim_dvn * sim_dvn
+                crs_dvs_sum[i] += ref_dvn * sim_dvn
+
+            if ns_dc_flag:
+                sim_cum[i] += np.float64(sim_orig[t, i])
+
+                ns_dc_numr[i] += (np.float64(ref_cum[t, i]) - sim_cum[i]) ** 2
+
+    effs = np.full((6, n_cols), np.nan)
+
+    for i in range(n_cols):
+
+        if ns_flag:
+            effs[0, i] = 1.0 - (ns_numr[i] / ns_demr[i])
+
+        if lns_flag:
+            effs[1, i] = 1.0 - (lns_numr[i] / lns_demr[i])
+
+        if cc_flag:
+            sim_mean = ref_mean[i] + (sim_dvs_sum[i] / cnts[i])
+
+            # Of deviations from the means. Values that are within rounding
+            # errors of zero are of constant series.
+            ref_ssq = ref_dvs_ssq[i] - (ref_dvs_sum[i] ** 2 / cnts[i])
+            sim_ssq = sim_dvs_ssq[i] - (sim_dvs_sum[i] ** 2 / cnts[i])
+
+            if ref_ssq <= (SSQ_RTOL * ref_dvs_ssq[i]):
+                ref_ssq = 0.0
+
+            if sim_ssq <= (SSQ_RTOL * sim_dvs_ssq[i]):
+                sim_ssq = 0.0
+
+            crs_sum = crs_dvs_sum[i] - (
+                ref_dvs_sum[i] * sim_dvs_sum[i] / cnts[i])
+
+            if (ref_ssq > 0) and (sim_ssq > 0):
+                cc = crs_sum / (ref_ssq * sim_ssq) ** 0.5
+
+            else:
+                cc = -1.0
+
+            if kg_flag:
+                b = sim_mean / ref_mean[i]
+                g = (sim_ssq / ref_ssq) ** 0.5
+
+                effs[2, i] = 1 - (
+                    (cc - 1) ** 2 + (b - 1) ** 2 + (g - 1) ** 2) ** 0.5
+
+            if pc_flag:
+                effs[3, i] = cc
+
+            if sp_flag:
+                effs[4, i] = crs_sum / ref_ssq
+
+        if ns_dc_flag:
+            effs[5, i] = 1.0 - (ns_dc_numr[i] / ns_dc_demr[i])
+
+    return effs
+
+
+class HMG3DModelEffsAccs:
+
+    '''
+    NS, Ln. NS, KG and its components, PC and NS_DC of n_cols columns, like
+    HMG3DModelEffsNaNs, but from chunks of the series that are given one
+    after the other (update). Only running sums are kept (see _BvrtMmts),
+    so memory does not depend on the length of the series. Accumulators of
+    consecutive parts of a series, e.g., of several workers, are combined
+    with merge.
+
+    Time steps where ref is NaN are left out, as are those where a
+    logarithm is not finite for Ln. NS. The results are those of
+    HMG3DModelEffsNaNs up to rounding, except for:
+    - Ln. NS, when sim has zeros. It is finite here, but -inf there.
+    - NS_DC, when ref has NaNs. The mean of the cumulative sums of ref is
+      taken over the time steps that are not NaN here. There, the sums at
+      the NaN time steps (totals so far) are added too, but not counted.
+    '''
+
+    def __init__(
+            self, n_cols, ns_flag, lns_flag, kg_flag, pc_flag, ns_dc_flag):
+
+        assert n_cols > 0, n_cols
+
+        assert any([ns_flag, lns_flag, kg_flag, pc_flag, ns_dc_flag])
+
+        self.n_cols = n_cols
+
+        self.ns_flag = ns_flag
+        self.lns_flag = lns_flag
+        self.kg_flag = kg_flag
+        self.pc_flag = pc_flag
+        self.ns_dc_flag = ns_dc_flag
+
+        # Of ref and sim, of their logarithms and of their cumulative sums.
+        self.mmts = _BvrtMmts(n_cols)
+        self.mmts_ln = _BvrtMmts(n_cols)
+        self.mmts_cum = _BvrtMmts(n_cols)
+
+        # Sums of ref and sim so far, where the next cumulative sums start.
+        self.ref_totl = np.zeros(n_cols)
+        self.sim_totl = np.zeros(n_cols)
+        return
+
+    def update(self, ref, sim):
+
+        '''
+        Add the next chunk ref and sim [time step, column] of the series.
+        '''
+
+        assert ref.ndim == 2, ref.ndim
+        assert ref.shape == sim.shape, (ref.shape, sim.shape)
+        assert ref.shape[1] == self.n_cols, (ref.shape, self.n_cols)
+
+        assert np.all(np.isfinite(sim))
+
+        ref = ref.astype(np.float64)
+        sim = sim.astype(np.float64)
+
+        nnan_idxs = ~np.isnan(ref)
+
+        self.mmts.update(ref, sim, nnan_idxs)
+
+        if self.lns_flag:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ref_ln = np.log(ref)
+                sim_ln = np.log(sim)
+
+            self.mmts_ln.update(
+                ref_ln,
+                sim_ln,
+                nnan_idxs & np.isfinite(ref_ln) & np.isfinite(sim_ln))
+
+        # Same as set_sim of HMG3DModelEffsNaNs, continued from the totals.
+        ref[~nnan_idxs] = 0.0
+        sim[~nnan_idxs] = 0.0
+
+        ref_cum = ref.cumsum(axis=0) + self.ref_totl
+        sim_cum = sim.cumsum(axis=0) + self.sim_totl
+
+        if self.ns_dc_flag:
+            self.mmts_cum.update(ref_cum, sim_cum, nnan_idxs)
+
+        if ref.shape[0]:
+            self.ref_totl = ref_cum[-1]
+            self.sim_totl = sim_cum[-1]
+
+        return
+
+    def merge(self, other):
+
+        '''
+        Add the accumulator other, of the part of the series that comes
+        right after that of this one. The order matters for NS_DC only.
+        '''
+
+        assert isinstance(other, HMG3DModelEffsAccs), type(other)
+
+        assert other.n_cols == self.n_cols, (other.n_cols, self.n_cols)
+
+        self.mmts.merge(other.mmts)
+        self.mmts_ln.merge(other.mmts_ln)
+
+        # The cumulative sums of other start at the totals of this one.
+        self.mmts_cum.merge(other.mmts_cum, self.ref_totl, self.sim_totl)
+
+        self.ref_totl = self.ref_totl + other.ref_totl
+        self.sim_totl = self.sim_totl + other.sim_totl
+        return
+
+    def get_ns(self):
+
+        assert self.ns_flag
+
+        return self.mmts.get_ns()
+
+    def get_lns(self):
+
+        assert self.lns_flag
+
+        return self.mmts_ln.get_ns()
+
+    def get_kg_cpts(self):
+
+        '''
+        The components r, b and g of KG.
+        '''
+
+        assert self.kg_flag
+
+        mmts = self.mmts
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            b = mmts.sim_mean / mmts.ref_mean
+            g = np.sqrt(mmts.sim_m2 / mmts.ref_m2)
+
+        return mmts.get_pc(), b, g
+
+    def get_kg(self):
+
+        r, b, g = self.get_kg_cpts()
+
+        kg = 1 - ((r - 1) ** 2 + (b - 1) ** 2 + (g - 1) ** 2) ** 0.5
+
+        return kg
+
+    def get_pc(self):
+
+        assert self.pc_flag
+
+        return self.mmts.get_pc()
+
+    def get_ns_dc(self):
+
+        assert self.ns_dc_flag
+
+        return self.mmts_cum.get_ns()
+
+    def get_all_dict(self):
+
+        effs_dict = {}
+
+        if self.ns_flag:
+            effs_dict['ns'] = self.get_ns()
+
+        if self.lns_flag:
+            effs_dict['lns'] = self.get_lns()
+
+        if self.kg_flag:
+            effs_dict['kg'] = self.get_kg()
+
+        if self.pc_flag:
+            effs_dict['pc'] = self.get_pc()
+
+        if self.ns_dc_flag:
+            effs_dict['ns_dc'] = self.get_ns_dc()
+
+        return effs_dict
+
+
+class _BvrtMmts:
+
+    '''
+    Running count, means, sums of squared deviations from the means (m2),
+    sum of products of the deviations of ref and sim (crs) and sum of
+    squared differences of ref and sim (sse) of n_cols columns. Chunks
+    are combined with the updates of Welford / Chan et al., so that the
+    sums stay exact for long series.
+    '''
+
+    def __init__(self, n_cols):
+
+        self.cnts = np.zeros(n_cols)
+        self.ref_mean = np.zeros(n_cols)
+        self.sim_mean = np.zeros(n_cols)
+        self.ref_m2 = np.zeros(n_cols)
+        self.sim_m2 = np.zeros(n_cols)
+        self.crs = np.zeros(n_cols)
+        self.sse = np.zeros(n_cols)
+        return
+
+    def update(self, ref, sim, take_idxs):
+
+        '''
+        Add ref and sim [time step, column] (float64) at take_idxs.
+        '''
+
+        chnk = _BvrtMmts(ref.shape[1])
+
+        chnk.cnts = take_idxs.sum(axis=0).astype(np.float64)
+
+        ref = np.where(take_idxs, ref, 0.0)
+        sim = np.where(take_idxs, sim, 0.0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            chnk.ref_mean = np.where(
+                chnk.cnts > 0, ref.sum(axis=0) / chnk.cnts, 0.0)
+
+            chnk.sim_mean = np.where(
+                chnk.cnts > 0, sim.sum(axis=0) / chnk.cnts, 0.0)
+
+        ref_dvs = np.where(take_idxs, ref - chnk.ref_mean, 0.0)
+        sim_dvs = np.where(take_idxs, sim - chnk.sim_mean, 0.0)
+
+        chnk.ref_m2 = np.einsum('ij,ij->j', ref_dvs, ref_dvs)
+        chnk.sim_m2 = np.einsum('ij,ij->j', sim_dvs, sim_dvs)
+        chnk.crs = np.einsum('ij,ij->j', ref_dvs, sim_dvs)
+
+        chnk.sse = np.einsum('ij,ij->j', ref - sim, ref - sim)
+
+        self.merge(chnk)
+        return
+
+    def merge(self, other, ref_shft=0.0, sim_shft=0.0):
+
+        '''
+        Add the sums of other. ref_shft and sim_shft are added to its values
+        of ref and sim first.
+        '''
+
+        # Differences of the two are shifted by this.
+        dif_shft = ref_shft - sim_shft
+
+        sse_b = other.sse + (
+            (2 * dif_shft * other.cnts * (other.ref_mean - other.sim_mean)) +
+            (other.cnts * dif_shft ** 2))
+
+        cnts_a = self.cnts
+        cnts_b = other.cnts
+
+        cnts = cnts_a + cnts_b
+
+        ref_dlta = (other.ref_mean + ref_shft) - self.ref_mean
+        sim_dlta = (other.sim_mean + sim_shft) - self.sim_mean
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            wts_b = np.where(cnts > 0, cnts_b / cnts, 0.0)
+
+        self.ref_mean = self.ref_mean + (ref_dlta * wts_b)
+        self.sim_mean = self.sim_mean + (sim_dlta * wts_b)
+
+        self.ref_m2 = self.ref_m2 + other.ref_m2 + (
+            ref_dlta ** 2 * cnts_a * wts_b)
+
+        self.sim_m2 = self.sim_m2 + other.sim_m2 + (
+            sim_dlta ** 2 * cnts_a * wts_b)
+
+        self.crs = self.crs + other.crs + (
+            ref_dlta * sim_dlta * cnts_a * wts_b)
+
+        self.sse = self.sse + np.where(cnts_b > 0, sse_b, 0.0)
+
+        self.cnts = cnts
+        return
+
+    def get_ns(self):
+
+        return 1.0 - (self.sse / self.ref_m2)
+
+    def get_pc(self):
+
+        '''
+        Pearson correlation. -1 where it is not defined, as in
+        HMG3DModelEffsNaNs.
+        '''
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pc = self.crs / np.sqrt(self.ref_m2 * self.sim_m2)
+
+        pc[~np.isfinite(pc)] = -1.0
+
+        return pc
+
+
+def _get_sc_fsd(
+        ref_ranks_dvs,
+        ref_ranks_dvs_ssqs,
+        sim,
+        nnan_idxs,
+        nnan_tidxs,
+        nnan_diff_flag):
+
+    '''
+    Spearman correlation of each column of sim with ref, from the
+    deviations of the ranks of ref from their mean [time step of
+    nnan_tidxs, column] and the sums of their squares. sim is ranked at
+    the time steps nnan_tidxs (of a column, with nnan_diff_flag), by
+    sorting once. Ties get the mean of their ranks. -1 where the
+    correlation is not defined.
+    '''
+
+    n_stps = nnan_tidxs.size
+    n_cols = sim.shape[1]
+
+    sc = np.empty(n_cols)
+
+    vles = np.empty(n_stps, dtype=sim.dtype)
+    ranks = np.empty(n_stps)
+
+    # Index of each value in nnan_tidxs.
+    stps_idxs = np.empty(n_stps, dtype=np.int64)
+
+    for i in range(n_cols):
+
+        n_vles = 0
+        for j in range(n_stps):
+            t = nnan_tidxs[j]
+
+            if nnan_diff_flag and (not nnan_idxs[t, i]):
+                continue
+
+            vles[n_vles] = sim[t, i]
+            stps_idxs[n_vles] = j
+
+            n_vles += 1
+
+        srtd_idxs = np.argsort(vles[:n_vles])
+
+        beg = 0
+        while beg < n_vles:
+            end = beg + 1
+
+            while (end < n_vles) and (
+                    vles[srtd_idxs[end]] == vles[srtd_idxs[beg]]):
+
+                end += 1
+
+            # Mean of the ranks beg + 1 to end.
+            for k in range(beg, end):
+                ranks[srtd_idxs[k]] = 0.5 * (beg + 1 + end)
+
+            beg = end
+
+        ranks_mean = 0.5 * (n_vles + 1)
+
+        crs = 0.0
+        ranks_dvs_ssq = 0.0
+        for k in range(n_vles):
+            ranks_dvn = ranks[k] - ranks_mean
+
+            crs += ranks_dvn * ref_ranks_dvs[stps_idxs[k], i]
+            ranks_dvs_ssq += ranks_dvn * ranks_dvn
+
+        if (ranks_dvs_ssq > 0) and (ref_ranks_dvs_ssqs[i] > 0):
+            sc[i] = crs / (ranks_dvs_ssq * ref_ranks_dvs_ssqs[i]) ** 0.5
+
+        else:
+            sc[i] = -1.0
+
+    return sc
+
+
+if njit is not None:
+    _get_effs_fsd_nb = njit(cache=True)(_get_effs_fsd)
+    _get_sc_fsd_nb = njit(cache=True)(_get_sc_fsd)
+
+else:
+    _get_effs_fsd_nb = None
+    _get_sc_fsd_nb = None
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+
+'''
+@author: Faizan-TU Munich
+
+Oct 18, 2026
+
+4:05:12 PM
+
+Instructions:
+The code here is needed by daa_optimize.py and dab_validate.py. It should
+be next to all the other scripts.
+
+A cache of the output files of a run. Each entry is a directory that is
+named after the hash (key) of everything that the outputs depend on: the
+inputs, bounds, objective function flags, seed, etc. and the code of the
+model and of the scripts. A later run with the same key copies the files
+from there, instead of computing them again.
+
+The total size of the entries is limited. The least recently used entries
+are removed first when it is exceeded.
+
+Many processes may use the same cache directory. Each one writes its new
+entries to a directory of its own and renames it, and an entry that
+another process removes in the meantime is treated as missing.
+'''
+
+import os
+import pickle
+import shutil
+from pathlib import Path
+from hashlib import sha1
+
+import numpy as np
+import pandas as pd
+
+# Files whose code changes the results. Relative to this file.
+CODE_PATHS = (
+    'daa_optimize.py',
+    'dab_validate.py',
+    'ba_effs_nans.py',
+    'bb_rslts_cche.py',
+    'bc_evls_arch.py',
+    'hmg/models/__init__.py',
+    'hmg/models/hbv1d012a_py.py',
+    'hmg/models/hbv1d012a_nb.py',
+    )
+
+# Name of the file in an entry that holds the returned object.
+RTRN_FILE_NM = '__rtrn__.pkl'
+
+
+class RSLTSCCHE:
+
+    '''
+    Cache of output files in the directory cche_dir, with at most
+    max_size bytes in all (default 1 GiB).
+
+    get_key gives the key of some objects, has_entry tells if an entry
+    exists, load_entry copies its files to a directory and save_entry
+    stores the files of a run. invalidate removes an entry or all of them.
+    '''
+
+    def __init__(self, cche_dir, max_size=2 ** 30):
+
+        assert max_size > 0, max_size
+
+        self._cche_dir = Path(cche_dir)
+        self._max_size = int(max_size)
+
+        self._code_vrsn = None
+        return
+
+    def get_key(self, *objs):
+
+        '''
+        A hexadecimal hash of objs and of the code version (see
+        get_code_version). Objects can be numpy arrays, pandas Series and
+        DataFrames (values and index), dictionaries, lists, tuples, paths,
+        strings, numbers and None.
+        '''
+
+        hshr = sha1()
+
+        hshr.update(self.get_code_version().encode())
+
+        for obj in objs:
+            _upd_hshr(hshr, obj)
+
+        return hshr.hexdigest()
+
+    def get_code_version(self):
+
+        '''
+        A hash of the files of CODE_PATHS. Any change in them gives other
+        keys.
+        '''
+
+        if self._code_vrsn is None:
+            hshr = sha1()
+
+            for code_path in CODE_PATHS:
+                with open(Path(__file__).parent / code_path, 'rb') as code_hdl:
+                    hshr.update(code_hdl.read())
+
+            self._code_vrsn = hshr.hexdigest()
+
+        return self._code_vrsn
+
+    def has_entry(self, key):
+
+        return (self._cche_dir / key).is_dir()
+
+    def load_entry(self, key, ot_dir):
+
+        '''
+        Copy the files of the entry key to ot_dir. Returns the object that
+        was passed as rtrn to save_entry. The entry becomes the most
+        recently used one. Raises FileNotFoundError if there is no such
+        entry, including when another process removes it while its files
+        are copied.
+        '''
+
+        ntry_dir = self._cche_dir / key
+
+        ot_dir = Path(ot_dir)
+        ot_dir.mkdir(exist_ok=True, parents=True)
+
+        for ntry_path in ntry_dir.iterdir():
+            if ntry_path.name == RTRN_FILE_NM:
+                continue
+
+            shutil.copyfile(ntry_path, ot_dir / ntry_path.name)
+
+        with open(ntry_dir / RTRN_FILE_NM, 'rb') as pkl_hdl:
+            rtrn = pickle.load(pkl_hdl)
+
+        # The modification time of the directory is the last use.
+        os.utime(ntry_dir)
+
+        return rtrn
+
+    def save_entry(self, key, ot_dir, file_nms, rtrn=None):
+
+        '''
+        Store the files file_nms of ot_dir and the object rtrn (what the
+        run returned, pickled) as the entry key. An existing entry is
+        replaced. Then, least recently used entries are removed until all
+        of them fit in max_size. An entry larger than max_size is not kept.
+        '''
+
+        ot_dir = Path(ot_dir)
+
+        self._cche_dir.mkdir(exist_ok=True, parents=True)
+
+        # Written completely before it becomes visible. The process ID keeps
+        # the writers of the same key apart.
+        tmp_dir = self._cche_dir / f'{key}_{os.getpid()}.tmp'
+
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+
+        tmp_dir.mkdir()
+
+        for file_nm in file_nms:
+            shutil.copyfile(ot_dir / file_nm, tmp_dir / file_nm)
+
+        with open(tmp_dir / RTRN_FILE_NM, 'wb') as pkl_hdl:
+            pickle.dump(rtrn, pkl_hdl)
+
+        self.invalidate(key)
+
+        try:
+            os.replace(tmp_dir, self._cche_dir / key)
+
+        except OSError:
+            # Another process saved the same entry in the meantime.
+            if not self.has_entry(key):
+                raise
+
+            _rmv_ntry_dir(tmp_dir)
+
+        self._evict()
+        return
+
+    def invalidate(self, key=None):
+
+        '''
+        Remove the entry key, or all entries when key is None. Nothing
+        happens for an entry that does not exist.
+        '''
+
+        if key is None:
+            for ntry_dir in self._get_ntrs_dirs():
+                _rmv_ntry_dir(ntry_dir)
+
+        else:
+            _rmv_ntry_dir(self._cche_dir / key)
+
+        return
+
+    def get_entries(self):
+
+        '''
+        A DataFrame with the size in bytes and the time of the last use of
+        each entry (key as index), most recently used first.
+        '''
+
+        ntrs_stts = self._get_ntrs_stts()
+
+        ntrs_dfe = pd.DataFrame(
+            index=pd.Index([ntry_dir.name for ntry_dir, _, _ in ntrs_stts]),
+            data={
+                'size': [ntry_size for _, _, ntry_size in ntrs_stts],
+                'last_use': [
+                    pd.Timestamp(ntry_mtme, unit='s')
+                    for _, ntry_mtme, _ in ntrs_stts],
+                },
+            dtype=object)
+
+        return ntrs_dfe.sort_values('last_use', ascending=False)
+
+    def _get_ntrs_dirs(self):
+
+        if not self._cche_dir.is_dir():
+            return []
+
+        return [
+            ntry_dir for ntry_dir in self._cche_dir.iterdir()
+            if ntry_dir.is_dir() and (ntry_dir.suffix != '.tmp')]
+
+    def _get_ntrs_stts(self):
+
+        '''
+        Directory, last use and size of each entry. Entries that another
+        process removes in the meantime are left out.
+        '''
+
+        ntrs_stts = []
+        for ntry_dir in self._get_ntrs_dirs():
+            try:
+                ntrs_stts.append((
+                    ntry_dir,
+                    ntry_dir.stat().st_mtime,
+                    _get_dir_size(ntry_dir)))
+
+            except FileNotFoundError:
+                continue
+
+        return ntrs_stts
+
+    def _evict(self):
+
+        ntrs_stts = sorted(
+            self._get_ntrs_stts(), key=lambda ntry_stts: ntry_stts[1])
+
+        totl_size = sum(ntry_size for _, _, ntry_size in ntrs_stts)
+
+        for ntry_dir, _, ntry_size in ntrs_stts:
+
+            if totl_size <= self._max_size:
+                break
+
+            _rmv_ntry_dir(ntry_dir)
+
+            totl_size -= ntry_size
+
+        return
+
+
+def _upd_hshr(hshr, obj):
+
+    '''
+    Update the sha1 hshr with obj (see RSLTSCCHE.get_key). The type and the
+    shape are a part of the hash, so that different objects with the same
+    bytes get different hashes.
+    '''
+
+    hshr.update(type(obj).__name__.encode())
+
+    if isinstance(obj, np.ndarray):
+        hshr.update(f'{obj.dtype.str}{obj.shape}'.encode())
+
+        if obj.dtype == object:
+            for vle in obj.ravel():
+                _upd_hshr(hshr, vle)
+
+        else:
+            hshr.update(np.ascontiguousarray(obj).tobytes())
+
+    elif isinstance(obj, pd.DataFrame):
+        _upd_hshr(hshr, _get_idx_vles(obj.columns))
+        _upd_hshr(hshr, _get_idx_vles(obj.index))
+
+        for col in obj.columns:
+            _upd_hshr(hshr, np.asarray(obj[col].values))
+
+    elif isinstance(obj, pd.Series):
+        _upd_hshr(hshr, _get_idx_vles(obj.index))
+        _upd_hshr(hshr, np.asarray(obj.values))
+
+    elif isinstance(obj, dict):
+        hshr.update(str(len(obj)).encode())
+
+        for ky in sorted(obj, key=str):
+            _upd_hshr(hshr, str(ky))
+            _upd_hshr(hshr, obj[ky])
+
+    elif isinstance(obj, (list, tuple)):
+        hshr.update(str(len(obj)).encode())
+
+        for vle in obj:
+            _upd_hshr(hshr, vle)
+
+    elif isinstance(obj, (str, Path, int, float, bool, np.generic)) or (
+            obj is None):
+
+        hshr.update(repr(obj).encode())
+        hshr.update(b'\x00')
+
+    else:
+        raise TypeError(f'Cannot hash objects of type {type(obj)}!')
+
+    return
+
+
+def _get_idx_vles(idx):
+
+    # Strings are much faster to hash as a single array.
+    idx_vles = np.asarray(idx.values)
+
+    if idx_vles.dtype == object:
+        idx_vles = idx_vles.astype(str)
+
+    return idx_vles
+
+
+def _rmv_ntry_dir(ntry_dir):
+
+    # Another process may have removed it already.
+    try:
+        shutil.rmtree(ntry_dir)
+
+    except FileNotFoundError:
+        pass
+
+    return
+
+
+def _get_dir_size(ntry_dir):
+
+    return sum(
+        ntry_path.stat().st_size for ntry_path in ntry_dir.iterdir())
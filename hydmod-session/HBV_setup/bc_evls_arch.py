@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+'''
+@author: Faizan-TU Munich
+
+Oct 18, 2026
+
+5:12:40 PM
+
+Instructions:
+The code here is needed by daa_optimize.py. It should be next to all the
+other scripts.
+
+An append-only archive of evaluations, e.g., the model parameters, the
+objective function value and the efficiencies of each candidate of an
+optimization. It is a .npy file of a structured array, with a field for
+each label, so that it can be read with read_evls_arch (a memory map,
+nothing is loaded) or numpy.load. A DataFrame of it is
+pd.DataFrame(read_evls_arch(path)).
+
+Parameter vectors that are in it already are found with a dictionary
+(see EVLSARCH.get_rows_idxs), so that they are not evaluated again.
+'''
+
+from pathlib import Path
+
+import numpy as np
+
+# Magic string and version of the .npy format.
+NPY_MAGC = b'\x93NUMPY\x01\x00'
+
+
+class EVLSARCH:
+
+    '''
+    Archive in the .npy file path with float64 fields lbls. The first
+    n_prms fields are the parameters, i.e., what identifies an evaluation.
+
+    With resume and an existing file, its rows are kept and more are
+    appended to them. The labels should be the same then. Otherwise, the
+    file is started anew.
+
+    add_rows appends rows. Each call updates the file, so that it is
+    complete at all times. get_rows_idxs finds the rows of parameter
+    vectors, get_rows reads rows.
+
+    The row of each parameter vector is kept in a dictionary with the bytes
+    of the vector as the key, i.e., vectors match when their values are
+    exactly the same. Memory use is about 100 bytes per row, plus those of
+    the parameters.
+    '''
+
+    def __init__(self, path, lbls, n_prms, resume=False):
+
+        assert 0 < n_prms <= len(lbls), (n_prms, len(lbls))
+
+        assert len(set(lbls)) == len(lbls), 'Labels should be unique!'
+
+        self._path = Path(path)
+        self._n_prms = n_prms
+
+        self._dtype = np.dtype([(lbl, np.float64) for lbl in lbls])
+
+        # The header has the same length for any number of rows, so that it
+        # can be written again in place.
+        self._hdr_len = len(self._get_hdr(np.iinfo(np.int64).max))
+
+        # Index of the first row of each parameter vector (as bytes).
+        self._rows_idxs = {}
+
+        self._n_rows = 0
+
+        if resume and self._path.exists():
+            evls_arr = read_evls_arch(self._path)
+
+            assert evls_arr.dtype == self._dtype, (
+                'Labels differ from those of the existing archive!',
+                evls_arr.dtype.names,
+                lbls)
+
+            n_rows = evls_arr.shape[0]
+
+            # A header of another length cannot be written in place.
+            assert evls_arr.offset == self._hdr_len, (
+                f'{self._path} was not written by EVLSARCH!')
+
+            self._hdl = open(self._path, 'r+b')
+
+            # Rows of an append that did not finish are dropped.
+            self._hdl.truncate(
+                self._hdr_len + (n_rows * self._dtype.itemsize))
+
+            # In chunks, for a small memory use.
+            for beg in range(0, n_rows, 2 ** 16):
+                end = min(n_rows, beg + 2 ** 16)
+
+                self._add_rows_idxs(self._get_prms(evls_arr[beg:end]))
+
+            del evls_arr
+
+        else:
+            self._path.parent.mkdir(exist_ok=True, parents=True)
+
+            self._hdl = open(self._path, 'w+b')
+            self._hdl.write(self._get_hdr(0))
+            self._hdl.flush()
+        return
+
+    def get_labels(self):
+
+        return self._dtype.names
+
+    def get_number_of_rows(self):
+
+        return self._n_rows
+
+    def add_rows(self, rows):
+
+        '''
+        Append rows [row, label] (float64) to the file. Rows with the
+        same parameters as existing ones are added too, but get_rows_idxs
+        gives the first of those.
+        '''
+
+        rows = np.ascontiguousarray(rows, dtype=np.float64)
+
+        assert rows.ndim == 2, rows.ndim
+        assert rows.shape[1] == len(self._dtype.names), (
+            rows.shape, len(self._dtype.names))
+
+        if not rows.shape[0]:
+            return
+
+        self._hdl.seek(0, 2)
+        self._hdl.write(rows.tobytes())
+
+        self._add_rows_idxs(rows[:, :self._n_prms])
+
+        self._hdl.seek(0)
+        self._hdl.write(self._get_hdr(self._n_rows))
+        self._hdl.flush()
+        return
+
+    def get_rows_idxs(self, prms):
+
+        '''
+        Indices of the rows with the parameter vectors prms [vector,
+        parameter], -1 for those that are not in the archive.
+        '''
+
+        prms = np.ascontiguousarray(prms, dtype=np.float64)
+
+        assert prms.ndim == 2, prms.ndim
+        assert prms.shape[1] == self._n_prms, (prms.shape, self._n_prms)
+
+        rows_idxs = np.array(
+            [self._rows_idxs.get(prm.tobytes(), -1) for prm in prms],
+            dtype=np.int64)
+
+        return rows_idxs
+
+    def get_rows(self, rows_idxs):
+
+        '''
+        Rows [row, label] of rows_idxs, read from the file.
+        '''
+
+        row_size = self._dtype.itemsize
+
+        rows = np.empty((len(rows_idxs), len(self._dtype.names)))
+        for i, row_idx in enumerate(rows_idxs):
+
+            assert 0 <= row_idx < self._n_rows, (row_idx, self._n_rows)
+
+            self._hdl.seek(self._hdr_len + (int(row_idx) * row_size))
+
+            rows[i] = np.frombuffer(
+                self._hdl.read(row_size), dtype=np.float64)
+
+        return rows
+
+    def close(self):
+
+        self._hdl.close()
+        return
+
+    def _get_prms(self, rows):
+
+        # Structured rows as float64 [row, label] first.
+        if rows.dtype.names is not None:
+            rows = np.ascontiguousarray(rows).view(np.float64).reshape(
+                -1, len(self._dtype.names))
+
+        return rows[:, :self._n_prms]
+
+    def _get_hdr(self, n_rows):
+
+        hdr = repr({
+            'descr': np.lib.format.dtype_to_descr(self._dtype),
+            'fortran_order': False,
+            'shape': (n_rows,),
+            })
+
+        hdr_len = getattr(self, '_hdr_len', None)
+
+        if hdr_len is None:
+            # Magic, version, length and newline. A multiple of 64 bytes,
+            # as numpy writes it.
+            hdr_len = -(-(len(NPY_MAGC) + 2 + len(hdr) + 1) // 64) * 64
+
+        hdr = hdr.ljust(hdr_len - len(NPY_MAGC) - 2 - 1) + '\n'
+
+        assert len(hdr) < 2 ** 16, 'Too many labels!'
+
+        return NPY_MAGC + len(hdr).to_bytes(2, 'little') + hdr.encode('latin1')
+
+    def _add_rows_idxs(self, prms):
+
+        prms = np.ascontiguousarray(prms, dtype=np.float64)
+
+        for prm in prms:
+            self._rows_idxs.setdefault(prm.tobytes(), self._n_rows)
+
+            self._n_rows += 1
+
+        return
+
+
+def read_evls_arch(path):
+
+    '''
+    The structured array of the EVLSARCH in the file path, as a read-only
+    memory map.
+    '''
+
+    return np.load(path, mmap_mode='r')
+
@@ -14,26 +14,57 @@ functions.
 
 import os
 import sys
+import pickle
 import time
 import timeit
+import warnings
 import traceback as tb
+from inspect import signature
 from pathlib import Path
 from timeit import default_timer
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
 
 import numpy as np
 import pandas as pd
-from scipy.optimize import differential_evolution
+import scipy
+from scipy.optimize import OptimizeResult, differential_evolution
+from scipy.interpolate import RBFInterpolator
+from scipy.optimize._differentialevolution import (
+    DifferentialEvolutionSolver)
 
 #from daily.HBV_setup.hmg import HBV1D012A
 from HBV_setup.hmg import HBV1D012A
 
 from HBV_setup.ba_effs_nans import HMG3DModelEffsNaNs as HMG3DModelEffs
+from HBV_setup.bb_rslts_cche import RSLTSCCHE
+from HBV_setup.bc_evls_arch import EVLSARCH
 #from HBV.daily.HBV_setup.ba_effs_nans import HMG3DModelEffsNaNs as HMG3DModelEffs
 
 DEBUG_FLAG = False
 
+# For checkpoints, thresholds, stalls and shrinking populations,
+# get_optn_ress steps scipy's DifferentialEvolutionSolver itself, and reads
+# and sets private attributes of it. These are not a public API and may
+# change with any release. Only the versions (major.minor) here were
+# checked. With others, get_optn_ress warns.
+SCIPY_VRSNS = ('1.17',)
 
-def main(prms_buds_dict, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'HBV/daily/calib_results_hbv_daily', cat_label = '10420'):
+# Arguments of the objective functions in a worker of the parallel mode.
+# Set once for each worker by _init_optn_wkr.
+_WKR_OPTN_ARGS = None
+
+# Relative margin of the sum of squared errors above which the run of a
+# candidate is stopped (see get_objv_fntn_vlue_bh). Much larger than the
+# differences due to the float32 sums of HMG3DModelEffs.
+ABRT_RTOL = 1e-4
+
+# Labels of the efficiencies of the objective functions, in the order of
+# effs_flgs.
+EFFS_LBLS = ('ns', 'lns', 'kg', 'pc', 'sc')
+
+
+def main(prms_buds_dict, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'HBV/daily/calib_results_hbv_daily', cat_label = '10420', sim_otps_lbls=None, sim_otps_freq=None, sim_otps_aggr='mean', n_cpus=1, seed=None, ckps_path=None, ckps_gens=10, resume=False, prms_init=None, prms_init_sprd=0.05, max_gens=None, rslts_cche=None):
 
 #def main():
 
@@ -61,6 +92,107 @@ def main(prms_buds_dict, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'
     # An optimization parameter. Leave it like this.
     pop_size = 3
 
+    # Convergence monitor (see CVGMNTR). The best objective function value,
+    # the spread of those of the population and the diameter of the
+    # population are recorded for each generation (cvg_*_df.csv).
+    # stal_gens: The optimization stops once the best objective function
+    # value improved by less than stal_tol in the last stal_gens
+    # generations. scipy's own criterion (tol) is not used then. None for
+    # scipy's criterion only.
+    # mbrs_min: The population shrinks, down to mbrs_min members, as the
+    # spread of its objective function values goes down to the tol of
+    # scipy. Worst members are removed. None for a fixed population size.
+    # Both save model runs, but change the course of the optimization and
+    # hence the calibrated parameters, e.g., use 20, 5e-4 and 8. Both are
+    # printed in the summary of the run.
+    stal_gens = None
+    stal_tol = 5e-4
+    mbrs_min = None
+
+    # n_cpus: Number of processes that evaluate the candidates of a
+    # generation. With more than one, the candidates are split among a pool
+    # of processes. Each has its own model and reads the inputs from shared
+    # memory.
+    # seed: Seed of the optimizer's random numbers. None for a random one.
+    # With a seed, bch_flag or n_cpus > 1, the candidates of a generation
+    # are evaluated together and the population is updated once per
+    # generation (updating='deferred'). Hence, with the same seed, the
+    # results are the same for any n_cpus. Otherwise, it is updated after
+    # each candidate (scipy's default, updating='immediate'), which is a
+    # different variant of the optimizer. Note: with eff_lns_flag, invalid
+    # Ln. NSE values are replaced by random ones that are not seeded.
+
+    # ckps_path: Path of a file where the state of the optimizer is saved
+    # every ckps_gens generations (see get_optn_ress). None for no saving.
+    # resume: Whether to continue from the state in ckps_path, if it exists,
+    # instead of starting from the beginning. The bounds and pop_size
+    # should be the same as those of the run that saved it.
+
+    # prms_init: Model parameters (pd.Series with the labels of
+    # HBV1D012A.get_parameter_labels as index, or an array in that order)
+    # to start the search around, e.g., those of coarser time steps (see
+    # dad_optimize_mf.py). The initial population is then normally
+    # distributed around them with a standard deviation of prms_init_sprd
+    # in the normalized search space (see get_init_popn). None for a random
+    # initial population over all of the bounds.
+    # max_gens: Maximum number of generations. None for the default of
+    # scipy.
+
+    # rslts_cche: A RSLTSCCHE (see bb_rslts_cche.py) that keeps the output
+    # files of runs. When a run with the same inputs, bounds, cat_area,
+    # secs_per_step, cat_label, sim_otps_*, seed, prms_init* and max_gens
+    # and the same code (including the settings here) was done before,
+    # its files are copied to ot_dir and nothing is computed. n_cpus does
+    # not change the results and is not a part of the key, but the backend
+    # of the model and the updating mode of the optimizer (see bch_flag)
+    # are. Not used with seed None, as each run gives other results then,
+    # and with resume, as the results depend on the checkpoint then. None
+    # for no caching.
+
+    # Evaluate all the candidates of a generation in a single call to the
+    # model (HBV1D012A.run_batch). Much faster than one call per candidate.
+    # The population is then updated once per generation
+    # (updating='deferred', see seed). Without a seed and with n_cpus of
+    # one, the calibrated parameters are not the same as without it.
+    bch_flag = False
+
+    # Stop the model run of a candidate as soon as its sum of squared errors
+    # shows that it cannot replace the member of the population that it is
+    # compared with (see get_objv_fntn_vlue_bh). The stopped candidates get
+    # an objective function value that is worse than that of the member
+    # only, not their true one. The optimizer keeps the same members, with
+    # fewer time steps to run, but the values it sees differ. Only possible
+    # with bch_flag and when the NSE is the only objective function,
+    # ignored otherwise.
+    abrt_flag = False
+
+    # Pre-screen the candidates with a surrogate of the objective function
+    # (see SRGTMODL), learned from all the evaluations so far. Only the
+    # candidates that may replace their member of the population are run
+    # with the model. The rest get predicted values. The error of the
+    # surrogate is checked all the time, on the evaluated candidates, and
+    # is saved for each generation (srgt_*_df.csv). Only possible with
+    # bch_flag, ignored otherwise.
+    srgt_flag = False
+
+    # Keep every evaluation in the file evls_*.npy (see EVLSARCH): the model
+    # parameters, the objective function value, whether it is the true one
+    # (1) or that of a stopped run (0, see abrt_flag), and the
+    # efficiencies of the objective functions (NaN for stopped runs). Read
+    # it with bc_evls_arch.read_evls_arch. Candidates with parameters that
+    # have a true value there already are not run again. With resume, the
+    # file of the previous run is appended to. Not with n_cpus > 1 without
+    # bch_flag, ignored then. Off by default, as the file is written next to
+    # the other outputs.
+    evls_arch_flag = False
+
+    # Labels of the parameters that are searched on a log scale, e.g.,
+    # ('lrr_tdh',). For those with bounds that span orders of magnitude.
+    # This changes how the parameters are sampled, and hence the calibrated
+    # ones. Parameters with equal lower and upper bounds are left out of
+    # the search (see SRCHSPCE).
+    log_prms_lbls = ()
+
     # Bounds for all parameters.
     # First one is lower, last is upper.
     # Initial values of the model are also calibrated. Hence, no warmup period.
@@ -72,6 +204,14 @@ def main(prms_buds_dict, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'
     eff_pc_flag = False  # Pearson Corr.
     eff_sc_flag = False  # Spearman Corr.
 
+    # Outputs of the final run that are saved (sim_*_otps_df.csv):
+    # sim_otps_lbls: Labels of the outputs to save (see
+    # HBV1D012A.get_output_labels) e.g., ('snw_dth', 'sl1_mse'). None for all.
+    # sim_otps_freq: A pandas period frequency e.g., 'D' or 'M' to save daily
+    # or monthly aggregates instead of each time step. None for no
+    # aggregation.
+    # sim_otps_aggr: How to aggregate, either 'mean' or 'sum'.
+
     # The directory where all the outputs will be saved.
     ot_dir = Path(output_dir)
     #==========================================================================
@@ -111,55 +251,210 @@ def main(prms_buds_dict, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'
     diso = inp_dfe.loc[:, 'dis_ref'].values
     #======================================================================
 
-    modl_objt = HBV1D012A()
+    prms_idxs = HBV1D012A().get_parameter_labels()
 
-    prms_buds = modl_objt.get_parameter_bounds_in_correct_order(
+    prms_buds = HBV1D012A().get_parameter_bounds_in_correct_order(
         prms_buds_dict)
 
-    modl_objt.set_inputs(tems, ppts, pets)
-    modl_objt.set_outputs(tems.size)
-
-    modl_objt.set_discharge_scaler(dslr)
-    #======================================================================
-
-    optn_args = OPTNARGS()
+    # The optimizer searches in this space. The objective functions take
+    # its parameters.
+    srch_spce = SRCHSPCE(
+        prms_buds, [prms_idxs[prm_lbl] for prm_lbl in log_prms_lbls])
 
-    optn_args.cntr = 0
-    optn_args.oflg = 0
-    optn_args.vbse = False
-    optn_args.modl_objt = modl_objt
-    optn_args.take_idxs = np.isfinite(diso)
+    effs_flgs = (
+        eff_ns_flag, eff_lns_flag, eff_kg_flag, eff_pc_flag, eff_sc_flag)
 
-    optn_args.effs_cls = HMG3DModelEffs(
-        diso[:, None],
-        eff_ns_flag,
-        eff_lns_flag,
-        eff_kg_flag,
-        eff_pc_flag,
-        eff_sc_flag,
-        False,
-        False)
+    # See seed.
+    if bch_flag or (n_cpus > 1) or (seed is not None):
+        dfev_updg = 'deferred'
 
-    modl_objt.set_optimization_flag(1)
+    else:
+        dfev_updg = 'immediate'
+
+    if resume or (seed is None):
+        rslts_cche = None
+
+    if rslts_cche is not None:
+        assert isinstance(rslts_cche, RSLTSCCHE), type(rslts_cche)
+
+        if isinstance(prms_init, pd.Series):
+            prms_init = prms_init.loc[list(prms_idxs)].values
+
+        cche_key = rslts_cche.get_key(
+            'daa_optimize',
+            inp_dfe,
+            prms_buds,
+            float(cat_area),
+            int(secs_per_step),
+            str(cat_label),
+            sim_otps_lbls,
+            sim_otps_freq,
+            sim_otps_aggr,
+            seed,
+            None if prms_init is None else np.asarray(
+                prms_init, dtype=np.float64),
+            float(prms_init_sprd),
+            max_gens,
+            effs_flgs,
+            dfev_updg,
+            HBV1D012A().get_backend())
+
+        # Another process may remove the entry at any time.
+        try:
+            prms_sr = rslts_cche.load_entry(cche_key, ot_dir)
+
+        except FileNotFoundError:
+            pass
+
+        else:
+            print(f'Results taken from the cache ({cche_key}).')
+            return prms_sr
+
+    abrt_flag = abrt_flag and bch_flag and (
+        effs_flgs == (True, False, False, False, False))
+
+    optn_args = get_optn_args(
+        tems,
+        ppts,
+        pets,
+        diso,
+        dslr,
+        prms_buds,
+        effs_flgs,
+        srch_spce,
+        abrt_flag)
+
+    modl_objt = optn_args.modl_objt
+
+    # In the main process only. Workers evaluate what it lets through.
+    if srgt_flag and bch_flag:
+        optn_args.srgt = SRGTMODL(seed=seed)
+
+    if evls_arch_flag and (bch_flag or (n_cpus == 1)):
+        optn_args.evls_arch = EVLSARCH(
+            ot_dir / f'evls_{cat_label}.npy',
+            list(prms_idxs) + ['obj', 'true'] + [
+                eff_lbl
+                for eff_lbl, eff_flag in zip(EFFS_LBLS, effs_flgs)
+                if eff_flag],
+            len(prms_idxs),
+            resume)
+    #======================================================================
 
     print('Optimizing...')
 
     _tbeg = default_timer()
 
-    optn_ress = differential_evolution(
-        get_objv_fntn_vlue,
-        bounds=prms_buds,
-        args=(optn_args,),
-        popsize=pop_size,
-        polish=False)
+    # Arguments of differential_evolution.
+    dfev_kwds = {
+        'popsize': pop_size,
+        'polish': False,
+        'seed': seed,
+        'updating': dfev_updg,
+        }
+
+    cvg_mntr = CVGMNTR(stal_gens, stal_tol, mbrs_min)
+
+    if prms_init is not None:
+        if isinstance(prms_init, pd.Series):
+            prms_init = prms_init.loc[list(prms_idxs)].values
+
+        # scipy takes at least five members too.
+        dfev_kwds['init'] = get_init_popn(
+            srch_spce,
+            prms_init,
+            max(5, pop_size * srch_spce.get_search_indices().size),
+            prms_init_sprd,
+            seed)
+
+    if max_gens is not None:
+        dfev_kwds['maxiter'] = max_gens
+
+    if stal_gens is not None:
+        dfev_kwds['tol'] = 0.0
+
+    # Shared memory blocks of the parallel mode.
+    shms = []
+
+    try:
+        if n_cpus > 1:
+            # The inputs are put in shared memory once. Each worker attaches
+            # to it and has its own model object (see _init_optn_wkr).
+            for arr in (tems, ppts, pets, diso):
+                shms.append(_get_shm_arr(arr))
+
+            optn_args.n_cpus = n_cpus
+            optn_args.pool = Pool(
+                n_cpus,
+                initializer=_init_optn_wkr,
+                initargs=(
+                    [(shm.name, arr.size) for shm, arr in shms],
+                    dslr,
+                    prms_buds,
+                    effs_flgs,
+                    srch_spce,
+                    abrt_flag))
+
+        if bch_flag:
+            if n_cpus > 1:
+                objv_fntn = get_objv_fntn_vlue_bh_mp
+
+            else:
+                objv_fntn = get_objv_fntn_vlue_bh
+
+            objv_args = (optn_args,)
+
+            dfev_kwds['vectorized'] = True
+
+        elif n_cpus > 1:
+            # The workers have their own arguments, nothing but the
+            # parameters is sent to them.
+            objv_fntn = _get_objv_fntn_vlue_wkr
+            objv_args = ()
+
+            dfev_kwds['workers'] = optn_args.pool.map
+
+        else:
+            objv_fntn = get_objv_fntn_vlue
+            objv_args = (optn_args,)
+
+        optn_ress = get_optn_ress(
+            objv_fntn,
+            srch_spce.get_bounds(),
+            objv_args,
+            dfev_kwds,
+            ckps_path,
+            ckps_gens,
+            resume,
+            optn_args if (abrt_flag or optn_args.srgt) else None,
+            cvg_mntr,
+            optn_args if (bch_flag or (n_cpus == 1)) else None)
+
+    finally:
+        if optn_args.evls_arch is not None:
+            optn_args.evls_arch.close()
+
+            # The final run below is not an evaluation of the optimizer.
+            optn_args.evls_arch = None
+
+        if optn_args.pool is not None:
+            optn_args.pool.close()
+            optn_args.pool.join()
+
+            optn_args.pool = None
+
+        # Also those of a failed start of the pool.
+        for shm, _ in shms:
+            shm.close()
+            shm.unlink()
 
     _tend = default_timer()
 
-    prms = optn_ress.x
+    prms = srch_spce.get_prms(optn_ress.x)
 
     optn_args.vbse = True
 
-    get_objv_fntn_vlue(prms, optn_args)
+    get_objv_fntn_vlue(optn_ress.x, optn_args)
     #==========================================================================
 
     print('\tBest model parameters:')
@@ -179,13 +474,66 @@ def main(prms_buds_dict, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'
     print('\tTotal number of iterations:', optn_ress.nit)
     print('')
 
+    print('\tTotal number of model runs:', optn_ress.n_runs)
+    print('')
+
+    print('\tStopped because:', optn_ress.message)
+    print('')
+
+    if stal_gens is None:
+        print('\tStall criterion: None (scipy\'s tol only)')
+
+    else:
+        print(
+            '\tStall criterion:',
+            f'{stal_gens} generations, tolerance {stal_tol}')
+
+    print('')
+
+    # No records without generations, with scipy's differential_evolution.
+    if optn_ress.cvgs.shape[0]:
+        print(
+            '\tPopulation size (first, last):',
+            optn_ress.cvgs['n_mbrs'].iloc[0],
+            optn_ress.cvgs['n_mbrs'].iloc[-1],
+            '(fixed)' if mbrs_min is None else f'(minimum {mbrs_min})')
+
+    print('')
+
     print('\tTime to optimize:', f'{_tend - _tbeg:0.2f} secs')
     print('')
+
+    if optn_args.srgt is not None:
+        srgts_dfe = optn_args.srgt.get_records()
+
+        print(
+            '\tSurrogate, candidates evaluated:',
+            srgts_dfe['n_evld'].sum(),
+            'of',
+            srgts_dfe['n_cdts'].sum())
+
+        print(
+            '\tSurrogate, RMSE of the last predictions:',
+            round(optn_args.srgt.get_rmse(), 4))
+
+        print('')
     #======================================================================
 
     modl_objt.set_optimization_flag(0)
 
-    otps_lbls = modl_objt.get_output_labels()
+    otps_idxs = inp_dfe.index
+
+    if sim_otps_freq is None:
+        modl_objt.set_outputs(tems.size, sim_otps_lbls)
+
+    else:
+        aggs_idxs, otps_idxs = pd.factorize(
+            pd.to_datetime(otps_idxs).to_period(sim_otps_freq))
+
+        modl_objt.set_outputs(
+            tems.size, sim_otps_lbls, aggs_idxs, sim_otps_aggr)
+
+    otps_lbls = modl_objt.get_selected_output_labels()
 
     modl_objt.set_parameters(prms)
 
@@ -211,7 +559,7 @@ def main(prms_buds_dict, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'
     sim_otps_df = pd.DataFrame(
         data=otps,
         columns=otps_lbls,
-        index=inp_dfe.index,
+        index=otps_idxs,
         dtype=np.float32)
 
     # Reference and simulated discharge.
@@ -269,42 +617,939 @@ def main(prms_buds_dict, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'
         ot_dir / f'prf_{cat_label}_sr.csv',
         sep=';',
         float_format='%0.6f')
+
+    optn_ress.cvgs.to_csv(
+        ot_dir / f'cvg_{cat_label}_df.csv',
+        sep=';',
+        float_format='%0.6f')
+
+    if optn_args.srgt is not None:
+        srgts_dfe.to_csv(
+            ot_dir / f'srgt_{cat_label}_df.csv',
+            sep=';',
+            float_format='%0.6f')
+
+    if rslts_cche is not None:
+        ot_file_nms = [
+            f'sim_{cat_label}_otps_df.csv',
+            f'dis_sim_{cat_label}_df.csv',
+            f'prms_{cat_label}_sr.csv',
+            f'prf_{cat_label}_sr.csv',
+            f'cvg_{cat_label}_df.csv',
+            ]
+
+        if optn_args.srgt is not None:
+            ot_file_nms.append(f'srgt_{cat_label}_df.csv')
+
+        if evls_arch_flag and (bch_flag or (n_cpus == 1)):
+            ot_file_nms.append(f'evls_{cat_label}.npy')
+
+        rslts_cche.save_entry(cche_key, ot_dir, ot_file_nms, prms_sr)
     #======================================================================
 
+    return prms_sr
+
+
+def get_init_popn(srch_spce, prms, n_mbrs, sprd, seed=None):
+
+    '''
+    Initial population of the optimizer with n_mbrs members around the
+    model parameters prms, in the search space srch_spce. The first member
+    is prms. The rest are normally distributed around it, with a standard
+    deviation of sprd in each normalized parameter. Values beyond the
+    bounds are reflected back inside them. Clipping would put many members
+    exactly on the bounds, where some model equations divide by zero.
+    Parameters of prms that are out of the bounds are clipped. seed is that
+    of the random numbers.
+    '''
+
+    assert isinstance(n_mbrs, int), type(n_mbrs)
+    assert n_mbrs >= 5, n_mbrs
+
+    assert sprd > 0, sprd
+
+    srch_prms = srch_spce.get_srch_prms(np.asarray(prms, dtype=np.float64))
+
+    rngn = np.random.default_rng(seed)
+
+    popn = srch_prms + (
+        sprd * rngn.standard_normal((n_mbrs, srch_prms.size)))
+
+    popn = np.abs(popn)
+    popn = 1.0 - np.abs(1.0 - popn)
+
+    # Only for sprd much larger than the bounds.
+    popn = np.clip(popn, 0.0, 1.0)
+
+    popn[0] = srch_prms
+
+    return popn
+
+
+def get_optn_args(
+        tems,
+        ppts,
+        pets,
+        diso,
+        dslr,
+        prms_buds,
+        effs_flgs,
+        srch_spce,
+        abrt_flag=False):
+
+    '''
+    A model object for optimization runs and everything else that the
+    objective functions need. effs_flgs are the flags of the efficiencies
+    (NSE, Ln. NSE, KGE, Pearson and Spearman Corr.). Inputs should be float32
+    so that they are not copied. srch_spce is the SRCHSPCE of the
+    optimizer. abrt_flag is for stopping the runs of hopeless candidates
+    in get_objv_fntn_vlue_bh (NSE only).
+    '''
+
+    modl_objt = HBV1D012A()
+
+    modl_objt.set_inputs(tems, ppts, pets, False)
+    modl_objt.set_outputs(tems.size)
+
+    modl_objt.set_discharge_scaler(dslr)
+    #======================================================================
+
+    optn_args = OPTNARGS()
+
+    optn_args.cntr = 0
+    optn_args.oflg = 0
+    optn_args.vbse = False
+    optn_args.modl_objt = modl_objt
+    optn_args.srch_spce = srch_spce
+    optn_args.take_idxs = np.isfinite(diso)
+
+    optn_args.effs_cls = HMG3DModelEffs(
+        diso[:, None],
+        *effs_flgs,
+        False,
+        False)
+
+    # Efficiencies object for the last number of candidates.
+    optn_args.effs_clss_bh = {}
+
+    if abrt_flag:
+        assert effs_flgs == (True, False, False, False, False), (
+            'Runs can be stopped with the NSE only!', effs_flgs)
+
+    optn_args.abrt_flag = abrt_flag
+    optn_args.diso = diso
+
+    # Objective function values of the population members that the
+    # candidates are compared with. Set by get_optn_ress for each
+    # generation. None to run all candidates till the end.
+    optn_args.objv_thds = None
+
+    # Surrogate of the objective function (SRGTMODL). None for no
+    # pre-screening.
+    optn_args.srgt = None
+
+    # Archive of the evaluations (EVLSARCH). None for no archive.
+    optn_args.evls_arch = None
+
+    # Pool of the workers of the parallel mode. None for no pool.
+    optn_args.pool = None
+
+    # Number of model runs of the objective functions so far (see
+    # get_optn_ress).
+    optn_args.n_runs = 0
+
+    modl_objt.set_optimization_flag(1)
+
+    # Parameters from differential_evolution are within prms_buds. These
+    # are checked once here and not for each run.
+    optn_args.modl_prep = modl_objt.get_prepared_run(prms_buds)
+
+    return optn_args
+
+
+def _get_shm_arr(arr):
+
+    '''
+    A copy of a float32 array in a new shared memory block. Returns the
+    block and the copy.
+    '''
+
+    shm = SharedMemory(create=True, size=max(1, arr.nbytes))
+
+    shm_arr = np.ndarray(arr.shape, dtype=np.float32, buffer=shm.buf)
+    shm_arr[:] = arr
+
+    return shm, shm_arr
+
+
+def _init_optn_wkr(
+        shms_args, dslr, prms_buds, effs_flgs, srch_spce, abrt_flag=False):
+
+    '''
+    Initializer of each worker of the parallel mode. Attaches to the shared
+    memory of the inputs (tems, ppts, pets, diso) and prepares the
+    arguments of the objective functions (_WKR_OPTN_ARGS).
+    '''
+
+    global _WKR_OPTN_ARGS
+
+    shms = []
+    arrs = []
+    for shm_name, arr_size in shms_args:
+        shm = SharedMemory(name=shm_name)
+
+        shms.append(shm)
+        arrs.append(
+            np.ndarray((arr_size,), dtype=np.float32, buffer=shm.buf))
+
+    _WKR_OPTN_ARGS = get_optn_args(
+        *arrs, dslr, prms_buds, effs_flgs, srch_spce, abrt_flag)
+
+    # The inputs are used without copying. Keep the memory attached.
+    _WKR_OPTN_ARGS.shms = shms
+    return
+
+
+def _get_objv_fntn_vlue_wkr(prms):
+
+    '''
+    get_objv_fntn_vlue in a worker of the parallel mode.
+    '''
+
+    return get_objv_fntn_vlue(prms, _WKR_OPTN_ARGS)
+
+
+def _get_objv_vles_bh_wkr(prms_thds_flgs):
+
+    '''
+    _get_objv_vles_bh in a worker of the parallel mode. prms_thds_flgs are
+    its arguments other than args.
+    '''
+
+    prms, objv_thds, evln_flgs = prms_thds_flgs
+
+    return _get_objv_vles_bh(prms, _WKR_OPTN_ARGS, objv_thds, evln_flgs)
+
+
+def get_optn_ress(
+        objv_fntn,
+        prms_buds,
+        objv_args,
+        dfev_kwds,
+        ckps_path=None,
+        ckps_gens=10,
+        resume=False,
+        thds_args=None,
+        cvg_mntr=None,
+        runs_args=None):
+
+    '''
+    Same as scipy's differential_evolution(objv_fntn, prms_buds, objv_args,
+    **dfev_kwds) without polishing, but the state of the optimizer can be
+    saved every ckps_gens generations to the file ckps_path. The state is
+    the population, its objective function values, the random number
+    generator, the number of generations and that of the evaluations, in a
+    single numpy .npz file. Some of these are private attributes of scipy's
+    DifferentialEvolutionSolver.
+
+    With resume and an existing ckps_path, the optimization continues from
+    the saved state. Finished generations are not computed again. Same
+    arguments give the same result as a run that was never stopped.
+
+    With thds_args, its attribute objv_thds is set to the objective function
+    values of the population before each generation, and to None for the
+    initial population. With updating='deferred', the candidate i of a
+    generation replaces the member i when its value is not higher. Hence,
+    the objective function may stop evaluating a candidate once it is sure
+    that its value is above objv_thds[i] (see get_objv_fntn_vlue_bh).
+
+    cvg_mntr is a CVGMNTR that is updated after each generation. It can
+    stop the optimization and change the size of the population. Its
+    records are returned as the cvgs DataFrame of the result. The number
+    of model runs is n_runs of the result (nfev is that of the calls to
+    objv_fntn, i.e., generations in the vectorized mode).
+
+    With runs_args, the model runs are those that the objective function
+    counts in its attribute n_runs (see get_objv_fntn_vlue and
+    _get_srgt_objv_vles), i.e., without candidates that got predicted or
+    archived values. Without it, each candidate is a model run, e.g., for
+    the workers of the parallel mode that count in their own processes.
+
+    Without ckps_path, thds_args and the stall and shrinking criteria of
+    cvg_mntr, differential_evolution itself is called. cvg_mntr has no
+    record of the initial population then. Otherwise, the optimizer is
+    stepped here with private attributes of scipy (see SCIPY_VRSNS).
+    '''
+
+    assert not dfev_kwds.get('polish', False), 'No polishing here!'
+
+    assert 'callback' not in dfev_kwds, 'The callback is set here!'
+
+    if ckps_path is not None:
+        ckps_path = Path(ckps_path)
+
+        assert isinstance(ckps_gens, int), type(ckps_gens)
+        assert ckps_gens > 0, ckps_gens
+
+    if thds_args is not None:
+        assert dfev_kwds.get('updating') == 'deferred', (
+            'Thresholds need updating=\'deferred\'!')
+
+        thds_args.objv_thds = None
+
+    dfev_kwds = {**dfev_kwds, 'polish': False}
+
+    if cvg_mntr is None:
+        # Records only.
+        cvg_mntr = CVGMNTR()
+
+    # Newer versions of scipy call the seed rng.
+    if ('seed' in dfev_kwds) and ('rng' in signature(
+            DifferentialEvolutionSolver.__init__).parameters):
+
+        dfev_kwds['rng'] = dfev_kwds.pop('seed')
+
+        # As in differential_evolution. DifferentialEvolutionSolver would
+        # take an integer as the seed of a RandomState.
+        if isinstance(dfev_kwds['rng'], (int, np.integer)):
+            dfev_kwds['rng'] = np.random.default_rng(dfev_kwds['rng'])
+
+    if ((ckps_path is None) and
+            (thds_args is None) and
+            (cvg_mntr.stal_gens is None) and
+            (cvg_mntr.mbrs_min is None)):
+
+        return _get_optn_ress_pblc(
+            objv_fntn, prms_buds, objv_args, dfev_kwds, cvg_mntr, runs_args)
+
+    if '.'.join(scipy.__version__.split('.')[:2]) not in SCIPY_VRSNS:
+        warnings.warn(
+            f'Private attributes of scipy {scipy.__version__} are used, '
+            f'but only those of the versions {SCIPY_VRSNS} were checked!',
+            stacklevel=2)
+
+    with DifferentialEvolutionSolver(
+            objv_fntn,
+            prms_buds,
+            args=objv_args,
+            **dfev_kwds) as dfev_slvr:
+
+        beg_gen = 0
+
+        cvg_mntr.reset()
+
+        # Model runs that the objective function counted before the
+        # current generation.
+        n_runs_cntr = 0 if runs_args is None else runs_args.n_runs
+
+        if resume and (ckps_path is not None) and ckps_path.exists():
+            beg_gen = _set_dfev_ckpt(
+                dfev_slvr, ckps_path, prms_buds, cvg_mntr)
+
+            print(f'\tResuming from generation {beg_gen}...')
+
+        elif np.all(np.isinf(dfev_slvr.population_energies)):
+            # Initial population. Also done by next, but it is saved here
+            # as well.
+            dfev_slvr.population_energies[:] = (
+                dfev_slvr._calculate_population_energies(
+                    dfev_slvr.population))
+
+            dfev_slvr._promote_lowest_energy()
+
+            n_runs_cntr = _upd_cvg_mntr(
+                cvg_mntr, dfev_slvr, beg_gen, runs_args, n_runs_cntr)
+
+        sccs_flag = False
+        mesg = 'Maximum number of iterations has been exceeded.'
+
+        nit = beg_gen
+        for nit in range(beg_gen + 1, dfev_slvr.maxiter + 1):
+
+            if thds_args is not None:
+                thds_args.objv_thds = dfev_slvr.population_energies.copy()
+
+            try:
+                next(dfev_slvr)
+
+            except StopIteration:
+                mesg = 'Maximum number of function evaluations reached.'
+                break
+
+            n_runs_cntr = _upd_cvg_mntr(
+                cvg_mntr, dfev_slvr, nit, runs_args, n_runs_cntr)
+
+            _set_dfev_pop_size(dfev_slvr, cvg_mntr.get_pop_size())
+
+            if (ckps_path is not None) and (not (nit % ckps_gens)):
+                _get_dfev_ckpt(
+                    dfev_slvr, ckps_path, prms_buds, nit, cvg_mntr)
+
+            if dfev_slvr.converged():
+                sccs_flag = True
+                mesg = 'Optimization terminated successfully.'
+                break
+
+            if cvg_mntr.is_stalled():
+                sccs_flag = True
+                mesg = (
+                    f'Improvement stayed below {cvg_mntr.stal_tol} for '
+                    f'{cvg_mntr.stal_gens} generations.')
+                break
+
+        if ckps_path is not None:
+            _get_dfev_ckpt(dfev_slvr, ckps_path, prms_buds, nit, cvg_mntr)
+
+        if thds_args is not None:
+            thds_args.objv_thds = None
+
+        optn_ress = OptimizeResult(
+            x=dfev_slvr.x,
+            fun=dfev_slvr.population_energies[0],
+            nit=nit,
+            nfev=dfev_slvr._nfev,
+            success=sccs_flag,
+            message=mesg,
+            population=dfev_slvr._scale_parameters(dfev_slvr.population),
+            population_energies=dfev_slvr.population_energies.copy(),
+            n_runs=cvg_mntr.get_number_of_runs(),
+            cvgs=cvg_mntr.get_records())
+
+    return optn_ress
+
+
+def _get_optn_ress_pblc(
+        objv_fntn, prms_buds, objv_args, dfev_kwds, cvg_mntr, runs_args):
+
+    '''
+    get_optn_ress with scipy's differential_evolution. cvg_mntr is updated
+    by its callback, after each generation.
+    '''
+
+    prms_buds = np.asarray(prms_buds, dtype=np.float64)
+
+    # Calls of objv_fntn and model runs counted in runs_args before the
+    # current generation.
+    nfev_cntr = 0
+    n_runs_cntr = 0 if runs_args is None else runs_args.n_runs
+
+    def cllb(intermediate_result):
+
+        nonlocal nfev_cntr, n_runs_cntr
+
+        enes = intermediate_result.population_energies
+
+        # In the normalized space, as that of DifferentialEvolutionSolver.
+        popn = (intermediate_result.population - prms_buds[:, 0]) / (
+            prms_buds[:, 1] - prms_buds[:, 0])
+
+        if runs_args is None:
+            n_runs_gen = intermediate_result.nfev - nfev_cntr
+
+            if dfev_kwds.get('vectorized', False):
+                # One call per generation.
+                n_runs_gen *= enes.size
+
+        else:
+            n_runs_gen = runs_args.n_runs - n_runs_cntr
+
+            n_runs_cntr = runs_args.n_runs
+
+        nfev_cntr = intermediate_result.nfev
+
+        cvg_mntr.update(popn, enes, intermediate_result.nit, n_runs_gen)
+        return
+
+    cvg_mntr.reset()
+
+    optn_ress = differential_evolution(
+        objv_fntn, prms_buds, args=objv_args, callback=cllb, **dfev_kwds)
+
+    optn_ress.n_runs = cvg_mntr.get_number_of_runs()
+    optn_ress.cvgs = cvg_mntr.get_records()
+
+    return optn_ress
+
+
+def _upd_cvg_mntr(cvg_mntr, dfev_slvr, nit, runs_args, n_runs_cntr):
+
+    '''
+    Update cvg_mntr after the generation nit, with the model runs counted
+    in runs_args since n_runs_cntr (see get_optn_ress). Returns the count
+    of runs_args now.
+    '''
+
+    popn = dfev_slvr.population
+    enes = dfev_slvr.population_energies
+
+    if runs_args is None:
+        cvg_mntr.update(popn, enes, nit)
+
+        return n_runs_cntr
+
+    cvg_mntr.update(popn, enes, nit, runs_args.n_runs - n_runs_cntr)
+
+    return runs_args.n_runs
+
+
+def _get_dfev_ckpt(dfev_slvr, ckps_path, prms_buds, nit, cvg_mntr):
+
+    '''
+    Save the state of the optimizer and of cvg_mntr after nit generations
+    (see get_optn_ress). The file is replaced only after it is written
+    completely.
+    '''
+
+    rngn = dfev_slvr.random_number_generator
+
+    if isinstance(rngn, np.random.RandomState):
+        rngn_stte = rngn.get_state()
+
+    else:
+        rngn_stte = rngn.bit_generator.state
+
+    rngn_stte = pickle.dumps(rngn_stte)
+
+    tmp_path = ckps_path.with_name(ckps_path.name + '.tmp')
+
+    with open(tmp_path, 'wb') as tmp_hdl:
+        np.savez(
+            tmp_hdl,
+            nit=nit,
+            nfev=dfev_slvr._nfev,
+            prms_buds=prms_buds,
+            population=dfev_slvr.population,
+            population_energies=dfev_slvr.population_energies,
+            rngn_stte=np.frombuffer(rngn_stte, dtype=np.uint8),
+            rndm_idxs=dfev_slvr._random_population_index,
+            cvgs=cvg_mntr.get_records().reset_index().values)
+
+    os.replace(tmp_path, ckps_path)
+    return
+
+
+def _set_dfev_ckpt(dfev_slvr, ckps_path, prms_buds, cvg_mntr):
+
+    '''
+    Set the state of the optimizer and of cvg_mntr to that in ckps_path (see
+    _get_dfev_ckpt). Returns the number of finished generations.
+    '''
+
+    with np.load(ckps_path) as ckpt:
+
+        assert np.array_equal(ckpt['prms_buds'], prms_buds), (
+            'Bounds are not those of the saved state!')
+
+        # The population may have shrunk before it was saved.
+        if ckpt['population'].shape[0] < dfev_slvr.population.shape[0]:
+            _set_dfev_pop_size(dfev_slvr, ckpt['population'].shape[0])
+
+        assert (
+            ckpt['population'].shape == dfev_slvr.population.shape), (
+                'Population size is not that of the saved state!',
+                ckpt['population'].shape,
+                dfev_slvr.population.shape)
+
+        cvg_mntr.set_records(ckpt['cvgs'])
+
+        dfev_slvr.population[:] = ckpt['population']
+        dfev_slvr.population_energies[:] = ckpt['population_energies']
+
+        dfev_slvr._nfev = int(ckpt['nfev'])
+
+        # Shuffled in place for every mutation. Part of the random state.
+        dfev_slvr._random_population_index[:] = ckpt['rndm_idxs']
+
+        rngn_stte = pickle.loads(ckpt['rngn_stte'].tobytes())
+
+        nit = int(ckpt['nit'])
+
+    rngn = dfev_slvr.random_number_generator
+
+    if isinstance(rngn, np.random.RandomState):
+        rngn.set_state(rngn_stte)
+
+    else:
+        rngn.bit_generator.state = rngn_stte
+
+    return nit
+
+
+def _set_dfev_pop_size(dfev_slvr, n_mbrs):
+
+    '''
+    Shrink the population of the optimizer to its best n_mbrs members. The
+    best one stays the first. Nothing happens when n_mbrs is not less than
+    the current size.
+    '''
+
+    if n_mbrs >= dfev_slvr.num_population_members:
+        return
+
+    mbrs_idxs = np.argsort(dfev_slvr.population_energies, kind='stable')[
+        :n_mbrs]
+
+    dfev_slvr.population = dfev_slvr.population[mbrs_idxs]
+    dfev_slvr.population_energies = (
+        dfev_slvr.population_energies[mbrs_idxs])
+
+    dfev_slvr.feasible = dfev_slvr.feasible[mbrs_idxs]
+    dfev_slvr.constraint_violation = (
+        dfev_slvr.constraint_violation[mbrs_idxs])
+
+    dfev_slvr.num_population_members = n_mbrs
+    dfev_slvr.population_shape = (n_mbrs, dfev_slvr.parameter_count)
+
+    dfev_slvr._random_population_index = np.arange(n_mbrs)
     return
 
 
 def get_objv_fntn_vlue(prms, args):
 
-    modl_objt = args.modl_objt
+    '''
+    Objective function value of a candidate. prms are in the search space
+    of the optimizer (args.srch_spce).
 
-    modl_objt.set_parameters(prms)
-    modl_objt.run_model()
+    With args.evls_arch, the value of the same parameters is taken from it,
+    if it is there. Otherwise, the evaluation is added to it.
+    '''
+
+    prms = args.srch_spce.get_prms(prms)
+
+    evls_arch = args.evls_arch
+
+    if evls_arch is not None:
+        arch_vles = _get_evls_arch_vles(evls_arch, prms[None, :])
+
+        if np.isfinite(arch_vles[0]):
+            return arch_vles[0]
+
+    args.n_runs += 1
+
+    diss = args.modl_prep.run(prms)[args.take_idxs]
+
+    if evls_arch is None:
+        obj_val = get_obj_val_effs(diss[:, None], args)
 
-    diss = modl_objt.get_discharge()[args.take_idxs]
+    else:
+        obj_vals, effs_vles = get_obj_vals_effs(
+            diss[:, None], args.effs_cls, True)
+
+        obj_val = obj_vals[0]
 
-    obj_val = get_obj_val_effs(diss[:, None], args)
+        _add_evls_arch_rows(
+            evls_arch, prms[None, :], obj_vals, np.ones(1), effs_vles)
 
     return obj_val
 
 
+def get_objv_fntn_vlue_bh(prms, args):
+
+    '''
+    Same as get_objv_fntn_vlue but for many candidates at once.
+    prms has the shape [parameter, candidate] (the vectorized mode of
+    differential_evolution). Returns the objective value of each candidate.
+
+    With args.abrt_flag and args.objv_thds (one value per candidate), the
+    run of a candidate stops once its sum of squared errors is surely
+    above the one that gives an objective value of objv_thds (see
+    HBV1D012A.run_batch_bounded). Such a candidate gets the value of its
+    errors till there, i.e., a value above objv_thds, but not its true one.
+
+    With args.srgt and args.objv_thds, only some candidates are evaluated
+    (see _get_srgt_objv_vles). The rest get values above objv_thds.
+    '''
+
+    return _get_srgt_objv_vles(prms, args, _get_objv_vles_bh)
+
+
+def get_objv_fntn_vlue_bh_mp(prms, args):
+
+    '''
+    Same as get_objv_fntn_vlue_bh but the candidates are split among the
+    workers in args.pool. Values do not depend on the number of workers.
+    '''
+
+    return _get_srgt_objv_vles(prms, args, _get_objv_vles_bh_mp)
+
+
+def _get_srgt_objv_vles(prms, args, objv_vles_fntn):
+
+    '''
+    Objective function values of the candidates prms [parameter, candidate]
+    of a generation, given by objv_vles_fntn (_get_objv_vles_bh or
+    _get_objv_vles_bh_mp).
+
+    Without args.srgt or args.objv_thds, all candidates are evaluated.
+    Otherwise, the surrogate chooses the ones that are evaluated (see
+    SRGTMODL.get_evaluation_flags). The others get their predicted values,
+    but at least a value just above that of the member that they are
+    compared with. Hence, they cannot replace it. The evaluated candidates
+    are added to the surrogate.
+
+    With args.evls_arch, candidates with a true value in it get that value
+    and are not evaluated. The evaluations are added to it.
+    '''
+
+    objv_thds = args.objv_thds
+    srgt = args.srgt
+    evls_arch = args.evls_arch
+
+    n_cdts = prms.shape[1]
+
+    if (srgt is None) or (objv_thds is None):
+        evln_flgs = np.ones(n_cdts, dtype=bool)
+        prds = None
+
+    else:
+        evln_flgs, prds = srgt.get_evaluation_flags(prms.T, objv_thds)
+
+    if evls_arch is not None:
+        prms_modl = args.srch_spce.get_prms(prms).T
+
+        arch_vles = _get_evls_arch_vles(evls_arch, prms_modl)
+
+        arch_flgs = np.isfinite(arch_vles)
+
+        evln_flgs &= ~arch_flgs
+
+    args.n_runs += int(evln_flgs.sum())
+
+    obj_vals, true_flgs, effs_vles = objv_vles_fntn(
+        prms, args, objv_thds, evln_flgs)
+
+    if evls_arch is not None:
+        _add_evls_arch_rows(
+            evls_arch,
+            prms_modl[evln_flgs],
+            obj_vals[evln_flgs],
+            true_flgs[evln_flgs],
+            effs_vles[evln_flgs])
+
+        obj_vals[arch_flgs] = arch_vles[arch_flgs]
+
+        # Neither evaluated nor predicted.
+        evln_flgs |= arch_flgs
+
+    if srgt is not None:
+        srgt.update(
+            prms.T[evln_flgs],
+            obj_vals[evln_flgs],
+            true_flgs[evln_flgs],
+            None if prds is None else prds[evln_flgs],
+            n_cdts)
+
+    if not evln_flgs.all():
+        obj_vals[~evln_flgs] = np.maximum(
+            prds[~evln_flgs], np.nextafter(objv_thds[~evln_flgs], np.inf))
+
+    return obj_vals
+
+
+def _get_evls_arch_vles(evls_arch, prms):
+
+    '''
+    True objective function values of the parameters prms [candidate,
+    parameter] (of the model) in evls_arch. NaN for those that are not in
+    it or whose runs were stopped.
+    '''
+
+    rows_idxs = evls_arch.get_rows_idxs(prms)
+
+    arch_vles = np.full(prms.shape[0], np.nan)
+
+    arch_idxs = np.flatnonzero(rows_idxs >= 0)
+
+    if arch_idxs.size:
+        n_prms = prms.shape[1]
+
+        rows = evls_arch.get_rows(rows_idxs[arch_idxs])
+
+        true_flgs = rows[:, n_prms + 1] == 1
+
+        arch_vles[arch_idxs[true_flgs]] = rows[true_flgs, n_prms]
+
+    return arch_vles
+
+
+def _add_evls_arch_rows(evls_arch, prms, obj_vals, true_flgs, effs_vles):
+
+    '''
+    Add the evaluations of the candidates prms [candidate, parameter] (of
+    the model) to evls_arch. effs_vles are the efficiencies [candidate,
+    efficiency].
+    '''
+
+    evls_arch.add_rows(np.concatenate((
+        prms,
+        obj_vals[:, None],
+        true_flgs[:, None],
+        effs_vles), axis=1))
+
+    return
+
+
+def _get_objv_vles_bh(prms, args, objv_thds, evln_flgs):
+
+    '''
+    Objective function values of the candidates prms [parameter, candidate]
+    in the search space, for those with evln_flgs only. The rest get NaN.
+    All candidates are run with the model together (HBV1D012A.run_batch).
+
+    With args.abrt_flag and objv_thds, runs are stopped (see
+    get_objv_fntn_vlue_bh).
+
+    Returns the values and flags of the candidates with their true values
+    (evaluated and not stopped), and the efficiencies [candidate,
+    efficiency] of those (NaN for the rest, see get_obj_vals_effs).
+    '''
+
+    prms = args.srch_spce.get_prms(prms)
+
+    modl_objt = args.modl_objt
+
+    n_cdts = prms.shape[1]
+
+    if n_cdts not in args.effs_clss_bh:
+        effs_cls = args.effs_cls
+
+        # The population only shrinks (see CVGMNTR). Objects of other sizes
+        # are not needed anymore and each holds the reference as many times
+        # as it has candidates.
+        args.effs_clss_bh.clear()
+
+        args.effs_clss_bh[n_cdts] = HMG3DModelEffs(
+            np.repeat(effs_cls.ref[args.take_idxs], n_cdts, axis=1),
+            effs_cls.ns_flag,
+            effs_cls.lns_flag,
+            effs_cls.kg_flag,
+            effs_cls.pc_flag,
+            effs_cls.sc_flag,
+            effs_cls.sp_flag,
+            effs_cls.ns_dc_flag)
+
+    obj_vals = np.full(n_cdts, np.nan)
+    true_flgs = evln_flgs.copy()
+
+    effs_vles = np.full(
+        (n_cdts,
+         sum([getattr(args.effs_cls, f'{eff_lbl}_flag')
+              for eff_lbl in EFFS_LBLS])),
+        np.nan)
+
+    if not evln_flgs.any():
+        return obj_vals, true_flgs, effs_vles
+
+    evln_idxs = np.flatnonzero(evln_flgs)
+
+    # Candidates that are not evaluated have a zero discharge, for an
+    # efficiencies object of the same size for all generations.
+    diss = np.zeros(
+        (args.effs_clss_bh[n_cdts].ref.shape[0], n_cdts), dtype=np.float32)
+
+    if args.abrt_flag and (objv_thds is not None):
+        assert objv_thds.shape == (n_cdts,), (objv_thds.shape, n_cdts)
+
+        # The objective function is 1 - NSE, i.e., SSE / ns_demr. The SSE of
+        # the model is summed differently. Only those that are clearly
+        # above are stopped.
+        ns_demr = float(args.effs_cls.ns_demr[0])
+
+        sses_max = objv_thds[evln_idxs] * ns_demr * (1 + ABRT_RTOL)
+
+        diss_evln, sses = modl_objt.run_batch_bounded(
+            prms[:, evln_idxs].T, args.diso, sses_max)
+
+        diss[:, evln_idxs] = diss_evln.T[args.take_idxs]
+
+        obj_vals[:], effs_vles[:] = get_obj_vals_effs(
+            diss, args.effs_clss_bh[n_cdts], True)
+
+        abrt_flgs = sses > sses_max
+
+        obj_vals[evln_idxs[abrt_flgs]] = sses[abrt_flgs] / ns_demr
+
+        true_flgs[evln_idxs[abrt_flgs]] = False
+
+    else:
+        diss[:, evln_idxs] = modl_objt.run_batch(
+            prms[:, evln_idxs].T).T[args.take_idxs]
+
+        obj_vals[:], effs_vles[:] = get_obj_vals_effs(
+            diss, args.effs_clss_bh[n_cdts], True)
+
+    obj_vals[~evln_flgs] = np.nan
+    effs_vles[~true_flgs] = np.nan
+
+    return obj_vals, true_flgs, effs_vles
+
+
+def _get_objv_vles_bh_mp(prms, args, objv_thds, evln_flgs):
+
+    '''
+    Same as _get_objv_vles_bh but the candidates are split among the
+    workers in args.pool.
+    '''
+
+    cdts_idxs_chks = [
+        cdts_idxs_chk
+        for cdts_idxs_chk in np.array_split(
+            np.arange(prms.shape[1]), args.n_cpus)
+        if cdts_idxs_chk.size]
+
+    prms_thds_flgs_chks = []
+    for cdts_idxs_chk in cdts_idxs_chks:
+
+        if objv_thds is None:
+            thds_chk = None
+
+        else:
+            thds_chk = objv_thds[cdts_idxs_chk]
+
+        prms_thds_flgs_chks.append((
+            prms[:, cdts_idxs_chk], thds_chk, evln_flgs[cdts_idxs_chk]))
+
+    obj_vals_chks, true_flgs_chks, effs_vles_chks = zip(
+        *args.pool.map(_get_objv_vles_bh_wkr, prms_thds_flgs_chks))
+
+    return (
+        np.concatenate(obj_vals_chks),
+        np.concatenate(true_flgs_chks),
+        np.concatenate(effs_vles_chks))
+
+
 def get_obj_val_effs(dis_sims, args):
 
-    args.effs_cls.set_sim(dis_sims, None)
+    obj_val = get_obj_vals_effs(dis_sims, args.effs_cls)[0]
+
+    return obj_val
 
-    effs_dict = args.effs_cls.get_all_dict()
 
-    obj_val = 0.0
-    for i in range(1):
+def get_obj_vals_effs(dis_sims, effs_cls, rtrn_effs_flag=False):
 
-        if args.effs_cls.ns_flag:
+    '''
+    Objective function value of each column of dis_sims. With
+    rtrn_effs_flag, the efficiencies [column, efficiency] of the set flags
+    of effs_cls (in the order of EFFS_LBLS) are returned too.
+    '''
+
+    effs_cls.set_sim(dis_sims, None)
+
+    effs_dict = effs_cls.get_all_dict()
+
+    obj_vals = np.zeros(dis_sims.shape[1])
+    for i in range(dis_sims.shape[1]):
+
+        obj_val = 0.0
+
+        if effs_cls.ns_flag:
 
             nse = effs_dict['ns'][i]
 
             obj_val += (1 - nse)
         #======================================================================
 
-        if args.effs_cls.lns_flag:
+        if effs_cls.lns_flag:
             lnse = effs_dict['lns'][i]
 
             # if args.oflg and (not np.isfinite(lnse)):
@@ -314,30 +1559,540 @@ def get_obj_val_effs(dis_sims, args):
             obj_val += (1 - lnse)
         #======================================================================
 
-        if args.effs_cls.kg_flag:
+        if effs_cls.kg_flag:
 
             kge = effs_dict['kg'][i]
 
             obj_val += (1 - kge)
         #======================================================================
 
-        if args.effs_cls.pc_flag:
+        if effs_cls.pc_flag:
 
             pce = effs_dict['pc'][i]
 
             obj_val += (1 - pce)
         #======================================================================
 
-        if args.effs_cls.sc_flag:
+        if effs_cls.sc_flag:
 
             sce = effs_dict['sc'][i]
 
             obj_val += (1 - sce)
         #======================================================================
 
-    assert np.isfinite(obj_val), obj_val
+        assert np.isfinite(obj_val), obj_val
 
-    return obj_val
+        obj_vals[i] = obj_val
+
+    if rtrn_effs_flag:
+        effs_vles = np.array(
+            [effs_dict[eff_lbl]
+             for eff_lbl in EFFS_LBLS if eff_lbl in effs_dict],
+            dtype=np.float64).reshape(-1, dis_sims.shape[1]).T
+
+        return obj_vals, effs_vles
+
+    return obj_vals
+
+
+class SRCHSPCE:
+
+    '''
+    The search space of the optimizer, compiled from the parameter bounds
+    (HBV1D012A.get_parameter_bounds_in_correct_order).
+
+    Parameters with equal lower and upper bounds are fixed and not searched.
+    The others are normalized to the range 0 to 1. Those with their indices
+    in log_idxs are normalized on a log scale (of 1 + the value) instead of
+    a linear one e.g., for a parameter between 0 and 1e4, values from 0 to
+    1 get as much of the search space as those from 1e2 to 1e4.
+
+    Fewer parameters to search means a smaller population and fewer
+    evaluations per generation.
+    '''
+
+    def __init__(self, prms_buds, log_idxs=()):
+
+        assert isinstance(prms_buds, np.ndarray), type(prms_buds)
+        assert prms_buds.ndim == 2, prms_buds.ndim
+        assert prms_buds.shape[1] == 2, prms_buds.shape
+
+        log_flgs = np.zeros(prms_buds.shape[0], dtype=bool)
+        log_flgs[list(log_idxs)] = True
+
+        assert (prms_buds[log_flgs, 0] > -1).all(), (
+            'Log scale only for parameters above -1!')
+
+        self._prms_buds = prms_buds.astype(np.float64)
+
+        # Fixed parameters get their value from here.
+        self._prms_dflt = self._prms_buds[:, 0].copy()
+
+        self._srch_idxs = np.flatnonzero(
+            self._prms_buds[:, 0] < self._prms_buds[:, 1])
+
+        assert self._srch_idxs.size, 'All parameters are fixed!'
+
+        self._log_flgs = log_flgs[self._srch_idxs]
+
+        # Bounds of the searched parameters, in their own scale.
+        self._srch_buds = self._prms_buds[self._srch_idxs].copy()
+        self._srch_buds[self._log_flgs] = np.log1p(
+            self._srch_buds[self._log_flgs])
+        return
+
+    def get_bounds(self):
+
+        '''
+        Bounds of the search space for the optimizer [searched parameter, 2].
+        '''
+
+        return np.repeat(
+            np.array([[0.0, 1.0]]), self._srch_idxs.size, axis=0)
+
+    def get_search_indices(self):
+
+        '''
+        Parameter indices of the searched parameters.
+        '''
+
+        return self._srch_idxs
+
+    def get_prms(self, srch_prms):
+
+        '''
+        Model parameters from those of the search space. Either a 1D array
+        [searched parameter] or a 2D one [searched parameter, candidate]
+        (the vectorized mode of differential_evolution).
+        '''
+
+        srch_prms = np.asarray(srch_prms, dtype=np.float64)
+
+        if srch_prms.ndim == 1:
+            return self.get_prms(srch_prms[:, None])[:, 0]
+
+        assert srch_prms.shape[0] == self._srch_idxs.size, (
+            srch_prms.shape[0], self._srch_idxs.size)
+
+        vles = self._srch_buds[:, [0]] + (
+            srch_prms *
+            (self._srch_buds[:, [1]] - self._srch_buds[:, [0]]))
+
+        vles[self._log_flgs] = np.expm1(vles[self._log_flgs])
+
+        prms = np.repeat(self._prms_dflt[:, None], srch_prms.shape[1], axis=1)
+
+        prms[self._srch_idxs] = np.clip(
+            vles,
+            self._prms_buds[self._srch_idxs, [0]][:, None],
+            self._prms_buds[self._srch_idxs, [1]][:, None])
+
+        return prms
+
+    def get_srch_prms(self, prms):
+
+        '''
+        Inverse of get_prms. Values of the fixed parameters are ignored.
+        '''
+
+        prms = np.asarray(prms, dtype=np.float64)
+
+        if prms.ndim == 1:
+            return self.get_srch_prms(prms[:, None])[:, 0]
+
+        vles = prms[self._srch_idxs].copy()
+
+        vles[self._log_flgs] = np.log1p(vles[self._log_flgs])
+
+        srch_prms = (vles - self._srch_buds[:, [0]]) / (
+            self._srch_buds[:, [1]] - self._srch_buds[:, [0]])
+
+        return np.clip(srch_prms, 0.0, 1.0)
+
+
+class CVGMNTR:
+
+    '''
+    Convergence monitor of the optimizer (see get_optn_ress). After each
+    generation, it records:
+        nit: The generation (zero for the initial population).
+        n_runs: Number of model runs so far. Stopped runs are counted, but
+                not the candidates with predicted or archived values.
+        n_mbrs: Size of the population.
+        best: Best objective function value.
+        mean: Mean objective function value of the population.
+        sprd: Standard deviation of the objective function values of the
+              population (as in the tol criterion of scipy).
+        diam: Diameter of the population, i.e., the largest distance between
+              two members, in the normalized space of the optimizer (0 to 1
+              for each parameter).
+
+    With stal_gens, is_stalled is True once best went down by less than
+    stal_tol in the last stal_gens generations.
+
+    With mbrs_min, get_pop_size gives a smaller size as sprd goes down from
+    sprd_rtol * 10 ** sprd_decs to sprd_rtol times the mean objective
+    function value (tol of scipy). In log scale, the size goes from that of
+    the initial population to mbrs_min. The size never grows again. A
+    large population is needed for exploring at the start only.
+    '''
+
+    _lbls = ('nit', 'n_runs', 'n_mbrs', 'best', 'mean', 'sprd', 'diam')
+
+    def __init__(
+            self,
+            stal_gens=None,
+            stal_tol=0.0,
+            mbrs_min=None,
+            sprd_rtol=0.01,
+            sprd_decs=2):
+
+        if stal_gens is not None:
+            assert isinstance(stal_gens, int), type(stal_gens)
+            assert stal_gens > 0, stal_gens
+
+            assert stal_tol >= 0, stal_tol
+
+        if mbrs_min is not None:
+            assert isinstance(mbrs_min, int), type(mbrs_min)
+
+            # Mutations of scipy need up to five members.
+            assert mbrs_min >= 5, mbrs_min
+
+        assert sprd_rtol > 0, sprd_rtol
+        assert sprd_decs > 0, sprd_decs
+
+        self.stal_gens = stal_gens
+        self.stal_tol = stal_tol
+        self.mbrs_min = mbrs_min
+        self.sprd_rtol = sprd_rtol
+        self.sprd_decs = sprd_decs
+
+        self._cvgs = []
+        return
+
+    def reset(self):
+
+        '''
+        Remove all records.
+        '''
+
+        self._cvgs = []
+        return
+
+    def update(self, popn, enes, nit, n_runs_gen=None):
+
+        '''
+        Record the population popn (normalized, a member per row) of the
+        optimizer and its objective function values enes after nit
+        generations. Call it once after each generation. n_runs_gen is the
+        number of model runs of the generation. None when every candidate
+        was run.
+        '''
+
+        # The largest distance between any two members.
+        diam = np.sqrt(
+            ((popn[:, None, :] - popn[None, :, :]) ** 2).sum(axis=2).max())
+
+        n_mbrs = popn.shape[0]
+
+        # As many candidates as members.
+        if n_runs_gen is None:
+            n_runs_gen = n_mbrs
+
+        n_runs = self.get_number_of_runs() + n_runs_gen
+
+        self._cvgs.append(
+            (nit, n_runs, n_mbrs, enes.min(), enes.mean(), enes.std(), diam))
+        return
+
+    def is_stalled(self):
+
+        '''
+        Whether the best objective function value stalled (see above).
+        '''
+
+        if self.stal_gens is None:
+            return False
+
+        if len(self._cvgs) <= self.stal_gens:
+            return False
+
+        best_imvt = self._cvgs[-1 - self.stal_gens][3] - self._cvgs[-1][3]
+
+        return best_imvt < self.stal_tol
+
+    def get_pop_size(self):
+
+        '''
+        Population size for the next generation (see above).
+        '''
+
+        n_mbrs = self._cvgs[-1][2]
+
+        if self.mbrs_min is None:
+            return n_mbrs
+
+        # Those of the initial population.
+        n_mbrs_beg = self._cvgs[0][2]
+
+        if n_mbrs_beg <= self.mbrs_min:
+            return n_mbrs
+
+        _, _, _, _, enes_mean, sprd, _ = self._cvgs[-1]
+
+        if not (np.isfinite(sprd) and np.isfinite(enes_mean)):
+            return n_mbrs
+
+        sprd_min = self.sprd_rtol * abs(enes_mean)
+
+        if sprd_min <= 0:
+            return n_mbrs
+
+        if sprd <= sprd_min:
+            rltv_sprd = 0.0
+
+        else:
+            rltv_sprd = min(1.0, np.log10(sprd / sprd_min) / self.sprd_decs)
+
+        n_mbrs_new = int(np.ceil(
+            self.mbrs_min + ((n_mbrs_beg - self.mbrs_min) * rltv_sprd)))
+
+        return min(n_mbrs, n_mbrs_new)
+
+    def get_number_of_runs(self):
+
+        '''
+        Number of model runs so far.
+        '''
+
+        if not self._cvgs:
+            return 0
+
+        return self._cvgs[-1][1]
+
+    def get_records(self):
+
+        '''
+        All records as a DataFrame, one row per generation.
+        '''
+
+        cvgs_dfe = pd.DataFrame(
+            data=np.array(self._cvgs, dtype=np.float64).reshape(
+                -1, len(self._lbls)),
+            columns=self._lbls)
+
+        cvgs_dfe = cvgs_dfe.astype(
+            {'nit': np.int64, 'n_runs': np.int64, 'n_mbrs': np.int64})
+
+        cvgs_dfe.set_index('nit', inplace=True)
+
+        return cvgs_dfe
+
+    def set_records(self, cvgs):
+
+        '''
+        Set the records to cvgs, the values of a DataFrame of get_records
+        with its index as the first column. For resuming.
+        '''
+
+        self._cvgs = [
+            (int(cvg[0]), int(cvg[1]), int(cvg[2]), *cvg[3:])
+            for cvg in np.asarray(cvgs).reshape(-1, len(self._lbls))]
+        return
+
+
+class SRGTMODL:
+
+    '''
+    Surrogate of the objective function, for pre-screening the candidates
+    of the optimizer (see _get_srgt_objv_vles). A radial basis function
+    interpolant (scipy's RBFInterpolator, thin plate spline) over the
+    normalized search space. It is fitted to the log of the last n_pts_max
+    evaluated objective function values. Each prediction uses the n_nbrs
+    nearest of those.
+
+    Nothing is predicted before n_pts_min values are there. After that,
+    the predictions of the evaluated candidates are compared with their
+    true values, in log scale. The RMSE of the last n_errs of these is the
+    running error of the surrogate. Candidates are screened once n_errs
+    are there. A candidate is evaluated when the log of its prediction
+    minus err_mult times the RMSE is not above the log of the value of the
+    member it is compared with. Of the
+    rest, a fraction chks_rato is evaluated as well, chosen randomly
+    (seed), so that the errors are checked where the surrogate predicts
+    bad values too. Candidates without a positive and finite prediction
+    are evaluated, and all of them when the interpolant fails.
+
+    Values of stopped runs (see get_objv_fntn_vlue_bh) are lower than the
+    true ones. They are used for fitting but not for the errors.
+    '''
+
+    _lbls = ('n_pts', 'n_cdts', 'n_evld', 'rmse')
+
+    # The objective functions here are at least zero. Values are taken as
+    # at least this, before the log.
+    _vle_min = 1e-12
+
+    def __init__(
+            self,
+            n_pts_min=100,
+            n_pts_max=1000,
+            n_nbrs=50,
+            n_errs=100,
+            err_mult=1.0,
+            chks_rato=0.1,
+            seed=None):
+
+        assert n_pts_min > 0, n_pts_min
+        assert n_pts_max >= n_pts_min, (n_pts_max, n_pts_min)
+        assert n_nbrs > 0, n_nbrs
+        assert n_errs > 0, n_errs
+        assert err_mult >= 0, err_mult
+        assert 0 <= chks_rato <= 1, chks_rato
+
+        self.n_pts_min = n_pts_min
+        self.n_pts_max = n_pts_max
+        self.n_nbrs = n_nbrs
+        self.n_errs = n_errs
+        self.err_mult = err_mult
+        self.chks_rato = chks_rato
+
+        self._rngn = np.random.default_rng(seed)
+
+        self._pts = None  # Evaluated candidates [candidate, parameter].
+        self._vls = None  # Their objective function values.
+        self._errs = np.empty(0)  # Errors of the last predictions.
+
+        self._rbfi = None  # The interpolant, None when not fitted.
+
+        self._srgs = []
+        return
+
+    def get_evaluation_flags(self, srch_prms, objv_thds):
+
+        '''
+        Flags of the candidates srch_prms [candidate, parameter] that are to
+        be evaluated, and the predicted values of all (None when nothing
+        is predicted). objv_thds are the values of the members that the
+        candidates are compared with.
+        '''
+
+        n_cdts = srch_prms.shape[0]
+
+        evln_flgs = np.ones(n_cdts, dtype=bool)
+
+        if (self._pts is None) or (self._pts.shape[0] < self.n_pts_min):
+            return evln_flgs, None
+
+        prds = self._get_predictions(srch_prms)
+
+        if (prds is None) or (self._errs.size < self.n_errs):
+            return evln_flgs, prds
+
+        prds_flgs = np.isfinite(prds) & (prds > 0)
+
+        evln_flgs[prds_flgs] = (
+            (np.log(prds[prds_flgs]) - (self.err_mult * self.get_rmse())) <=
+            np.log(np.maximum(objv_thds[prds_flgs], self._vle_min)))
+
+        chks_idxs = np.flatnonzero(~evln_flgs)
+
+        n_chks = int(np.ceil(self.chks_rato * chks_idxs.size))
+
+        if n_chks:
+            evln_flgs[
+                self._rngn.choice(chks_idxs, n_chks, replace=False)] = True
+
+        return evln_flgs, prds
+
+    def update(self, srch_prms, obj_vals, true_flgs, prds=None, n_cdts=None):
+
+        '''
+        Add the evaluated candidates srch_prms [candidate, parameter] with
+        their objective function values obj_vals. true_flgs are False for
+        values that are lower than the true ones. prds are the predictions
+        of get_evaluation_flags for them. n_cdts is the number of
+        candidates of the generation (evaluated or not), for the records.
+        '''
+
+        assert srch_prms.shape[0] == obj_vals.shape[0], (
+            srch_prms.shape, obj_vals.shape)
+
+        if prds is not None:
+            errs_flgs = true_flgs & np.isfinite(prds) & (prds > 0)
+
+            self._errs = np.concatenate((
+                self._errs,
+                np.log(prds[errs_flgs]) -
+                np.log(np.maximum(obj_vals[errs_flgs], self._vle_min))))[
+                    -self.n_errs:]
+
+        fnte_flgs = np.isfinite(obj_vals)
+
+        if self._pts is None:
+            self._pts = srch_prms[fnte_flgs].copy()
+            self._vls = obj_vals[fnte_flgs].copy()
+
+        else:
+            self._pts = np.concatenate(
+                (self._pts, srch_prms[fnte_flgs]))[-self.n_pts_max:]
+
+            self._vls = np.concatenate(
+                (self._vls, obj_vals[fnte_flgs]))[-self.n_pts_max:]
+
+        self._rbfi = None
+
+        if n_cdts is None:
+            n_cdts = obj_vals.shape[0]
+
+        self._srgs.append((
+            self._pts.shape[0], n_cdts, obj_vals.shape[0], self.get_rmse()))
+        return
+
+    def get_rmse(self):
+
+        '''
+        Root mean square error of the last predictions, in log scale, i.e.,
+        about the relative error. NaN before any.
+        '''
+
+        if not self._errs.size:
+            return np.nan
+
+        return float(np.sqrt(np.mean(self._errs ** 2)))
+
+    def get_records(self):
+
+        '''
+        For each update: number of points of the surrogate, number of
+        candidates, number of evaluated candidates and the running RMSE.
+        '''
+
+        return pd.DataFrame(data=self._srgs, columns=self._lbls)
+
+    def _get_predictions(self, srch_prms):
+
+        '''
+        Predicted values of srch_prms. None when the interpolant fails.
+        '''
+
+        try:
+            if self._rbfi is None:
+                self._rbfi = RBFInterpolator(
+                    self._pts,
+                    np.log(np.maximum(self._vls, self._vle_min)),
+                    neighbors=min(self.n_nbrs, self._pts.shape[0]),
+                    smoothing=1e-6,
+                    kernel='thin_plate_spline')
+
+            prds = np.exp(self._rbfi(srch_prms))
+
+        except np.linalg.LinAlgError:
+            # E.g., too many identical points.
+            prds = None
+
+        return prds
 
 
 class OPTNARGS: pass
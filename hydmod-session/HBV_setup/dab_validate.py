@@ -26,11 +26,12 @@ import pandas as pd
 from HBV_setup.hmg import HBV1D012A
 
 from HBV_setup.ba_effs_nans import HMG3DModelEffsNaNs as HMG3DModelEffs
+from HBV_setup.bb_rslts_cche import RSLTSCCHE
 #from HBV.daily.HBV_setup.ba_effs_nans import HMG3DModelEffsNaNs as HMG3DModelEffs
 
 DEBUG_FLAG = False
 
-def main(prms_sr, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'HBV/daily/validation_hbv_daily', cat_label = '10420'):
+def main(prms_sr, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'HBV/daily/validation_hbv_daily', cat_label = '10420', stts_cche_dir=None, sim_otps_lbls=None, sim_otps_freq=None, sim_otps_aggr='mean', rslts_cche=None):
 #def main():
 
     # The location where all the inputs lie and where all outputs will be
@@ -58,6 +59,41 @@ def main(prms_sr, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'HBV/dai
     # a period needs to be specified.
     warmup_steps = 365
 
+    # Directory where the states at the end of the warmup period are cached
+    # (see HBV1D012A.run_spin_up). When the same warmup was run before, only
+    # the time steps after it are simulated. The outputs of the warmup period
+    # are then not saved and its discharge is NaN. None to always simulate
+    # everything.
+    # stts_cche_dir = Path(r'HBV/daily/spin_up_states')
+
+    # Outputs of the final run that are saved (sim_*_otps_df.csv):
+    # sim_otps_lbls: Labels of the outputs to save (see
+    # HBV1D012A.get_output_labels) e.g., ('snw_dth', 'sl1_mse'). None for all.
+    # sim_otps_freq: A pandas period frequency e.g., 'D' or 'M' to save daily
+    # or monthly aggregates instead of each time step. None for no
+    # aggregation.
+    # sim_otps_aggr: How to aggregate, either 'mean' or 'sum'.
+
+    # Uncertainty of the efficiencies, from bootstrap resamples of the time
+    # steps after the warmup (see HMG3DModelEffsNaNs.get_bs_dict). Their
+    # quantiles bs_qntls are saved in prf_*_bs_df.csv. Blocks of
+    # bs_blk_secs seconds are resampled, for the autocorrelation of
+    # discharge. bs_n_rsps: Number of resamples (e.g., 1000), None for no
+    # bootstrapping. bs_seed: Seed of the resamples, None for a random one.
+    # Runs with a random one are not cached (see rslts_cche).
+    bs_n_rsps = None
+    bs_blk_secs = 7 * 86400
+    bs_qntls = (0.05, 0.5, 0.95)
+    bs_seed = 0
+
+    # rslts_cche: A RSLTSCCHE (see bb_rslts_cche.py) that keeps the output
+    # files of runs. When a run with the same parameters, inputs, cat_area,
+    # secs_per_step, cat_label, sim_otps_*, use of stts_cche_dir and
+    # backend of the model and the same code was done before, its files are
+    # copied to ot_dir and nothing is computed. Not used when bootstrapping
+    # with bs_seed None, as each run gives other quantiles then. None for no
+    # caching.
+
     # The directory where all the outputs will be saved.
     ot_dir = Path(output_dir)
     #==========================================================================
@@ -91,8 +127,37 @@ def main(prms_sr, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'HBV/dai
 
     modl_objt = HBV1D012A()
 
+    if (bs_n_rsps is not None) and (bs_seed is None):
+        rslts_cche = None
+
+    if rslts_cche is not None:
+        assert isinstance(rslts_cche, RSLTSCCHE), type(rslts_cche)
+
+        cche_key = rslts_cche.get_key(
+            'dab_validate',
+            prms_sr,
+            inp_dfe,
+            float(cat_area),
+            int(secs_per_step),
+            cat_label,
+            stts_cche_dir is None,
+            sim_otps_lbls,
+            sim_otps_freq,
+            sim_otps_aggr,
+            modl_objt.get_backend())
+
+        # Another process may remove the entry at any time.
+        try:
+            rslts_cche.load_entry(cche_key, ot_dir)
+
+        except FileNotFoundError:
+            pass
+
+        else:
+            print(f'Results taken from the cache ({cche_key}).')
+            return
+
     modl_objt.set_inputs(tems, ppts, pets)
-    modl_objt.set_outputs(tems.size)
 
     modl_objt.set_discharge_scaler(dslr)
     #======================================================================
@@ -105,12 +170,37 @@ def main(prms_sr, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'HBV/dai
     optn_args.modl_objt = modl_objt
     optn_args.take_idxs = np.isfinite(diso)
 
-    otps_lbls = modl_objt.get_output_labels()
-
     modl_objt.set_optimization_flag(0)
 
     modl_objt.set_parameters(prms_sr.values)
 
+    # First time step that is simulated.
+    sim_beg = 0
+
+    if stts_cche_dir is not None:
+        stts = modl_objt.run_spin_up(warmup_steps, stts_cche_dir)
+
+        sim_beg = warmup_steps
+
+        modl_objt.set_inputs(
+            tems[sim_beg:], ppts[sim_beg:], pets[sim_beg:])
+
+        modl_objt.set_state(stts)
+
+    otps_idxs = inp_dfe.index[sim_beg:]
+
+    if sim_otps_freq is None:
+        modl_objt.set_outputs(tems.size - sim_beg, sim_otps_lbls)
+
+    else:
+        aggs_idxs, otps_idxs = pd.factorize(
+            pd.to_datetime(otps_idxs).to_period(sim_otps_freq))
+
+        modl_objt.set_outputs(
+            tems.size - sim_beg, sim_otps_lbls, aggs_idxs, sim_otps_aggr)
+
+    otps_lbls = modl_objt.get_selected_output_labels()
+
     _tbeg = timeit.default_timer()
 
     # Model run with optimized parameters.
@@ -127,11 +217,16 @@ def main(prms_sr, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'HBV/dai
     otps = modl_objt.get_outputs()
     diss = modl_objt.get_discharge()
 
+    if sim_beg:
+        # Nothing was simulated in the warmup period.
+        diss = np.concatenate((
+            np.full(sim_beg, np.nan, dtype=np.float32), diss))
+
     # Save data and model parameters.
     sim_otps_df = pd.DataFrame(
         columns=otps_lbls,
         data=otps,
-        index=inp_dfe.index,
+        index=otps_idxs,
         dtype=np.float32)
 
     # Reference and simulated discharge.
@@ -164,6 +259,18 @@ def main(prms_sr, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'HBV/dai
 
     for eff_lab in effs_dict:
         prf_sr[eff_lab.upper()] = effs_dict[eff_lab][0]
+
+    if bs_n_rsps is not None:
+        bs_dict = effs_cls.get_bs_dict(
+            bs_n_rsps, max(1, bs_blk_secs // secs_per_step), bs_seed)
+
+        prf_bs_df = pd.DataFrame(
+            index=[eff_lab.upper() for eff_lab in bs_dict],
+            columns=[f'Q{bs_qntl:g}' for bs_qntl in bs_qntls],
+            data=[
+                np.quantile(bs_dict[eff_lab][:, 0], bs_qntls)
+                for eff_lab in bs_dict],
+            dtype=np.float64)
     #==========================================================================
 
     # Save all as text. These can be viewed in MS Excel.
@@ -186,6 +293,25 @@ def main(prms_sr, inp_dfe, cat_area, secs_per_step = 86400, output_dir=r'HBV/dai
         ot_dir / f'prf_{cat_label}_sr.csv',
         sep=';',
         float_format='%0.6f')
+
+    if bs_n_rsps is not None:
+        prf_bs_df.to_csv(
+            ot_dir / f'prf_{cat_label}_bs_df.csv',
+            sep=';',
+            float_format='%0.6f')
+
+    if rslts_cche is not None:
+        ot_file_nms = [
+            f'sim_{cat_label}_otps_df.csv',
+            f'dis_sim_{cat_label}_df.csv',
+            f'prms_{cat_label}_sr.csv',
+            f'prf_{cat_label}_sr.csv',
+            ]
+
+        if bs_n_rsps is not None:
+            ot_file_nms.append(f'prf_{cat_label}_bs_df.csv')
+
+        rslts_cche.save_entry(cche_key, ot_dir, ot_file_nms)
     return
 
 
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+
+'''
+@author: Faizan-TU Munich
+
+Oct 18, 2026
+
+10:12:31 AM
+
+Instructions:
+This script calibrates (daa_optimize) and then validates (dab_validate) the
+model for all combinations of the given input datasets, catchments and
+periods. Runs are independent and are distributed among processes.
+
+Outputs are written as those of the notebook, with the same names:
+<time_res>/calibration_<dataset>/prms_<cat>_sr.csv, prf_<cat>_sr.csv, ...
+<time_res>/validation_<dataset>/prms_<cat>_sr.csv, prf_<cat>_sr.csv, ...
+With more than one period, the period label is added to the directory names
+e.g., calibration_RW_cml_p1.
+
+Run from the directory that contains HBV_setup (hydmod-session) e.g.,:
+python -m HBV_setup.dac_batch_runs --n_cpus 14
+python -m HBV_setup.dac_batch_runs --datasets dwd RW_cml --cats 10460
+python -m HBV_setup.dac_batch_runs --periods p1:2011-01-01:2015-12-31::
+Use -h for all options.
+'''
+
+import os
+import sys
+import time
+import timeit
+import argparse
+import traceback as tb
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from HBV_setup import daa_optimize, dab_validate
+from HBV_setup.bb_rslts_cche import RSLTSCCHE
+
+DEBUG_FLAG = False
+
+
+def main():
+
+    # Bounds for all parameters.
+    # First one is lower, second is upper.
+    # Same as those of the notebook. Initial values are fixed.
+    prms_buds_dict = {
+        'snw_dth': (33.00, 33.00),
+        'snw_ast': (-0.62, -0.62),
+        'snw_amt': (-0.54, -0.54),
+        'snw_amf': (1.90, 1.90),
+        'snw_pmf': (0.65, 0.65),
+
+        'sl0_mse': (5.66, 5.66),
+        'sl1_mse': (197.0, 197.0),
+
+        'sl0_fcy': (0.00, 2e+2),
+        'sl0_bt0': (0.00, 3.00),
+
+        'sl1_pwp': (0.00, 4e+2),
+        'sl1_fcy': (0.00, 4e+2),
+        'sl1_bt0': (2.50, 2.50),
+
+        'urr_dth': (6.10, 6.10),
+        'lrr_dth': (1.14, 1.14),
+
+        'urr_rsr': (0.00, 1.00),
+        'urr_tdh': (0.00, 1e+2),
+        'urr_tdr': (0.00, 1.00),
+        'urr_cst': (0.00, 1.00),
+        'urr_dro': (0.00, 1.00),
+        'urr_ulc': (0.00, 1.00),
+
+        'lrr_tdh': (0.00, 1e+4),
+        'lrr_cst': (0.00, 1.00),
+        'lrr_dro': (0.00, 1.00),
+        }
+
+    # All the input datasets in <time_res>/inputs.
+    datasets = (
+        'Intermet_gauge',
+        'RW_gauge',
+        'RW_cml',
+        'RW_gauge_cml',
+        'dwd',
+        'dwd_pws',
+        'dwd_pws_cml',
+        )
+
+    # Labels of the catchments.
+    cat_labels = ('10420', '10460')
+
+    pars = argparse.ArgumentParser(
+        description=(
+            'Calibrate and validate HBV for all combinations of datasets, '
+            'catchments and periods.'))
+
+    pars.add_argument(
+        '--main_dir',
+        default='.',
+        help='Directory with <time_res>/inputs. Default: current one.')
+
+    pars.add_argument(
+        '--time_res',
+        default='hourly',
+        help='Directory of the time resolution. Default: hourly.')
+
+    pars.add_argument(
+        '--secs_per_step',
+        default=3600,
+        type=int,
+        help='Number of seconds per time step. Default: 3600.')
+
+    pars.add_argument(
+        '--datasets',
+        nargs='+',
+        default=datasets,
+        help='Input datasets. Default: all seven.')
+
+    pars.add_argument(
+        '--cats',
+        nargs='+',
+        default=cat_labels,
+        help='Catchment labels. Default: 10420 10460.')
+
+    pars.add_argument(
+        '--cats_areas_path',
+        default='inputs/Intermet_gauge/cat_areas.csv',
+        help=(
+            'Areas of the catchments [m2], relative to '
+            '<main_dir>/<time_res>. Default: '
+            'inputs/Intermet_gauge/cat_areas.csv.'))
+
+    pars.add_argument(
+        '--periods',
+        nargs='+',
+        default=['all::::'],
+        help=(
+            'Periods as LABEL:CAL_BEG:CAL_END:VAL_BEG:VAL_END. Empty dates '
+            'are the first or last time step. Default: all data for both '
+            'calibration and validation.'))
+
+    pars.add_argument(
+        '--n_cpus',
+        default=os.cpu_count(),
+        type=int,
+        help='Number of runs at the same time. Default: all cores.')
+
+    pars.add_argument(
+        '--seed',
+        default=None,
+        type=int,
+        help='Seed of the optimizer (see daa_optimize). Default: None.')
+
+    pars.add_argument(
+        '--cache_dir',
+        default=None,
+        help=(
+            'Directory of a cache of results (see bb_rslts_cche.py). Runs '
+            'that were done before are copied from there. Calibrations are '
+            'cached only with a --seed. Default: None, no cache.'))
+
+    pars.add_argument(
+        '--skip_cal',
+        action='store_true',
+        help='Only validate, with the parameters of a previous calibration.')
+
+    pars.add_argument(
+        '--list',
+        action='store_true',
+        help='Only print the runs.')
+
+    args = pars.parse_args()
+    #==========================================================================
+
+    main_dir = Path(args.main_dir) / args.time_res
+
+    cat_area_sr = pd.read_csv(
+        main_dir / args.cats_areas_path, sep=';', index_col=0).iloc[:, 0]
+
+    cat_area_sr.index = [str(cat_label) for cat_label in cat_area_sr.index]
+
+    prds = []
+    for prd in args.periods:
+        prd = prd.split(':')
+
+        assert len(prd) == 5, (
+            'A period should be LABEL:CAL_BEG:CAL_END:VAL_BEG:VAL_END!', prd)
+
+        prds.append([prd[0]] + [(dte if dte else None) for dte in prd[1:]])
+
+    assert len(set([prd[0] for prd in prds])) == len(prds), (
+        'Period labels should be unique!')
+
+    runs_args = []
+    for dataset in args.datasets:
+        for cat_label in args.cats:
+            for prd_lbl, cal_beg, cal_end, val_beg, val_end in prds:
+
+                inp_path = (
+                    main_dir /
+                    'inputs' /
+                    dataset /
+                    f'hbv_input_data_{cat_label}.csv.zip')
+
+                assert inp_path.exists(), inp_path
+
+                # Same names as those of the notebook.
+                if len(prds) == 1:
+                    dir_sfx = dataset
+
+                else:
+                    dir_sfx = f'{dataset}_{prd_lbl}'
+
+                runs_args.append((
+                    prms_buds_dict,
+                    inp_path,
+                    cat_label,
+                    float(cat_area_sr.loc[cat_label]),
+                    args.secs_per_step,
+                    (cal_beg, cal_end),
+                    (val_beg, val_end),
+                    main_dir / f'calibration_{dir_sfx}',
+                    main_dir / f'validation_{dir_sfx}',
+                    args.skip_cal,
+                    args.seed,
+                    args.cache_dir))
+
+    print(f'{len(runs_args)} runs with {args.n_cpus} processes:')
+    for run_args in runs_args:
+        print('\t', run_args[1], run_args[5], run_args[6])
+
+    print('')
+
+    if args.list:
+        return
+
+    n_cpus = max(1, min(args.n_cpus, len(runs_args)))
+
+    # A model run is single threaded. Several runs at the same time use
+    # several cores.
+    if n_cpus == 1:
+        for run_args in runs_args:
+            print(run_batch_run(run_args))
+
+    else:
+        with ProcessPoolExecutor(n_cpus) as pool:
+            futs = [
+                pool.submit(run_batch_run, run_args)
+                for run_args in runs_args]
+
+            for fut in as_completed(futs):
+                print(fut.result())
+    return
+
+
+def run_batch_run(run_args):
+
+    '''
+    Calibrate and validate a catchment for a dataset and a period. Returns
+    a short summary to print.
+    '''
+
+    (prms_buds_dict,
+     inp_path,
+     cat_label,
+     cat_area,
+     secs_per_step,
+     (cal_beg, cal_end),
+     (val_beg, val_end),
+     cal_dir,
+     val_dir,
+     skip_cal,
+     seed,
+     cche_dir) = run_args
+
+    beg_tme = timeit.default_timer()
+
+    if cche_dir is None:
+        rslts_cche = None
+
+    else:
+        rslts_cche = RSLTSCCHE(cche_dir)
+
+    inp_dfe = pd.read_csv(inp_path, sep=';', index_col=0, parse_dates=True)
+
+    if not skip_cal:
+        daa_optimize.main(
+            prms_buds_dict,
+            inp_dfe.loc[cal_beg:cal_end],
+            cat_area,
+            secs_per_step=secs_per_step,
+            output_dir=cal_dir,
+            cat_label=cat_label,
+            seed=seed,
+            rslts_cche=rslts_cche)
+
+    prms_sr = pd.read_csv(
+        cal_dir / f'prms_{cat_label}_sr.csv',
+        sep=';',
+        index_col=0).iloc[:, 0]
+
+    dab_validate.main(
+        prms_sr,
+        inp_dfe.loc[val_beg:val_end],
+        cat_area,
+        secs_per_step=secs_per_step,
+        output_dir=val_dir,
+        cat_label=cat_label,
+        rslts_cche=rslts_cche)
+
+    prf_sr = pd.read_csv(
+        val_dir / f'prf_{cat_label}_sr.csv',
+        sep=';',
+        index_col=0).iloc[:, 0]
+
+    end_tme = timeit.default_timer()
+
+    return (
+        f'Done: {inp_path.parent.name}, {cat_label}, '
+        f'{val_dir.name}, NS: {prf_sr.loc["NS"]:0.3f}, '
+        f'{end_tme - beg_tme:0.1f} secs')
+
+
+if __name__ == '__main__':
+    print('#### Started on %s ####\n' % time.asctime())
+    START = timeit.default_timer()
+
+    #==========================================================================
+    # When in post_mortem:
+    # 1. "where" to show the stack,
+    # 2. "up" move the stack up to an older frame,
+    # 3. "down" move the stack down to a newer frame, and
+    # 4. "interact" start an interactive interpreter.
+    #==========================================================================
+
+    if DEBUG_FLAG:
+        try:
+            main()
+
+        except:
+            pre_stack = tb.format_stack()[:-1]
+
+            err_tb = list(tb.TracebackException(*sys.exc_info()).format())
+
+            lines = [err_tb[0]] + pre_stack + err_tb[2:]
+
+            for line in lines:
+                print(line, file=sys.stderr, end='')
+
+            import pdb
+            pdb.post_mortem()
+    else:
+        main()
+
+    STOP = timeit.default_timer()
+    print(('\n#### Done with everything on %s.\nTotal run time was'
+           ' about %0.4f seconds ####' % (time.asctime(), STOP - START)))
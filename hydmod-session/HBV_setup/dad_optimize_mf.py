@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+'''
+@author: Faizan-TU Munich
+
+Oct 18, 2026
+
+2:41:07 PM
+
+Instructions:
+This script calibrates the model in two steps (multi-fidelity). It needs
+far fewer model runs on fine (e.g., hourly) time steps than daa_optimize
+on those alone.
+
+1. The inputs are aggregated to coarse (e.g., daily) time steps, and the
+   model is calibrated on those. This is cheap, as there are far fewer
+   time steps.
+2. The constants that depend on the length of the time step are converted
+   back to the fine time step (see HBV1D012A.get_time_scaled_parameters).
+   The population of the optimizer on the fine time steps starts around
+   them, and only a few generations are run.
+
+The bounds are those of the fine time steps. The outputs of the second step
+are those of daa_optimize, in output_dir. Those of the first step are in
+output_dir with _crs added to its name.
+'''
+
+import sys
+import time
+import timeit
+import traceback as tb
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from HBV_setup import daa_optimize
+from HBV_setup.hmg import HBV1D012A
+
+DEBUG_FLAG = False
+
+
+def main(prms_buds_dict, inp_dfe, cat_area, secs_per_step=3600, output_dir=r'HBV/hourly/calib_results_hbv_hourly', cat_label='10420', secs_per_step_crs=86400, max_gens_fne=30, prms_init_sprd=0.05, n_cpus=1, seed=None):
+
+    # prms_buds_dict: Bounds of the parameters for the fine time steps (same
+    # as in daa_optimize).
+    # inp_dfe: Inputs of the fine time steps, with a DatetimeIndex (same as
+    # in daa_optimize).
+    # secs_per_step: Number of seconds per fine time step.
+    # secs_per_step_crs: Number of seconds per coarse time step. A multiple
+    # of secs_per_step.
+    # max_gens_fne: Number of generations on the fine time steps.
+    # prms_init_sprd: Standard deviation of the initial population on the
+    # fine time steps around the converted parameters (see
+    # daa_optimize.get_init_popn).
+    # n_cpus and seed are passed to daa_optimize.
+
+    # The directory where the outputs of the coarse time steps are saved.
+    ot_dir_crs = Path(f'{output_dir}_crs')
+    #==========================================================================
+
+    assert secs_per_step_crs > secs_per_step, (
+        secs_per_step_crs, secs_per_step)
+
+    assert not (secs_per_step_crs % secs_per_step), (
+        'Coarse time step not a multiple of the fine one!',
+        secs_per_step_crs,
+        secs_per_step)
+
+    # Length of a fine time step over that of a coarse one.
+    tstp_rato = secs_per_step / secs_per_step_crs
+
+    inp_dfe_crs = get_coarse_inputs(inp_dfe, secs_per_step, secs_per_step_crs)
+
+    prms_buds_dict_crs = get_time_scaled_buds_dict(
+        prms_buds_dict, 1 / tstp_rato)
+
+    print(
+        f'Optimizing on {inp_dfe_crs.shape[0]} coarse time steps of '
+        f'{secs_per_step_crs} secs...')
+
+    _tbeg = timeit.default_timer()
+
+    prms_sr_crs = daa_optimize.main(
+        prms_buds_dict_crs,
+        inp_dfe_crs,
+        cat_area,
+        secs_per_step=secs_per_step_crs,
+        output_dir=ot_dir_crs,
+        cat_label=cat_label,
+        n_cpus=n_cpus,
+        seed=seed)
+
+    _tend = timeit.default_timer()
+
+    print(f'Coarse time steps took {_tend - _tbeg:0.2f} secs.')
+    print('')
+    #==========================================================================
+
+    modl_objt = HBV1D012A()
+
+    prms_lbls = list(modl_objt.get_parameter_labels().keys())
+
+    prms_init = modl_objt.get_time_scaled_parameters(
+        prms_sr_crs.loc[prms_lbls].values.astype(np.float64), tstp_rato)
+
+    # Conversions back and forth may be slightly off the bounds.
+    prms_buds = modl_objt.get_parameter_bounds_in_correct_order(
+        prms_buds_dict)
+
+    prms_init = np.clip(prms_init, prms_buds[:, 0], prms_buds[:, 1])
+
+    print(
+        f'Optimizing on {inp_dfe.shape[0]} fine time steps of '
+        f'{secs_per_step} secs...')
+
+    _tbeg = timeit.default_timer()
+
+    prms_sr = daa_optimize.main(
+        prms_buds_dict,
+        inp_dfe,
+        cat_area,
+        secs_per_step=secs_per_step,
+        output_dir=output_dir,
+        cat_label=cat_label,
+        n_cpus=n_cpus,
+        seed=seed,
+        prms_init=pd.Series(index=prms_lbls, data=prms_init),
+        prms_init_sprd=prms_init_sprd,
+        max_gens=max_gens_fne)
+
+    _tend = timeit.default_timer()
+
+    print(f'Fine time steps took {_tend - _tbeg:0.2f} secs.')
+    print('')
+    return prms_sr
+
+
+def get_coarse_inputs(inp_dfe, secs_per_step, secs_per_step_crs):
+
+    '''
+    Inputs of daa_optimize aggregated to time steps of secs_per_step_crs.
+    Temperature and discharge are averaged, precipitation and potential
+    evapotranspiration are summed. A coarse time step without a reference
+    discharge value gets NaN. Incomplete coarse time steps at either end are
+    dropped.
+    '''
+
+    assert isinstance(inp_dfe.index, pd.DatetimeIndex), type(inp_dfe.index)
+
+    n_stps = secs_per_step_crs // secs_per_step
+
+    rsmr = inp_dfe.resample(pd.Timedelta(seconds=secs_per_step_crs))
+
+    inp_dfe_crs = rsmr.agg({
+        'tem': 'mean',
+        'ppt': 'sum',
+        'pet': 'sum',
+        'dis_ref': 'mean',
+        })
+
+    inp_dfe_crs = inp_dfe_crs.loc[rsmr.size() == n_stps]
+
+    assert inp_dfe_crs.shape[0], 'No complete coarse time steps!'
+
+    return inp_dfe_crs
+
+
+def get_time_scaled_buds_dict(prms_buds_dict, tstp_rato):
+
+    '''
+    Bounds of prms_buds_dict for a time step that is tstp_rato times as
+    long (see HBV1D012A.get_time_scaled_parameters).
+    '''
+
+    modl_objt = HBV1D012A()
+
+    prms_buds = modl_objt.get_parameter_bounds_in_correct_order(
+        prms_buds_dict)
+
+    prms_buds = modl_objt.get_time_scaled_parameters(
+        prms_buds.T.astype(np.float64), tstp_rato).T
+
+    prms_buds_dict_scd = {
+        prm_lbl: (float(prms_buds[i, 0]), float(prms_buds[i, 1]))
+        for prm_lbl, i in modl_objt.get_parameter_labels().items()}
+
+    return prms_buds_dict_scd
+
+
+if __name__ == '__main__':
+    print('#### Started on %s ####\n' % time.asctime())
+    START = timeit.default_timer()
+
+    #==========================================================================
+    # When in post_mortem:
+    # 1. "where" to show the stack,
+    # 2. "up" move the stack up to an older frame,
+    # 3. "down" move the stack down to a newer frame, and
+    # 4. "interact" start an interactive interpreter.
+    #==========================================================================
+
+    if DEBUG_FLAG:
+        try:
+            main()
+
+        except:
+            pre_stack = tb.format_stack()[:-1]
+
+            err_tb = list(tb.TracebackException(*sys.exc_info()).format())
+
+            lines = [err_tb[0]] + pre_stack + err_tb[2:]
+
+            for line in lines:
+                print(line, file=sys.stderr, end='')
+
+            import pdb
+            pdb.post_mortem()
+    else:
+        main()
+
+    STOP = timeit.default_timer()
+    print(('\n#### Done with everything on %s.\nTotal run time was'
+           ' about %0.4f seconds ####' % (time.asctime(), STOP - START)))
@@ -11,4 +11,7 @@ Keywords:
 '''
 
 from .models import (
-    HBV1D012A)
+    HBV1D012A,
+    HBV1D012ACats,
+    HBV1D012ANest,
+    HBV2D012A)
@@ -10,6 +10,8 @@ Nov 13, 2023
 Keywords:
 '''
 
+from hashlib import sha1
+from pathlib import Path
 from timeit import default_timer
 
 import numpy as np
@@ -27,46 +29,54 @@ class HBV1D012A:
     For functionality, read the documentation of the individual methods below.
     '''
 
-    def __init__(self):
+    # Labels of the parameters that are fractions per time step and of those
+    # that are linear in the length of the time step. For
+    # get_time_scaled_parameters.
+    _tmsd_prms_lbls = ('urr_tdr', 'urr_cst', 'urr_ulc', 'lrr_cst')
+    _tlnr_prms_lbls = ('snw_amf',)
+
+    def __init__(self, bknd='auto'):
 
         '''
         Initiliaze everything correctly.
 
+        bknd is the label of the backend that runs the model. It can be any
+        key of the _bknds_ldrs dictionary (defined at the end of this file)
+        or 'auto'. With 'auto', the fastest available backend is taken. If
+        the requested backend cannot be imported, the python version is
+        taken. Use get_backend to know which one is being used.
+
         For description of variables defined here, either look below or in the
         hbv1d012.pyx file.
         '''
 
-        try:
-            raise ImportError  # For now, don't use the cython version.
-
-            # import pyximport
-            # pyximport.install(inplace=True)
-            #
-            # from models.hbv1d012a_cy import (
-            #     hbv1d012a_cy,
-            #     get_idxs_prms_cy,
-            #     get_idxs_otps_cy,
-            #     get_abds_prms_cy)
-            #
-            # # The cy version was 464 times faster than the py version.
-            # self._modl = hbv1d012a_cy  # The Model (as a function) in Cython.
-            #
-            # self._idxs_prms = get_idxs_prms_cy()  # Parameter indices.
-            # self._idxs_otps = get_idxs_otps_cy()  # Output variables indices.
-            # self._abds_prms = get_abds_prms_cy()  # Absolute parameter bounds.
-
-        except:
-            from .hbv1d012a_py import (
-                hbv1d012a_py,
-                get_idxs_prms_py,
-                get_idxs_otps_py,
-                get_abds_prms_py)
-
-            self._modl = hbv1d012a_py  # The Model (as a function) in Python.
-
-            self._idxs_prms = get_idxs_prms_py()  # Parameter indices.
-            self._idxs_otps = get_idxs_otps_py()  # Output variables indices.
-            self._abds_prms = get_abds_prms_py()  # Absolute parameter bounds.
+        bknd_lbl, bknd_dict = _load_bknd(bknd)
+
+        self._bknd_inp = bknd  # Requested backend.
+        self._bknd = bknd_lbl  # Backend in use.
+
+        self._modl = bknd_dict['modl']  # The Model (as a function).
+        self._modl_dis = bknd_dict['modl_dis']  # Discharge only.
+        self._modl_sel = bknd_dict['modl_sel']  # Some/aggregated outputs.
+        self._modl_bh = bknd_dict['modl_bh']  # Many units at once.
+        self._modl_bh_sse = bknd_dict['modl_bh_sse']  # Bounded SSE.
+
+        self._idxs_prms = bknd_dict['idxs_prms']  # Parameter indices.
+        self._idxs_otps = bknd_dict['idxs_otps']  # Output variables indices.
+        self._abds_prms = bknd_dict['abds_prms']  # Absolute parameter bounds.
+        self._idxs_stts = bknd_dict['idxs_stts']  # State variables indices.
+
+        self._abds_prms_arr = _get_abds_prms_arr(
+            self._idxs_prms, self._abds_prms)
+
+        # Indices of the parameters that are the initial states and of the
+        # output columns that are the states, in the order of the state
+        # indices.
+        self._idxs_prms_stts = _get_idxs_of_stts(
+            self._idxs_prms, self._idxs_stts)
+
+        self._idxs_otps_stts = _get_idxs_of_stts(
+            self._idxs_otps, self._idxs_stts)
 
         self._tems = None  # Temperature.
         self._ppts = None  # Precipitation.
@@ -76,10 +86,22 @@ class HBV1D012A:
         self._otps = None  # Outputs.
         self._diss = None  # Discharge simulated.
 
+        self._otps_idxs = None  # Output indices of the selected outputs.
+        self._aggs_idxs = None  # Row of the outputs of each time step.
+        self._aggs_cnts = None  # Number of time steps in each row, for means.
+
         self._prms = None  # Parameters.
 
         self._oflg = None  # Optimization flag.
         self._dslr = None  # Runoff to river flow conversion constant (scaler).
+
+        self._stts_inp = None  # Initial states, instead of those in prms.
+        self._stts_end = None  # States at the end of the last run.
+        self._ckps_stps = None  # Number of time steps between checkpoints.
+        self._ckps = {}  # States at the checkpoints of the last run.
+
+        self._stts_onl = None  # States at the end of the last online run.
+        self._tsps_onl = 0  # Number of time steps run online so far.
         return
 
     def get_parameter_bounds_in_correct_order(self, buds_dict):
@@ -130,6 +152,51 @@ class HBV1D012A:
 
         return prms_buds
 
+    def get_time_scaled_parameters(self, prms, tstp_rato):
+
+        '''
+        Parameters for a time step of another length, e.g., to start from
+        parameters of daily inputs with hourly inputs. tstp_rato is the
+        length of the new time step over that of the old one (1 / 24 for
+        daily to hourly).
+
+        prms is a 1D or 2D array of floating values with the parameters on
+        the last axis, in the order of get_parameter_labels. The first axis
+        of a 2D array can be anything e.g., the two columns of the output
+        of get_parameter_bounds_in_correct_order transposed.
+
+        The constants that are fractions of a storage that leave it in a
+        time step [1/T] become 1 - (1 - k) ** tstp_rato i.e., the same
+        fraction leaves in the same time. The air melt factor [L/TK] is
+        multiplied by tstp_rato. The rest (depths, ratios, temperatures and
+        the precipitation melt factor [L/LTK]) stay the same.
+
+        Returns a new float64 array.
+        '''
+
+        assert isinstance(prms, np.ndarray), type(prms)
+        assert prms.ndim in (1, 2), prms.ndim
+
+        assert prms.shape[-1] == len(self._idxs_prms), (
+            prms.shape[-1], len(self._idxs_prms))
+
+        assert np.issubdtype(prms.dtype, np.floating), prms.dtype
+
+        assert tstp_rato > 0, tstp_rato
+
+        prms = prms.astype(np.float64)
+
+        for prm_lbl in self._tmsd_prms_lbls:
+            prm_idx = self._idxs_prms[prm_lbl]
+
+            prms[..., prm_idx] = 1 - (
+                (1 - prms[..., prm_idx]) ** tstp_rato)
+
+        for prm_lbl in self._tlnr_prms_lbls:
+            prms[..., self._idxs_prms[prm_lbl]] *= tstp_rato
+
+        return prms
+
     def get_parameter_labels(self):
 
         '''
@@ -163,13 +230,38 @@ class HBV1D012A:
 
         return self._idxs_otps
 
-    def set_inputs(self, tems, ppts, pets):
+    def get_state_labels(self):
+
+        '''
+        Get model state labels (keys) along with their indices (values) as a
+        dictionary. States are the storages that carry over from one time
+        step to the next. Each has a parameter (its initial value) and an
+        output with the same label.
+        '''
+
+        return self._idxs_stts
+
+    def set_inputs(self, tems, ppts, pets, cpy_flg=True):
 
         '''
         Time series of input variables for the model. These are to be in
         a specific form. Look at the tests below to know what is expected.
         Ideally, a 1D array of values for each variable, all of same length,
         of floating values and range checks.
+
+        With cpy_flg False, inputs that are float32 and contiguous already
+        are used as they are instead of being copied. They must then not
+        be changed from outside while the model uses them.
+        '''
+
+        self._tems, self._ppts, self._pets = self._get_checked_inputs(
+            tems, ppts, pets, cpy_flg)
+        return
+
+    def _get_checked_inputs(self, tems, ppts, pets, cpy_flg=True):
+
+        '''
+        The checks of set_inputs. Returns the inputs cast to float32.
         '''
 
         # Temperature [°C, °F, K].
@@ -197,12 +289,20 @@ class HBV1D012A:
             tems.shape, ppts.shape, pets.shape)
 
         # Casting.
-        self._tems = tems.astype(np.float32)
-        self._ppts = ppts.astype(np.float32)
-        self._pets = pets.astype(np.float32)
-        return
+        if cpy_flg:
+            tems = tems.astype(np.float32)
+            ppts = ppts.astype(np.float32)
+            pets = pets.astype(np.float32)
+
+        else:
+            tems = np.ascontiguousarray(tems, dtype=np.float32)
+            ppts = np.ascontiguousarray(ppts, dtype=np.float32)
+            pets = np.ascontiguousarray(pets, dtype=np.float32)
 
-    def set_outputs(self, tsps):
+        return tems, ppts, pets
+
+    def set_outputs(
+            self, tsps, otps_lbls=None, aggs_idxs=None, aggs_type=None):
 
         '''
         Initialize the array that will hold all model outputs (otps) along
@@ -214,26 +314,125 @@ class HBV1D012A:
         The arrays created here can be returned by the methods defined later
         below. This method only initilizes required arrays. The model will
         fill these later.
+
+        For long runs, the otps array can be made much smaller in regular
+        runs (oflg == 0) with the following optional arguments:
+        - otps_lbls: A tuple of the labels (from get_output_labels) of the
+          only outputs that are needed. The columns of otps are then in this
+          order (see get_selected_output_labels). The mass balance is only
+          computed when it is selected.
+        - aggs_idxs: A 1D integer array with the row of otps for each time
+          step. It starts at zero and increases by one at the beginning of
+          a new period. Then each row of otps is the aggregate of the outputs
+          of the time steps of a period e.g., a day or a month. With pandas,
+          pd.factorize(index.to_period('M'))[0] gives these for months.
+        - aggs_type: Either 'sum' (default) or 'mean' over the time steps of
+          each period.
+
+        diss always has a value for each time step.
         '''
 
         assert isinstance(tsps, int), type(tsps)
         assert tsps > 0, tsps
 
-        otps = np.empty((tsps, len(self._idxs_otps)), dtype=np.float32)
+        if otps_lbls is None:
+            otps_idxs = None
+
+            if aggs_idxs is not None:
+                otps_idxs = np.array(
+                    sorted(self._idxs_otps.values()), dtype=np.int64)
+
+        else:
+            assert isinstance(otps_lbls, (tuple, list)), type(otps_lbls)
+            assert len(otps_lbls), otps_lbls
+            assert len(set(otps_lbls)) == len(otps_lbls), otps_lbls
+
+            assert all([
+                otp_lbl in self._idxs_otps for otp_lbl in otps_lbls]), (
+                    otps_lbls, tuple(self._idxs_otps))
+
+            otps_idxs = np.array(
+                [self._idxs_otps[otp_lbl] for otp_lbl in otps_lbls],
+                dtype=np.int64)
+
+        if aggs_idxs is None:
+            assert aggs_type is None, aggs_type
+
+            aggs_cnts = None
+
+            if otps_idxs is not None:
+                aggs_idxs = np.arange(tsps, dtype=np.int64)
+
+            n_rows = tsps
+
+        else:
+            if aggs_type is None:
+                aggs_type = 'sum'
+
+            assert aggs_type in ('sum', 'mean'), aggs_type
+
+            assert isinstance(aggs_idxs, np.ndarray), type(aggs_idxs)
+            assert aggs_idxs.ndim == 1, aggs_idxs.ndim
+            assert aggs_idxs.size == tsps, (aggs_idxs.size, tsps)
+
+            assert np.issubdtype(aggs_idxs.dtype, np.integer), (
+                aggs_idxs.dtype)
+
+            assert aggs_idxs[0] == 0, aggs_idxs[0]
+            assert np.isin(np.diff(aggs_idxs), (0, 1)).all()
+
+            aggs_idxs = aggs_idxs.astype(np.int64)
+
+            n_rows = int(aggs_idxs[-1]) + 1
+
+            if aggs_type == 'mean':
+                aggs_cnts = np.bincount(aggs_idxs).astype(np.float32)
+
+            else:
+                aggs_cnts = None
+
+        if otps_idxs is None:
+            n_cols = len(self._idxs_otps)
+
+        else:
+            n_cols = otps_idxs.size
+
+        otps = np.empty((n_rows, n_cols), dtype=np.float32)
         diss = np.empty((tsps,), dtype=np.float32)
 
         self._tsps = tsps
         self._otps = otps
         self._diss = diss
+
+        self._otps_idxs = otps_idxs
+        self._aggs_idxs = aggs_idxs
+        self._aggs_cnts = aggs_cnts
         return
 
+    def get_selected_output_labels(self):
+
+        '''
+        Labels (keys) of the columns of the outputs array along with their
+        column indices (values), as a dictionary. Same as get_output_labels,
+        unless only some of the outputs were selected in set_outputs.
+        '''
+
+        if self._otps_idxs is None:
+            return self._idxs_otps
+
+        otps_lbls = {
+            otp_idx: otp_lbl for otp_lbl, otp_idx in self._idxs_otps.items()}
+
+        return {
+            otps_lbls[otp_idx]: j for j, otp_idx in enumerate(self._otps_idxs)}
+
     def set_optimization_flag(self, oflg):
 
         '''
         Whether the model is an optimization run (oflag == 1) or a regular
-        model run (oflg == 0). In case of optimization, only the outputs
-        of the last time step are needed. Hence, only a single row in the
-        outputs array is written to and read from again and again.
+        model run (oflg == 0). In case of optimization, only the discharge
+        is computed (get_discharge). The states are kept in the local
+        variables of the model and the outputs array is not written to.
         Read below to see what conditions oflg must pass before usage.
         '''
 
@@ -289,16 +488,102 @@ class HBV1D012A:
 
         prms = prms.astype(np.float32)
 
-        for prm_lbl, idx in self._idxs_prms.items():
+        prms_ibds = (
+            (prms >= self._abds_prms_arr[:, 0]) &
+            (prms <= self._abds_prms_arr[:, 1]))
 
-            prm_llm, prm_ulm = self._abds_prms[prm_lbl]
-
-            assert (prm_llm <= prms[idx] <= prm_ulm), (
-                    prm_lbl, prm_llm, prms[idx], prm_ulm)
+        assert prms_ibds.all(), [
+            (prm_lbl, self._abds_prms[prm_lbl], prms[idx])
+            for prm_lbl, idx in self._idxs_prms.items()
+            if not prms_ibds[idx]]
 
         self._prms = prms
         return
 
+    def get_prepared_run(self, prms_buds=None):
+
+        '''
+        A HBV1D012APrep object to run the model many times with different
+        parameters and nothing else changed, without the checks of
+        set_parameters and run_model for each run. Everything but the
+        parameters should be set before calling this. See HBV1D012APrep
+        for prms_buds.
+
+        The safe way of set_parameters and then run_model stays the same.
+        '''
+
+        return HBV1D012APrep(self, prms_buds)
+
+    def get_backend(self):
+
+        '''
+        Label of the backend that is used to run the model. This may not be
+        the same as the one requested at initialization, in case it
+        could not be imported.
+        '''
+
+        return self._bknd
+
+    def set_state(self, stts):
+
+        '''
+        States to start the next runs from, instead of the initial values
+        in the parameters. This allows for starting a run at any time step
+        e.g., with the states returned by get_state of a previous run.
+        The states stay until set_state is called with None.
+
+        stts is a 1D array of floating values in the order of the state
+        indices (get_state_labels). It should pass the same bounds checks as
+        the corresponding parameters.
+        '''
+
+        # Online runs start again from the new states.
+        self._stts_onl = None
+        self._tsps_onl = 0
+
+        if stts is None:
+            self._stts_inp = None
+            return
+
+        assert isinstance(stts, np.ndarray), type(stts)
+        assert stts.ndim == 1, stts.ndim
+        assert np.isfinite(stts).all(), stts
+
+        assert stts.size == len(self._idxs_stts), (
+            stts.size, len(self._idxs_stts))
+
+        assert np.issubdtype(stts.dtype, np.floating), stts.dtype
+
+        stts = stts.astype(np.float32)
+
+        for stt_lbl, idx in self._idxs_stts.items():
+
+            stt_llm, stt_ulm = self._abds_prms[stt_lbl]
+
+            assert (stt_llm <= stts[idx] <= stt_ulm), (
+                    stt_lbl, stt_llm, stts[idx], stt_ulm)
+
+        self._stts_inp = stts
+        return
+
+    def set_checkpoint_steps(self, ckps_stps):
+
+        '''
+        In optimization runs (oflg == 1), the states of the intermediate time
+        steps are not kept. With ckps_stps, the states at the end of every
+        ckps_stps-th time step are kept (checkpoints) and can be had by
+        get_state. Any window of the time series can then be replayed
+        cheaply by starting from the checkpoint before it (set_state).
+        None switches checkpoints off.
+        '''
+
+        if ckps_stps is not None:
+            assert isinstance(ckps_stps, int), type(ckps_stps)
+            assert ckps_stps > 0, ckps_stps
+
+        self._ckps_stps = ckps_stps
+        return
+
     def get_model(self):
 
         '''
@@ -330,23 +615,91 @@ class HBV1D012A:
         assert self._oflg is not None
         assert self._dslr is not None
 
-        assert self._tems.shape[0] == self._otps.shape[0], (
-            self._tems.shape[0], self._otps.shape[0])
+        assert self._tems.shape[0] == self._tsps, (
+            self._tems.shape[0], self._tsps)
 
         tme_flg = True
 
         if tme_flg: beg_tme = default_timer()
 
-        self._modl(
-            self._tems,
-            self._ppts,
-            self._pets,
-            self._otps,
-            self._diss,
-            self._prms,
-            self._oflg,
-            self._dslr,
-            )
+        if self._stts_inp is None:
+            stts = self._prms[self._idxs_prms_stts]
+
+        else:
+            stts = self._stts_inp.copy()
+
+        if self._oflg:
+            # Only the discharge is needed. The outputs array is not touched.
+            # The model is run in pieces of ckps_stps with the states
+            # carried over.
+            if self._ckps_stps is None:
+                ckps_stps = self._tsps
+
+            else:
+                ckps_stps = self._ckps_stps
+
+            self._ckps = {}
+
+            for beg_stp in range(0, self._tsps, ckps_stps):
+
+                end_stp = min(beg_stp + ckps_stps, self._tsps)
+
+                self._modl_dis(
+                    self._tems[beg_stp:end_stp],
+                    self._ppts[beg_stp:end_stp],
+                    self._pets[beg_stp:end_stp],
+                    self._diss[beg_stp:end_stp],
+                    self._prms,
+                    stts,
+                    self._dslr,
+                    )
+
+                if self._ckps_stps is not None:
+                    self._ckps[end_stp - 1] = stts.copy()
+
+            self._stts_end = stts
+
+        elif self._otps_idxs is not None:
+            # Only the selected and/or aggregated outputs.
+            self._otps[:] = 0
+
+            self._modl_sel(
+                self._tems,
+                self._ppts,
+                self._pets,
+                self._otps,
+                self._diss,
+                self._prms,
+                stts,
+                self._dslr,
+                self._otps_idxs,
+                self._aggs_idxs,
+                )
+
+            if self._aggs_cnts is not None:
+                self._otps /= self._aggs_cnts[:, None]
+
+            self._stts_end = stts
+
+        else:
+            prms = self._prms
+
+            if self._stts_inp is not None:
+                prms = prms.copy()
+                prms[self._idxs_prms_stts] = stts
+
+            self._modl(
+                self._tems,
+                self._ppts,
+                self._pets,
+                self._otps,
+                self._diss,
+                prms,
+                self._oflg,
+                self._dslr,
+                )
+
+            self._stts_end = self._otps[-1, self._idxs_otps_stts]
 
         if tme_flg:
             end_tme = default_timer()
@@ -354,12 +707,295 @@ class HBV1D012A:
             #print(f'Model runtime: {end_tme - beg_tme:0.2E} seconds.')
         return
 
+    def run_batch(self, prms):
+
+        '''
+        Run the model for many parameter sets at once, given the inputs and
+        the discharge scaler set before. This is faster than calling
+        set_parameters and run_model for each set.
+
+        prms is a 2D array of floating values. Each row is a parameter set
+        that has to pass the same conditions as in set_parameters.
+
+        All the sets are moved forward together, one time step at a time.
+        Only the discharge is computed.
+
+        Returns the discharge of each set as a 2D array
+        [number of sets, number of time steps].
+        '''
+
+        prms, stts, dslr = self._get_batch_args(prms)
+
+        diss = np.empty((self._tems.shape[0], prms.shape[0]), dtype=np.float32)
+
+        self._modl_bh(
+            self._tems[:, None],
+            self._ppts[:, None],
+            self._pets[:, None],
+            diss,
+            prms,
+            stts,
+            dslr)
+
+        return diss.T
+
+    def run_batch_bounded(self, prms, diso, sses_max):
+
+        '''
+        Same as run_batch, but the run of a parameter set stops as soon as
+        the sum of squared errors (SSE) of its discharge against the
+        reference diso goes above its value in sses_max. This is for
+        optimization, where such sets are not needed anymore (e.g., they
+        cannot have a better NSE than a given one).
+
+        diso is a 1D array of the reference discharge, with a value for each
+        time step of the inputs. NaN values are skipped.
+
+        sses_max is a 1D array of the bound of each set. np.inf for a set
+        that has to be run till the end.
+
+        Returns the discharge of each set as a 2D array
+        [number of sets, number of time steps] and the SSE of each set.
+        A set was stopped when its SSE is above its bound. Then, only its
+        SSE till that time step is returned and its discharge after it is
+        zero.
+        '''
+
+        prms, stts, dslr = self._get_batch_args(prms)
+
+        assert isinstance(diso, np.ndarray), type(diso)
+        assert diso.ndim == 1, diso.ndim
+        assert diso.shape[0] == self._tems.shape[0], (
+            diso.shape[0], self._tems.shape[0])
+
+        assert isinstance(sses_max, np.ndarray), type(sses_max)
+        assert sses_max.shape == (prms.shape[0],), (
+            sses_max.shape, prms.shape[0])
+
+        assert not np.isnan(sses_max).any(), sses_max
+
+        diso = np.ascontiguousarray(diso, dtype=np.float32)
+
+        sses = sses_max.astype(np.float64)
+
+        diss = np.zeros((self._tems.shape[0], prms.shape[0]), dtype=np.float32)
+
+        self._modl_bh_sse(
+            self._tems[:, None],
+            self._ppts[:, None],
+            self._pets[:, None],
+            diss,
+            prms,
+            stts,
+            dslr,
+            diso,
+            sses)
+
+        return diss.T, sses
+
+    def _get_batch_args(self, prms):
+
+        '''
+        Check the parameter sets of run_batch and return them as float32
+        with the initial states and discharge scaler of each set.
+        '''
+
+        assert self._tems is not None
+        assert self._ppts is not None
+        assert self._pets is not None
+
+        assert self._dslr is not None
+
+        assert isinstance(prms, np.ndarray), type(prms)
+        assert prms.ndim == 2, prms.ndim
+        assert prms.shape[0] > 0, prms.shape
+        assert np.isfinite(prms).all(), prms
+
+        assert prms.shape[1] == len(self._idxs_prms), (
+            prms.shape[1], len(self._idxs_prms))
+
+        assert np.issubdtype(prms.dtype, np.floating), prms.dtype
+
+        prms = prms.astype(np.float32)
+
+        assert (prms >= self._abds_prms_arr[:, 0]).all(), prms
+        assert (prms <= self._abds_prms_arr[:, 1]).all(), prms
+
+        # Each set starts from its own initial states, unless set_state
+        # was called.
+        stts = np.ascontiguousarray(prms[:, self._idxs_prms_stts])
+
+        if self._stts_inp is not None:
+            stts[:] = self._stts_inp
+
+        dslr = np.full(prms.shape[0], self._dslr, dtype=np.float32)
+
+        return prms, stts, dslr
+
+    def run_spin_up(self, tsps, cche_dir=None):
+
+        '''
+        Run the model (discharge only) for the first tsps time steps of the
+        inputs and return the states at the end. This is the warm-up that
+        is needed when the initial states are unknown. Use set_state to
+        start the next run from the returned states.
+
+        With cche_dir, the states are saved inside it, with a name that is
+        the hash of the parameters, the initial states and the inputs of
+        the spin-up period. A later call with the same values loads the
+        states from there, instead of running the model again.
+        '''
+
+        assert self._tems is not None
+        assert self._ppts is not None
+        assert self._pets is not None
+
+        assert self._prms is not None
+
+        assert isinstance(tsps, int), type(tsps)
+        assert 0 < tsps <= self._tems.shape[0], (tsps, self._tems.shape[0])
+
+        if self._stts_inp is None:
+            stts = self._prms[self._idxs_prms_stts]
+
+        else:
+            stts = self._stts_inp.copy()
+
+        if cche_dir is not None:
+            hshr = sha1()
+            for arr in (
+                self._prms,
+                stts,
+                self._tems[:tsps],
+                self._ppts[:tsps],
+                self._pets[:tsps]):
+
+                hshr.update(arr.tobytes())
+
+            cche_path = Path(cche_dir) / f'stts_{hshr.hexdigest()}.npy'
+
+            if cche_path.exists():
+                return np.load(cche_path)
+
+        diss = np.empty(tsps, dtype=np.float32)
+
+        self._modl_dis(
+            self._tems[:tsps],
+            self._ppts[:tsps],
+            self._pets[:tsps],
+            diss,
+            self._prms,
+            stts,
+            np.float32(1.0),
+            )
+
+        if cche_dir is not None:
+            cche_path.parent.mkdir(exist_ok=True, parents=True)
+
+            np.save(cche_path, stts)
+
+        return stts
+
+    def get_state(self, tstp=-1):
+
+        '''
+        States at the end of time step tstp of the last run_model call, in
+        the order of the state indices (get_state_labels). Negative values
+        count from the end, like in python.
+
+        After a regular run (oflg == 0), the states of every time step are
+        available, unless only some or aggregated outputs were asked for in
+        set_outputs. Otherwise, only those of the last time step and of the
+        checkpoints (set_checkpoint_steps, optimization runs only) are.
+        '''
+
+        assert self._stts_end is not None, 'Model not run!'
+
+        assert isinstance(tstp, (int, np.integer)), type(tstp)
+        assert -self._tsps <= tstp < self._tsps, (tstp, self._tsps)
+
+        if tstp < 0:
+            tstp += self._tsps
+
+        if tstp == (self._tsps - 1):
+            stts = self._stts_end.copy()
+
+        elif (not self._oflg) and (self._otps_idxs is None):
+            stts = self._otps[tstp, self._idxs_otps_stts]
+
+        else:
+            assert tstp in self._ckps, (
+                f'No checkpoint at time step {tstp}!')
+
+            stts = self._ckps[tstp].copy()
+
+        return stts
+
+    def run_model_online(self, tems, ppts, pets):
+
+        '''
+        Move the model forward by the time steps of the given inputs,
+        starting from the states at the end of the previous call. The first
+        call starts from the states of set_state, or else from the initial
+        values in the parameters.
+
+        This is meant for operational runs where new inputs arrive with
+        time e.g., every hour. The history is not run again and nothing is
+        kept but the states. Hence, the memory used does not grow with time.
+
+        The inputs have to pass the same checks as in set_inputs. The
+        parameters and the discharge scaler must have been set before.
+        Inputs of set_inputs and the outputs arrays are not touched.
+
+        Returns the discharge of the given time steps only.
+        '''
+
+        assert self._prms is not None
+        assert self._dslr is not None
+
+        tems, ppts, pets = self._get_checked_inputs(tems, ppts, pets)
+
+        if self._stts_onl is None:
+            if self._stts_inp is None:
+                self._stts_onl = self._prms[self._idxs_prms_stts]
+
+            else:
+                self._stts_onl = self._stts_inp.copy()
+
+        diss = np.empty(tems.shape[0], dtype=np.float32)
+
+        self._modl_dis(
+            tems,
+            ppts,
+            pets,
+            diss,
+            self._prms,
+            self._stts_onl,
+            self._dslr,
+            )
+
+        self._tsps_onl += tems.shape[0]
+
+        return diss
+
+    def get_online_state(self):
+
+        '''
+        States at the end of the last run_model_online call, in the order of
+        the state indices (get_state_labels), along with the total number of
+        time steps run online so far.
+        '''
+
+        assert self._stts_onl is not None, 'Model not run online!'
+
+        return self._stts_onl.copy(), self._tsps_onl
+
     def get_outputs(self):
 
         '''
         Get the outputs array filled by the model after callling run_model.
         Each column in this array has a label that is returned by
-        get_output_labels.
+        get_selected_output_labels.
         '''
 
         return self._otps
@@ -382,6 +1018,1051 @@ class HBV1D012A:
         Reinitiliaze everything correctly.
         '''
 
-        self.__init__()
+        self.__init__(self._bknd_inp)
+        return
+
+
+class HBV1D012APrep:
+
+    '''
+    A prepared run of a HBV1D012A object (see HBV1D012A.get_prepared_run).
+
+    Everything that stays the same from one run to the next i.e., inputs,
+    outputs arrays, flags, discharge scaler, states and parameter bounds,
+    is checked and bound here once. run only calls the model with the given
+    parameters, without any checks. This is meant for the many runs of an
+    optimization.
+
+    The HBV1D012A object should not be changed with its setters while this
+    one is in use. Its getters of outputs and discharge give the results of
+    the last run here as well.
+    '''
+
+    def __init__(self, modl_objt, prms_buds=None):
+
+        '''
+        modl_objt is a HBV1D012A object with everything set except for the
+        parameters. Selected or aggregated outputs and checkpoints are
+        not supported.
+
+        prms_buds is an optional 2D array of the parameter bounds
+        (get_parameter_bounds_in_correct_order). It is checked against the
+        absolute bounds here so that parameters within it need no more
+        checks.
+        '''
+
+        assert isinstance(modl_objt, HBV1D012A), type(modl_objt)
+
+        assert modl_objt._tems is not None
+        assert modl_objt._ppts is not None
+        assert modl_objt._pets is not None
+
+        assert modl_objt._tsps is not None
+        assert modl_objt._otps is not None
+        assert modl_objt._diss is not None
+
+        assert modl_objt._oflg is not None
+        assert modl_objt._dslr is not None
+
+        assert modl_objt._tems.shape[0] == modl_objt._tsps, (
+            modl_objt._tems.shape[0], modl_objt._tsps)
+
+        assert modl_objt._otps_idxs is None, (
+            'Selected or aggregated outputs not supported!')
+
+        assert modl_objt._ckps_stps is None, 'Checkpoints not supported!'
+
+        if prms_buds is not None:
+            assert isinstance(prms_buds, np.ndarray), type(prms_buds)
+
+            assert prms_buds.shape == modl_objt._abds_prms_arr.shape, (
+                prms_buds.shape, modl_objt._abds_prms_arr.shape)
+
+            assert np.isfinite(prms_buds).all(), prms_buds
+
+            assert (prms_buds[:, 0] <= prms_buds[:, 1]).all(), prms_buds
+
+            assert (
+                prms_buds[:, 0] >= modl_objt._abds_prms_arr[:, 0]).all(), (
+                    prms_buds)
+
+            assert (
+                prms_buds[:, 1] <= modl_objt._abds_prms_arr[:, 1]).all(), (
+                    prms_buds)
+
+        self._prms_buds = prms_buds
+
+        self._modl = modl_objt._modl
+        self._modl_dis = modl_objt._modl_dis
+
+        self._tems = modl_objt._tems
+        self._ppts = modl_objt._ppts
+        self._pets = modl_objt._pets
+
+        self._otps = modl_objt._otps
+        self._diss = modl_objt._diss
+
+        self._oflg = modl_objt._oflg
+        self._dslr = modl_objt._dslr
+
+        self._idxs_prms_stts = modl_objt._idxs_prms_stts
+
+        self._stts_inp = modl_objt._stts_inp
         return
 
+    def get_parameter_bounds(self):
+
+        '''
+        The parameter bounds given at initialization, if any.
+        '''
+
+        return self._prms_buds
+
+    def run(self, prms):
+
+        '''
+        Run the model with the parameters prms (a 1D array in the order of
+        the parameter indices). These are not checked. They should be
+        within the bounds given at initialization or pass the checks of
+        HBV1D012A.set_parameters. prms is not copied when already float32.
+
+        Returns the simulated discharge. The same array is overwritten by
+        the next run.
+        '''
+
+        prms = np.asarray(prms, dtype=np.float32)
+
+        if self._oflg:
+            if self._stts_inp is None:
+                stts = prms[self._idxs_prms_stts]
+
+            else:
+                stts = self._stts_inp.copy()
+
+            self._modl_dis(
+                self._tems,
+                self._ppts,
+                self._pets,
+                self._diss,
+                prms,
+                stts,
+                self._dslr,
+                )
+
+        else:
+            if self._stts_inp is not None:
+                prms = prms.copy()
+                prms[self._idxs_prms_stts] = self._stts_inp
+
+            self._modl(
+                self._tems,
+                self._ppts,
+                self._pets,
+                self._otps,
+                self._diss,
+                prms,
+                self._oflg,
+                self._dslr,
+                )
+
+        return self._diss
+
+
+class _HBV012AUnits:
+
+    '''
+    Base of the interfaces that run many units (catchments, grid cells,
+    etc.) of the 012A HBV at once. Each unit is a lumped 012A HBV, with the
+    same process equations as those of HBV1D012A. All units are moved
+    forward one time step at a time, with the same kernel as in
+    HBV1D012A.run_batch. Water is not exchanged between the units.
+
+    The subclasses only differ in the way the inputs are given and the
+    discharge is returned.
+    '''
+
+    def __init__(self, bknd='auto'):
+
+        '''
+        Initiliaze everything correctly. See HBV1D012A for bknd.
+        '''
+
+        bknd_lbl, bknd_dict = _load_bknd(bknd)
+
+        self._bknd_inp = bknd  # Requested backend.
+        self._bknd = bknd_lbl  # Backend in use.
+
+        self._modl_bh = bknd_dict['modl_bh']  # Many units at once.
+        self._modl_rtg = bknd_dict['modl_rtg']  # Routing between units.
+
+        self._idxs_prms = bknd_dict['idxs_prms']  # Parameter indices.
+        self._abds_prms = bknd_dict['abds_prms']  # Absolute parameter bounds.
+        self._idxs_stts = bknd_dict['idxs_stts']  # State variables indices.
+
+        self._abds_prms_arr = _get_abds_prms_arr(
+            self._idxs_prms, self._abds_prms)
+
+        self._idxs_prms_stts = _get_idxs_of_stts(
+            self._idxs_prms, self._idxs_stts)
+
+        self._n_unts = None  # Number of units.
+
+        self._tems = None  # Temperature [time, unit or 1].
+        self._ppts = None  # Precipitation [time, unit or 1].
+        self._pets = None  # Potential evapotranspiration [time, unit or 1].
+
+        self._prms = None  # Parameters [unit, parameter].
+        self._dslr = None  # Discharge scalers [unit].
+
+        self._stts_inp = None  # Initial states, instead of those in prms.
+        self._stts_end = None  # States at the end of the last run.
+
+        self._diss = None  # Discharge simulated [time, unit].
+        return
+
+    def get_backend(self):
+
+        '''
+        See HBV1D012A.get_backend.
+        '''
+
+        return self._bknd
+
+    def get_parameter_labels(self):
+
+        '''
+        See HBV1D012A.get_parameter_labels.
+        '''
+
+        return self._idxs_prms
+
+    def get_parameter_absolute_bounds(self):
+
+        '''
+        See HBV1D012A.get_parameter_absolute_bounds.
+        '''
+
+        return self._abds_prms
+
+    def get_state_labels(self):
+
+        '''
+        See HBV1D012A.get_state_labels.
+        '''
+
+        return self._idxs_stts
+
+    def _set_checked_inputs(self, tems, ppts, pets, n_unts):
+
+        '''
+        Check and keep the inputs of set_inputs. Each is a 2D array with
+        the dimensions [time, unit], with either n_unts columns or only one
+        that is then the same for all units. Everything set before is
+        cleared.
+        '''
+
+        inps = [tems, ppts, pets]
+
+        for i, inp in enumerate(inps):
+
+            assert isinstance(inp, np.ndarray), type(inp)
+            assert inp.ndim == 2, inp.ndim
+            assert np.issubdtype(inp.dtype, np.floating), inp.dtype
+
+            assert inp.shape[0] == inps[0].shape[0], (
+                inp.shape[0], inps[0].shape[0])
+
+            assert inp.shape[1] in (1, n_unts), (inp.shape[1], n_unts)
+
+            inps[i] = np.ascontiguousarray(inp, dtype=np.float32)
+
+        tems, ppts, pets = inps
+
+        # Temperature [°C, °F, K].
+        assert np.isfinite(tems).all()
+
+        # Precipitation [Depth per unit time].
+        assert np.isfinite(ppts).all()
+        assert (ppts >= 0).all()
+
+        # Potential evapotranspiration [Depth per unit time].
+        assert np.isfinite(pets).all()
+        assert (pets >= 0).all()
+
+        self._n_unts = n_unts
+
+        self._tems = tems
+        self._ppts = ppts
+        self._pets = pets
+
+        self._prms = None
+        self._dslr = None
+        self._stts_inp = None
+        self._stts_end = None
+        self._diss = None
+        return
+
+    def set_parameters(self, prms):
+
+        '''
+        Model parameters, after set_inputs. Either a 1D array, same for all
+        units, or a 2D array [unit, parameter]. Each parameter set must pass
+        the same conditions as in HBV1D012A.set_parameters.
+        '''
+
+        assert self._n_unts is not None, 'Inputs not set!'
+
+        assert isinstance(prms, np.ndarray), type(prms)
+        assert prms.ndim in (1, 2), prms.ndim
+        assert np.issubdtype(prms.dtype, np.floating), prms.dtype
+
+        assert prms.shape[-1] == len(self._idxs_prms), (
+            prms.shape[-1], len(self._idxs_prms))
+
+        if prms.ndim == 1:
+            prms = np.broadcast_to(prms, (self._n_unts, prms.size))
+
+        assert prms.shape[0] == self._n_unts, (prms.shape[0], self._n_unts)
+
+        prms = np.ascontiguousarray(prms, dtype=np.float32)
+
+        assert np.isfinite(prms).all(), prms
+
+        assert (prms >= self._abds_prms_arr[:, 0]).all(), prms
+        assert (prms <= self._abds_prms_arr[:, 1]).all(), prms
+
+        self._prms = prms
+        return
+
+    def set_discharge_scaler(self, dslr):
+
+        '''
+        Same as HBV1D012A.set_discharge_scaler, after set_inputs. Either a
+        single value for all units or a 1D array with a value per unit. For
+        discharge in m3/s, dslr is the area of each unit in m2 divided by
+        (1000 * number of seconds per time step), with the precipitation in
+        mm per time step.
+        '''
+
+        assert self._n_unts is not None, 'Inputs not set!'
+
+        dslr = np.asarray(dslr, dtype=np.float32)
+
+        assert dslr.ndim in (0, 1), dslr.ndim
+
+        dslr = np.array(
+            np.broadcast_to(dslr, (self._n_unts,)), dtype=np.float32)
+
+        assert np.isfinite(dslr).all(), dslr
+        assert (dslr > 0).all(), dslr
+
+        self._dslr = dslr
+        return
+
+    def set_state(self, stts):
+
+        '''
+        States to start the next runs from, instead of the initial values in
+        the parameters. A 1D array for all units or a 2D array
+        [unit, state] (e.g., from get_state). None to use the parameters.
+        '''
+
+        if stts is None:
+            self._stts_inp = None
+            return
+
+        assert self._n_unts is not None, 'Inputs not set!'
+
+        assert isinstance(stts, np.ndarray), type(stts)
+        assert stts.ndim in (1, 2), stts.ndim
+        assert np.issubdtype(stts.dtype, np.floating), stts.dtype
+        assert np.isfinite(stts).all(), stts
+
+        stts = np.array(
+            np.broadcast_to(stts, (self._n_unts, len(self._idxs_stts))),
+            dtype=np.float32)
+
+        abds_stts = self._abds_prms_arr[self._idxs_prms_stts]
+
+        assert (stts >= abds_stts[:, 0]).all(), stts
+        assert (stts <= abds_stts[:, 1]).all(), stts
+
+        self._stts_inp = stts
+        return
+
+    def run_model(self):
+
+        '''
+        Given all the variables set by all the setters before, run the model
+        for all units.
+        '''
+
+        assert self._tems is not None
+        assert self._ppts is not None
+        assert self._pets is not None
+
+        assert self._prms is not None
+        assert self._dslr is not None
+
+        if self._stts_inp is None:
+            stts = self._prms[:, self._idxs_prms_stts]
+
+        else:
+            stts = self._stts_inp.copy()
+
+        stts = np.ascontiguousarray(stts)
+
+        diss = np.empty((self._ppts.shape[0], self._n_unts), dtype=np.float32)
+
+        self._modl_bh(
+            self._tems,
+            self._ppts,
+            self._pets,
+            diss,
+            self._prms,
+            stts,
+            self._dslr)
+
+        self._diss = diss
+        self._stts_end = stts
+        return
+
+    def get_state(self):
+
+        '''
+        States of each unit at the end of the last run [unit, state].
+        '''
+
+        assert self._stts_end is not None, 'Model not run!'
+
+        return self._stts_end.copy()
+
+    def reset(self):
+
+        '''
+        Reinitiliaze everything correctly.
+        '''
+
+        self.__init__(self._bknd_inp)
+        return
+
+
+class HBV1D012ACats(_HBV012AUnits):
+
+    '''
+    Interface for running many catchments with the lumped 012A HBV at once
+    e.g., all those in cat_areas.csv. Each catchment has its own inputs,
+    parameters and discharge scaler. Running many catchments costs about
+    as much as running one with HBV1D012A, per catchment, without any
+    python loops.
+
+    Setters and getters work in the same way as those of HBV1D012A.
+    '''
+
+    def set_inputs(self, tems, ppts, pets):
+
+        '''
+        Inputs of the model. Each is either a 2D array with the dimensions
+        [catchment, time] or a 1D series [time] that is the same for all
+        catchments. The number of catchments is the largest number of rows.
+        Values must pass the same checks as in HBV1D012A.set_inputs.
+        '''
+
+        inps = [tems, ppts, pets]
+
+        for i, inp in enumerate(inps):
+
+            assert isinstance(inp, np.ndarray), type(inp)
+            assert inp.ndim in (1, 2), inp.ndim
+
+            # The kernel takes time as the first dimension.
+            if inp.ndim == 1:
+                inps[i] = inp[:, None]
+
+            else:
+                inps[i] = inp.T
+
+        n_cats = max([inp.shape[1] for inp in inps])
+
+        self._set_checked_inputs(*inps, n_cats)
+        return
+
+    def get_number_of_catchments(self):
+
+        '''
+        Number of catchments, known after set_inputs.
+        '''
+
+        assert self._n_unts is not None
+
+        return self._n_unts
+
+    def get_discharge(self):
+
+        '''
+        Simulated river flow of each catchment [catchment, time].
+        '''
+
+        return self._diss.T
+
+
+class HBV1D012ANest(HBV1D012ACats):
+
+    '''
+    Interface for nested catchments e.g., 10460 (Kreuzberg) inside 10420
+    (Altenahr). Each unit is the area between a gauge and the gauges
+    directly upstream of it, so that no area is simulated twice. The
+    discharge of a unit is routed to the gauge downstream of it with a lag
+    and a Muskingum stage. One run gives the discharge at all the gauges.
+
+    Inputs, parameters and discharge scalers are those of the units i.e.,
+    of the areas between the gauges (see get_local_areas). Otherwise,
+    setters and getters work in the same way as those of HBV1D012ACats.
+
+    Routing starts from a steady state in every run. It has no states that
+    are carried over.
+    '''
+
+    def __init__(self, bknd='auto'):
+
+        '''
+        Initiliaze everything correctly. See HBV1D012A for bknd.
+        '''
+
+        HBV1D012ACats.__init__(self, bknd)
+
+        self._dnst_idxs = None  # Unit directly downstream of each unit.
+        self._rtg_ordr = None  # Units from upstream to downstream.
+        self._lags = None  # Lag of each reach [time steps].
+        self._mkcs = None  # Muskingum coefficients of each reach.
+
+        self._gges = None  # Discharge simulated at each gauge [time, unit].
+        return
+
+    def set_inputs(self, tems, ppts, pets):
+
+        '''
+        Same as HBV1D012ACats.set_inputs. The network and the routing
+        parameters are reset, as the number of units may change. Call
+        set_network again afterwards.
+        '''
+
+        HBV1D012ACats.set_inputs(self, tems, ppts, pets)
+
+        self._dnst_idxs = None
+        self._rtg_ordr = None
+        self._lags = None
+        self._mkcs = None
+
+        self._gges = None
+        return
+
+    @staticmethod
+    def get_local_areas(cats_areas, dnst_idxs):
+
+        '''
+        Areas between each gauge and the gauges directly upstream of it,
+        given the area of each catchment (e.g., from cat_areas.csv) and the
+        network (see set_network). For discharge scalers.
+        '''
+
+        cats_areas = np.array(cats_areas, dtype=np.float64)
+        dnst_idxs = np.asarray(dnst_idxs)
+
+        assert cats_areas.shape == dnst_idxs.shape, (
+            cats_areas.shape, dnst_idxs.shape)
+
+        lcls_areas = cats_areas.copy()
+        for i, d in enumerate(dnst_idxs):
+            if d >= 0:
+                lcls_areas[d] -= cats_areas[i]
+
+        assert (lcls_areas > 0).all(), lcls_areas
+
+        return lcls_areas
+
+    def set_network(self, dnst_idxs):
+
+        '''
+        How the units are connected. dnst_idxs has the index of the unit
+        directly downstream of each unit, or -1 for the outlet(s). E.g., for
+        Kreuzberg (0) inside Altenahr (1), dnst_idxs is (1, -1). Routing is
+        set to no lag and no attenuation.
+
+        Should be called after set_inputs.
+        '''
+
+        assert self._n_unts is not None, 'Inputs not set!'
+
+        dnst_idxs = np.array(dnst_idxs, dtype=np.int64)
+
+        assert dnst_idxs.shape == (self._n_unts,), (
+            dnst_idxs.shape, self._n_unts)
+
+        assert ((dnst_idxs >= -1) & (dnst_idxs < self._n_unts)).all(), (
+            dnst_idxs)
+
+        assert (dnst_idxs != np.arange(self._n_unts)).all(), dnst_idxs
+
+        # Upstream units before downstream ones. A unit is routed after all
+        # units that flow into it.
+        n_upss = np.zeros(self._n_unts, dtype=np.int64)
+        for d in dnst_idxs[dnst_idxs >= 0]:
+            n_upss[d] += 1
+
+        rtg_ordr = []
+        cdts = [u for u in range(self._n_unts) if n_upss[u] == 0]
+        while cdts:
+            u = cdts.pop()
+            rtg_ordr.append(u)
+
+            d = dnst_idxs[u]
+            if d >= 0:
+                n_upss[d] -= 1
+
+                if n_upss[d] == 0:
+                    cdts.append(d)
+
+        assert len(rtg_ordr) == self._n_unts, 'Network has a loop!'
+
+        self._dnst_idxs = dnst_idxs
+        self._rtg_ordr = np.array(rtg_ordr, dtype=np.int64)
+
+        self.set_routing_parameters(0, 0.0, 0.0)
+        return
+
+    def set_routing_parameters(self, lags, mkm_ks, mkm_xs):
+
+        '''
+        Routing of the reach below each unit. Either a single value for all
+        or one per unit. Values of units at an outlet are not used.
+
+        lags: Lag in time steps, an integer.
+        mkm_ks: Muskingum K (storage constant) in time steps. Zero for no
+            attenuation.
+        mkm_xs: Muskingum X (weighting factor), between 0 and 0.5.
+
+        For the coefficients to be non-negative, 2 * K * X <= 1 <=
+        2 * K * (1 - X) must hold when K is not zero.
+        '''
+
+        assert self._dnst_idxs is not None, 'Network not set!'
+
+        lags = np.array(
+            np.broadcast_to(lags, (self._n_unts,)), dtype=np.int64)
+
+        mkm_ks = np.array(
+            np.broadcast_to(mkm_ks, (self._n_unts,)), dtype=np.float64)
+
+        mkm_xs = np.array(
+            np.broadcast_to(mkm_xs, (self._n_unts,)), dtype=np.float64)
+
+        assert (lags >= 0).all(), lags
+
+        assert np.isfinite(mkm_ks).all(), mkm_ks
+        assert (mkm_ks >= 0).all(), mkm_ks
+
+        assert np.isfinite(mkm_xs).all(), mkm_xs
+        assert ((mkm_xs >= 0) & (mkm_xs <= 0.5)).all(), mkm_xs
+
+        dnom = (2 * mkm_ks * (1 - mkm_xs)) + 1
+
+        mkcs = np.empty((self._n_unts, 3), dtype=np.float64)
+        mkcs[:, 0] = (1 - (2 * mkm_ks * mkm_xs)) / dnom
+        mkcs[:, 1] = (1 + (2 * mkm_ks * mkm_xs)) / dnom
+        mkcs[:, 2] = ((2 * mkm_ks * (1 - mkm_xs)) - 1) / dnom
+
+        # K of zero is no attenuation i.e., O[t] = I[t].
+        mkcs[mkm_ks == 0, :] = (1.0, 0.0, 0.0)
+
+        assert (mkcs >= 0).all(), (
+            'Muskingum coefficients are negative!', mkm_ks, mkm_xs)
+
+        self._lags = lags
+        self._mkcs = mkcs
+        return
+
+    def run_model(self):
+
+        '''
+        Given all the variables set by all the setters before, run the model
+        for all units and route the discharge to all gauges.
+        '''
+
+        assert self._dnst_idxs is not None, 'Network not set!'
+
+        HBV1D012ACats.run_model(self)
+
+        gges = np.empty_like(self._diss)
+
+        self._modl_rtg(
+            self._diss,
+            gges,
+            self._dnst_idxs,
+            self._rtg_ordr,
+            self._lags,
+            self._mkcs)
+
+        self._gges = gges
+        return
+
+    def get_discharge(self):
+
+        '''
+        Simulated river flow at each gauge [gauge, time].
+        '''
+
+        return self._gges.T
+
+    def get_local_discharge(self):
+
+        '''
+        Simulated river flow of each unit's own area, before routing
+        [unit, time].
+        '''
+
+        return self._diss.T
+
+
+class HBV2D012A(_HBV012AUnits):
+
+    '''
+    Interface for the distributed (gridded/2D) variant of the 012A HBV.
+
+    Each cell of a grid is a unit i.e., a lumped 012A HBV. The discharge at
+    the outlet of the catchment is the sum of the discharges of its cells.
+
+    Gridded inputs (e.g., the xarray DataArrays in hourly/OS_pcp/*.nc) are
+    taken as they are by set_inputs. Parameters can be different for each
+    cell.
+
+    Setters and getters work in the same way as those of HBV1D012A.
+    '''
+
+    def __init__(self, bknd='auto'):
+
+        '''
+        Initiliaze everything correctly. See HBV1D012A for bknd.
+        '''
+
+        _HBV012AUnits.__init__(self, bknd)
+
+        self._grid_shp = None  # Shape of the grid [y, x].
+        self._cels_idxs = None  # Flat grid indices of the simulated cells.
+        return
+
+    @staticmethod
+    def get_polygon_mask(crds_x, crds_y, plgn_x, plgn_y):
+
+        '''
+        A boolean array, with the shape of crds_x, that is True where the
+        point (crds_x, crds_y) lies inside the polygon with the vertices
+        (plgn_x, plgn_y). For example, the longitudes and latitudes of the
+        cell centers of an OS_pcp grid and the lon and lat columns of
+        metadata/Altenahr_shape.csv. The result can be used as cels_mask in
+        set_inputs.
+        '''
+
+        crds_x = np.asarray(crds_x)
+        crds_y = np.asarray(crds_y)
+
+        plgn_x = np.asarray(plgn_x)
+        plgn_y = np.asarray(plgn_y)
+
+        assert crds_x.shape == crds_y.shape, (crds_x.shape, crds_y.shape)
+
+        assert plgn_x.ndim == plgn_y.ndim == 1, (plgn_x.ndim, plgn_y.ndim)
+        assert plgn_x.size == plgn_y.size >= 3, (plgn_x.size, plgn_y.size)
+
+        # Ray casting. A point is inside when a ray from it crosses the
+        # edges an odd number of times.
+        mask = np.zeros(crds_x.shape, dtype=bool)
+
+        j = plgn_x.size - 1
+        for i in range(plgn_x.size):
+
+            xi, yi = plgn_x[i], plgn_y[i]
+            xj, yj = plgn_x[j], plgn_y[j]
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                crss = ((yi > crds_y) != (yj > crds_y)) & (
+                    crds_x < ((xj - xi) * (crds_y - yi) / (yj - yi)) + xi)
+
+            mask ^= crss
+
+            j = i
+
+        return mask
+
+    def set_inputs(self, tems, ppts, pets, cels_mask=None):
+
+        '''
+        Inputs of the model. Each is either a grid with the dimensions
+        [time, y, x] (numpy array or an xarray DataArray e.g.,
+        xr.open_dataset('hourly/OS_pcp/RW_cml.nc').RW) or a 1D series [time]
+        that is the same for all cells. At least one has to be a grid.
+        All grids must have the same shape.
+
+        cels_mask is a 2D boolean array [y, x] that is True for the cells to
+        simulate (see get_polygon_mask). By default, these are the cells
+        where all the gridded inputs are valid at all time steps. Inputs of
+        the simulated cells must pass the same checks as in
+        HBV1D012A.set_inputs.
+
+        The cells are numbered in the order of the flattened grid. Per cell
+        parameters, discharge scalers and states follow this order.
+        '''
+
+        inps = [np.asarray(inp) for inp in (tems, ppts, pets)]
+
+        assert all([inp.ndim in (1, 3) for inp in inps]), [
+            inp.ndim for inp in inps]
+
+        grds = [inp for inp in inps if inp.ndim == 3]
+
+        assert grds, 'At least one input has to be a grid!'
+
+        assert all([grd.shape == grds[0].shape for grd in grds]), [
+            grd.shape for grd in grds]
+
+        assert all([
+            inp.shape[0] == grds[0].shape[0] for inp in inps]), [
+                inp.shape for inp in inps]
+
+        grid_shp = grds[0].shape[1:]
+
+        if cels_mask is None:
+            cels_mask = np.ones(grid_shp, dtype=bool)
+
+            for grd in grds:
+                cels_mask &= np.isfinite(grd).all(axis=0)
+
+        cels_mask = np.asarray(cels_mask)
+
+        assert cels_mask.shape == grid_shp, (cels_mask.shape, grid_shp)
+        assert cels_mask.dtype == np.bool_, cels_mask.dtype
+        assert cels_mask.any(), 'No cells to simulate!'
+
+        cels_idxs = np.flatnonzero(cels_mask)
+
+        for i, inp in enumerate(inps):
+
+            if inp.ndim == 3:
+                inps[i] = inp.reshape(inp.shape[0], -1)[:, cels_idxs]
+
+            else:
+                inps[i] = inp[:, None]
+
+        self._set_checked_inputs(*inps, cels_idxs.size)
+
+        self._grid_shp = grid_shp
+        self._cels_idxs = cels_idxs
+        return
+
+    def get_number_of_cells(self):
+
+        '''
+        Number of simulated cells, known after set_inputs.
+        '''
+
+        assert self._cels_idxs is not None
+
+        return self._cels_idxs.size
+
+    def set_parameters(self, prms):
+
+        '''
+        Model parameters, after set_inputs. Either a 1D array, same for all
+        cells, or a 2D array [cell, parameter] or a 3D grid
+        [y, x, parameter]. Each parameter set must pass the same conditions
+        as in HBV1D012A.set_parameters.
+        '''
+
+        assert self._cels_idxs is not None, 'Inputs not set!'
+
+        assert isinstance(prms, np.ndarray), type(prms)
+
+        if prms.ndim == 3:
+            assert prms.shape[:2] == self._grid_shp, (
+                prms.shape[:2], self._grid_shp)
+
+            prms = prms.reshape(-1, prms.shape[-1])[self._cels_idxs]
+
+        _HBV012AUnits.set_parameters(self, prms)
+        return
+
+    def get_discharge(self):
+
+        '''
+        Simulated river flow of each cell [time, cell].
+        '''
+
+        return self._diss
+
+    def get_outlet_discharge(self):
+
+        '''
+        Simulated river flow at the outlet [time]. The sum of the
+        discharge of all the cells.
+        '''
+
+        return self._diss.sum(axis=1)
+
+    def get_discharge_grid(self):
+
+        '''
+        Simulated river flow of each cell as a grid [time, y, x]. NaN for
+        the cells that were not simulated.
+        '''
+
+        diss_grd = np.full(
+            (self._diss.shape[0], np.prod(self._grid_shp)),
+            np.nan,
+            dtype=np.float32)
+
+        diss_grd[:, self._cels_idxs] = self._diss
+
+        return diss_grd.reshape(-1, *self._grid_shp)
+
+
+def _get_abds_prms_arr(idxs_prms, abds_prms):
+
+    '''
+    Absolute parameter bounds as an array, in the order of the parameter
+    indices, for checking many parameters at once.
+    '''
+
+    abds_prms_arr = np.empty((len(idxs_prms), 2), dtype=np.float32)
+
+    for prm_lbl, idx in idxs_prms.items():
+        abds_prms_arr[idx, :] = abds_prms[prm_lbl]
+
+    return abds_prms_arr
+
+
+def _get_idxs_of_stts(idxs, idxs_stts):
+
+    '''
+    Indices in idxs (of the parameters or of the outputs) of the states, in
+    the order of the state indices.
+    '''
+
+    idxs_of_stts = np.empty(len(idxs_stts), dtype=np.int64)
+
+    for stt_lbl, idx in idxs_stts.items():
+        idxs_of_stts[idx] = idxs[stt_lbl]
+
+    return idxs_of_stts
+
+
+def _load_bknd(bknd):
+
+    '''
+    Import the backend with the label bknd ('auto' for the fastest available)
+    and return its label with the dictionary of its kernels and indices.
+    The py backend is returned if the requested one cannot be imported.
+    '''
+
+    assert bknd in (('auto',) + tuple(_bknds_ldrs)), (
+        bknd, tuple(_bknds_ldrs))
+
+    if bknd == 'auto':
+        bknds = tuple(_bknds_ldrs)
+
+    else:
+        bknds = (bknd, 'py')
+
+    for bknd_lbl in bknds:
+
+        try:
+            bknd_dict = _bknds_ldrs[bknd_lbl]()
+
+        except ImportError:
+            if bknd == bknd_lbl:
+                print(
+                    f'Could not import the {bknd_lbl} backend of '
+                    f'HBV 012A, using the py one instead!')
+
+            continue
+
+        break
+
+    return bknd_lbl, bknd_dict
+
+
+def _get_nb_bknd():
+
+    '''
+    The numba (JIT-compiled) version. Compilation happens once per machine.
+    '''
+
+    from .hbv1d012a_nb import (
+        hbv1d012a_nb,
+        hbv1d012a_dis_nb,
+        hbv1d012a_sel_nb,
+        hbv1d012a_bh_nb,
+        hbv1d012a_bh_sse_nb,
+        hbv1d012a_rtg_nb,
+        get_idxs_prms_nb,
+        get_idxs_otps_nb,
+        get_abds_prms_nb,
+        get_idxs_stts_nb)
+
+    bknd_dict = {
+        'modl': hbv1d012a_nb,
+        'modl_dis': hbv1d012a_dis_nb,
+        'modl_sel': hbv1d012a_sel_nb,
+        'modl_bh': hbv1d012a_bh_nb,
+        'modl_bh_sse': hbv1d012a_bh_sse_nb,
+        'modl_rtg': hbv1d012a_rtg_nb,
+        'idxs_prms': get_idxs_prms_nb(),
+        'idxs_otps': get_idxs_otps_nb(),
+        'abds_prms': get_abds_prms_nb(),
+        'idxs_stts': get_idxs_stts_nb(),
+        }
+
+    return bknd_dict
+
+
+def _get_py_bknd():
+
+    '''
+    The reference (pure python) version. Slowest, but needs numpy only.
+    '''
+
+    from .hbv1d012a_py import (
+        hbv1d012a_py,
+        hbv1d012a_dis_py,
+        hbv1d012a_sel_py,
+        hbv1d012a_bh_py,
+        hbv1d012a_bh_sse_py,
+        hbv1d012a_rtg_py,
+        get_idxs_prms_py,
+        get_idxs_otps_py,
+        get_abds_prms_py,
+        get_idxs_stts_py)
+
+    bknd_dict = {
+        'modl': hbv1d012a_py,
+        'modl_dis': hbv1d012a_dis_py,
+        'modl_sel': hbv1d012a_sel_py,
+        'modl_bh': hbv1d012a_bh_py,
+        'modl_bh_sse': hbv1d012a_bh_sse_py,
+        'modl_rtg': hbv1d012a_rtg_py,
+        'idxs_prms': get_idxs_prms_py(),
+        'idxs_otps': get_idxs_otps_py(),
+        'abds_prms': get_abds_prms_py(),
+        'idxs_stts': get_idxs_stts_py(),
+        }
+
+    return bknd_dict
+
+
+# Labels of all backends and the functions that import them, in the order of
+# preference when HBV1D012A is asked for the 'auto' backend.
+# The cython version (hbv1d012a_cy, 464 times faster than the py version) is
+# not shipped anymore. The nb version replaces it.
+_bknds_ldrs = {
+    'nb': _get_nb_bknd,
+    'py': _get_py_bknd,
+    }
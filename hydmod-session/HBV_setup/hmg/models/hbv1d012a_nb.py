@@ -0,0 +1,234 @@
+'''
+Created on Oct 18, 2026
+
+@author: Faizan
+
+Numba (JIT-compiled) backend of the 012A variant of HBV.
+
+The process equations are not repeated here. The kernels of hbv1d012a_py
+are compiled as they are, so that both backends always describe the same
+model. Only numba is needed in addition to the py version.
+
+The arithmetic of the kernels is in float32 explicitly (see ZERO and ONE in
+hbv1d012a_py). numba would otherwise widen parts of it to float64, and the
+discharge would drift away from that of the py version wherever a
+threshold is crossed differently. Both give the same values now.
+The tests allow a relative difference of 1e-6 only, for the pow of the
+C library that each may use.
+'''
+
+from types import FunctionType
+
+from numba import njit
+
+from .hbv1d012a_py import (
+    _hbv1d012a,
+    _hbv1d012a_bh,
+    _hbv1d012a_bh_sse,
+    _hbv1d012a_dis,
+    _hbv1d012a_rtg,
+    _hbv1d012a_sel,
+    _hbv1d012a_stp,
+    get_idxs_prms_py,
+    get_idxs_otps_py,
+    get_abds_prms_py,
+    get_idxs_stts_py)
+
+
+def _jit(func, **jfns):
+
+    '''
+    Compile a function of the py version. Functions that func calls are
+    replaced by their compiled versions, given as keyword arguments jfns
+    (the label is the name of the called function).
+
+    The compiled functions are cached on disk (next to hbv1d012a_py.py).
+    Compilation takes place only once per machine and signature.
+
+    Divisions by zero give inf or NaN, like they do in the py version,
+    instead of raising ZeroDivisionError (numba's default). Parameters such
+    as sl0_fcy and sl1_pwp have a lower bound of zero.
+    '''
+
+    if jfns:
+        func = FunctionType(
+            func.__code__,
+            {**func.__globals__, **jfns},
+            func.__name__,
+            func.__defaults__,
+            func.__closure__)
+
+    return njit(cache=True, error_model='numpy')(func)
+
+
+_hbv1d012a_stp_nb = _jit(_hbv1d012a_stp)
+
+_hbv1d012a_nb = _jit(_hbv1d012a, _hbv1d012a_stp=_hbv1d012a_stp_nb)
+
+_hbv1d012a_dis_nb = _jit(_hbv1d012a_dis, _hbv1d012a_stp=_hbv1d012a_stp_nb)
+_hbv1d012a_sel_nb = _jit(_hbv1d012a_sel, _hbv1d012a_stp=_hbv1d012a_stp_nb)
+_hbv1d012a_bh_nb = _jit(_hbv1d012a_bh, _hbv1d012a_stp=_hbv1d012a_stp_nb)
+
+_hbv1d012a_bh_sse_nb = _jit(
+    _hbv1d012a_bh_sse, _hbv1d012a_stp=_hbv1d012a_stp_nb)
+
+_hbv1d012a_rtg_nb = _jit(_hbv1d012a_rtg)
+
+#==============================================================================
+# Functions for indices outside numba. Same as those of the py version.
+#==============================================================================
+
+
+def get_idxs_prms_nb():
+
+    return get_idxs_prms_py()
+
+
+def get_idxs_otps_nb():
+
+    return get_idxs_otps_py()
+
+
+def get_abds_prms_nb():
+
+    return get_abds_prms_py()
+
+
+def get_idxs_stts_nb():
+
+    return get_idxs_stts_py()
+#==============================================================================
+
+#==============================================================================
+# The model.
+#==============================================================================
+
+
+def hbv1d012a_nb(
+        tems,
+        ppts,
+        pets,
+        otps,
+        diss,
+        prms,
+        oflg,
+        dslr):
+
+    _hbv1d012a_nb(
+        tems,
+        ppts,
+        pets,
+        otps,
+        diss,
+        prms,
+        oflg,
+        dslr)
+    return
+
+
+def hbv1d012a_dis_nb(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr):
+
+    _hbv1d012a_dis_nb(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr)
+    return
+
+
+def hbv1d012a_sel_nb(
+        tems,
+        ppts,
+        pets,
+        otps,
+        diss,
+        prms,
+        stts,
+        dslr,
+        otps_idxs,
+        aggs_idxs):
+
+    _hbv1d012a_sel_nb(
+        tems,
+        ppts,
+        pets,
+        otps,
+        diss,
+        prms,
+        stts,
+        dslr,
+        otps_idxs,
+        aggs_idxs)
+    return
+
+
+def hbv1d012a_bh_nb(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr):
+
+    _hbv1d012a_bh_nb(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr)
+    return
+
+
+def hbv1d012a_bh_sse_nb(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr,
+        diso,
+        sses):
+
+    _hbv1d012a_bh_sse_nb(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr,
+        diso,
+        sses)
+    return
+
+
+def hbv1d012a_rtg_nb(
+        diss,
+        gges,
+        dnst_idxs,
+        rtg_ordr,
+        lags,
+        mkcs):
+
+    _hbv1d012a_rtg_nb(
+        diss,
+        gges,
+        dnst_idxs,
+        rtg_ordr,
+        lags,
+        mkcs)
+    return
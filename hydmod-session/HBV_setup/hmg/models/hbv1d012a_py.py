@@ -11,6 +11,14 @@ import numpy as np
 PINF = +np.float32(np.inf)
 NINF = -np.float32(np.inf)
 
+# Constants of the model equations. Being float32, like the inputs, the
+# parameters and the states, all of the arithmetic of a time step is in
+# float32, in python as well as in numba (which takes integer and python
+# float constants as float64). powf is evaluated in float64 and its result
+# is rounded to float32.
+ZERO = np.float32(0.0)
+ONE = np.float32(1.0)
+
 #==============================================================================
 # Variables for the model below.
 #
@@ -112,6 +120,18 @@ out_rnf_gnd_i = out_rnf_sfc_i + 1  # Underground RNF [L/T].
 out_mod_bal_i = out_rnf_gnd_i + 1  # Water balance [L/T].
 #==============================================================================
 
+#==============================================================================
+# State indices. The storages that carry over from one time step to the
+# next. Their initial values are parameters with the same labels.
+#==============================================================================
+
+stt_snw_dth_i = 0  # Snow depth [L].
+stt_sl0_mse_i = stt_snw_dth_i + 1  # Soil 0 depth [L].
+stt_sl1_mse_i = stt_sl0_mse_i + 1  # Soil 1 depth [L].
+stt_urr_dth_i = stt_sl1_mse_i + 1  # URR depth [L].
+stt_lrr_dth_i = stt_urr_dth_i + 1  # LRR depth [L].
+#==============================================================================
+
 #==============================================================================
 # Functions for indices outside cython.
 #==============================================================================
@@ -228,6 +248,19 @@ def get_abds_prms_py():
     }
 
     return buds
+
+
+def get_idxs_stts_py():
+
+    cmbs = {
+        'snw_dth': stt_snw_dth_i,
+        'sl0_mse': stt_sl0_mse_i,
+        'sl1_mse': stt_sl1_mse_i,
+        'urr_dth': stt_urr_dth_i,
+        'lrr_dth': stt_lrr_dth_i,
+    }
+
+    return cmbs
 #==============================================================================
 
 #==============================================================================
@@ -257,6 +290,114 @@ def hbv1d012a_py(
     return
 
 
+def hbv1d012a_dis_py(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr):
+
+    _hbv1d012a_dis(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr)
+    return
+
+
+def hbv1d012a_sel_py(
+        tems,
+        ppts,
+        pets,
+        otps,
+        diss,
+        prms,
+        stts,
+        dslr,
+        otps_idxs,
+        aggs_idxs):
+
+    _hbv1d012a_sel(
+        tems,
+        ppts,
+        pets,
+        otps,
+        diss,
+        prms,
+        stts,
+        dslr,
+        otps_idxs,
+        aggs_idxs)
+    return
+
+
+def hbv1d012a_bh_py(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr):
+
+    _hbv1d012a_bh(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr)
+    return
+
+
+def hbv1d012a_rtg_py(
+        diss,
+        gges,
+        dnst_idxs,
+        rtg_ordr,
+        lags,
+        mkcs):
+
+    _hbv1d012a_rtg(
+        diss,
+        gges,
+        dnst_idxs,
+        rtg_ordr,
+        lags,
+        mkcs)
+    return
+
+
+def hbv1d012a_bh_sse_py(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr,
+        diso,
+        sses):
+
+    _hbv1d012a_bh_sse(
+        tems,
+        ppts,
+        pets,
+        diss,
+        prms,
+        stts,
+        dslr,
+        diso,
+        sses)
+    return
+
+
 def _hbv1d012a(tems, ppts, pets, otps, diss, prms, oflg, dslr):
 
     '''
@@ -287,30 +428,6 @@ def _hbv1d012a(tems, ppts, pets, otps, diss, prms, oflg, dslr):
     '''
 
     nt = otps.shape[0]
-    #==========================================================================
-
-    prm_snw_ast = prms[prm_snw_ast_i]
-    prm_snw_amt = prms[prm_snw_amt_i]
-    prm_snw_amf = prms[prm_snw_amf_i]
-    prm_snw_pmf = prms[prm_snw_pmf_i]
-
-    prm_sl0_fcy = prms[prm_sl0_fcy_i]
-    prm_sl0_bt0 = prms[prm_sl0_bt0_i]
-
-    prm_sl1_pwp = prms[prm_sl1_pwp_i]
-    prm_sl1_fcy = prms[prm_sl1_fcy_i]
-    prm_sl1_bt0 = prms[prm_sl1_bt0_i]
-
-    prm_urr_rsr = prms[prm_urr_rsr_i]
-    prm_urr_tdh = prms[prm_urr_tdh_i]
-    prm_urr_tdr = prms[prm_urr_tdr_i]
-    prm_urr_cst = prms[prm_urr_cst_i]
-    prm_urr_dro = prms[prm_urr_dro_i]
-    prm_urr_ulc = prms[prm_urr_ulc_i]
-
-    prm_lrr_tdh = prms[prm_lrr_tdh_i]
-    prm_lrr_cst = prms[prm_lrr_cst_i]
-    prm_lrr_dro = prms[prm_lrr_dro_i]
 
     for t in range(nt):
 
@@ -322,68 +439,58 @@ def _hbv1d012a(tems, ppts, pets, otps, diss, prms, oflg, dslr):
         #======================================================================
 
         # Inputs.
-        tem = tems[t]
         ppt = ppts[t]
-        pet = pets[t]
-        #======================================================================
-
-        #======================================================================
-        # Snowpack formation and melt parameters.
         #======================================================================
 
+        # States at the end of the previous time step.
         if t == 0:
             lpv_snw_dth = prms[prm_snw_dth_i]
-
-        elif oflg:
-            lpv_snw_dth = otps[tt, out_snw_dth_i]
+            lpv_sl0_mse = prms[prm_sl0_mse_i]
+            lpv_sl1_mse = prms[prm_sl1_mse_i]
+            lpv_urr_dth = prms[prm_urr_dth_i]
+            lpv_lrr_dth = prms[prm_lrr_dth_i]
 
         else:
-            lpv_snw_dth = otps[t - 1, out_snw_dth_i]
-        #======================================================================
-
-        # Snowpack formation and melt.
-        lpv_snw_aim = 0
-        lpv_snw_pim = 0
-        lpv_snw_mlt = 0
-        lpv_snw_lpt = 0
-
-        if (lpv_snw_dth > 0) and (tem > prm_snw_amt):
-
-            # Air induced snow melt.
-            lpv_snw_aim = tem - prm_snw_amt
-            lpv_snw_aim *= prm_snw_amf
-            lpv_snw_aim = min(lpv_snw_dth, lpv_snw_aim)
-
-            if lpv_snw_aim > 0:
-
-                lpv_snw_dth -= lpv_snw_aim
-                lpv_snw_mlt += lpv_snw_aim
-
-            if ppt > 0:
-
-                lpv_snw_lpt = ppt
-
-                if (prm_snw_pmf > 0) and (lpv_snw_dth > 0):
+            if oflg:
+                pt = tt
 
-                    # Precipitation induced snow melt.
-                    # TODO: ppt can also freeze when little!
-                    lpv_snw_pim = tem - prm_snw_amt
-                    lpv_snw_pim *= prm_snw_pmf * ppt
-                    lpv_snw_pim = min(lpv_snw_dth, lpv_snw_pim)
-
-                    if lpv_snw_pim > 0:
-
-                        lpv_snw_dth -= lpv_snw_pim
-                        lpv_snw_mlt += lpv_snw_pim
-
-        elif (tem <= prm_snw_ast) and (ppt > 0):
-
-            lpv_snw_dth += ppt
+            else:
+                pt = t - 1
 
-        elif (tem > prm_snw_ast) and (ppt > 0):
+            lpv_snw_dth = otps[pt, out_snw_dth_i]
+            lpv_sl0_mse = otps[pt, out_sl0_mse_i]
+            lpv_sl1_mse = otps[pt, out_sl1_mse_i]
+            lpv_urr_dth = otps[pt, out_urr_dth_i]
+            lpv_lrr_dth = otps[pt, out_lrr_dth_i]
+        #======================================================================
 
-            # Liquid precipitation.
-            lpv_snw_lpt = ppt
+        # The processes. See _hbv1d012a_stp.
+        (lpv_snw_dth,
+         lpv_snw_lpt,
+         lpv_snw_aim,
+         lpv_snw_pim,
+         lpv_snw_mlt,
+         lpv_sl0_mse,
+         lpv_sl1_mse,
+         lpv_sl0_prf,
+         lpv_sl0_arf,
+         lpv_sl1_etn,
+         lpv_urr_dth,
+         lpv_lrr_dth,
+         lpv_urr_rnf,
+         lpv_urr_pln,
+         lpv_lrr_rnf,
+         lpv_rnf_sfc,
+         lpv_rnf_gnd) = _hbv1d012a_stp(
+            tems[t],
+            ppt,
+            pets[t],
+            prms,
+            lpv_snw_dth,
+            lpv_sl0_mse,
+            lpv_sl1_mse,
+            lpv_urr_dth,
+            lpv_lrr_dth)
         #======================================================================
 
         otps[tt, out_snw_dth_i] = lpv_snw_dth
@@ -391,178 +498,21 @@ def _hbv1d012a(tems, ppts, pets, otps, diss, prms, oflg, dslr):
         otps[tt, out_snw_aim_i] = lpv_snw_aim
         otps[tt, out_snw_pim_i] = lpv_snw_pim
         otps[tt, out_snw_mlt_i] = lpv_snw_mlt
-        #======================================================================
-
-        #======================================================================
-        # Evapotranspiration, infiltration, soil moisture and runoff.
-        # Soil layer 0 is for runoff only.
-        # Soil layer 1 is for evapotranspiration only.
-        #======================================================================
-
-        # Previous soil moistures.
-        if t == 0:
-            lpv_sl0_mse = prms[prm_sl0_mse_i]
-            lpv_sl1_mse = prms[prm_sl1_mse_i]
-
-        elif oflg:
-            lpv_sl0_mse = otps[tt, out_sl0_mse_i]
-            lpv_sl1_mse = otps[tt, out_sl1_mse_i]
-
-        else:
-            lpv_sl0_mse = otps[t - 1, out_sl0_mse_i]
-            lpv_sl1_mse = otps[t - 1, out_sl1_mse_i]
-        #======================================================================
-
-        # Potential runoff from snow melt and liquid water.
-        lpv_sl0_prf = lpv_snw_lpt + lpv_snw_mlt
-
-        # Actual runoff.
-        lpv_sl0_arf = 0
-
-        # Remaining runoff.
-        lpv_sl0_rrm = lpv_sl0_prf
-        #======================================================================
-
-        if lpv_sl0_rrm:
-
-            # Relative amount that becomes runoff.
-            lpv_sl0_ror = powf(lpv_sl0_mse / prm_sl0_fcy, prm_sl0_bt0)
-
-            if lpv_sl0_ror > 1: lpv_sl0_ror = 1
-
-            # Infiltration.
-            lpv_sl0_iln = min(
-                lpv_sl0_rrm * (1 - lpv_sl0_ror), prm_sl0_fcy - lpv_sl0_mse)
-
-            if lpv_sl0_iln < 0: lpv_sl0_iln = 0
-
-            lpv_sl0_mse += lpv_sl0_iln
-            lpv_sl0_rrm -= lpv_sl0_iln
-
-            lpv_sl0_arf += lpv_sl0_rrm
-            lpv_sl0_rrm = 0
-        #======================================================================
-
-        # Evapotranspiration.
-        lpv_sl1_epr = lpv_sl1_mse / prm_sl1_pwp
-
-        if lpv_sl1_epr > 1: lpv_sl1_epr = 1
-
-        lpv_sl1_etn = lpv_sl1_epr * pet
-        lpv_sl1_etn = min(lpv_sl1_mse, lpv_sl1_etn)
-
-        lpv_sl1_mse -= lpv_sl1_etn
-        #======================================================================
-
-        # Transfer of moisture from layer 0 to 1.
-        if (lpv_sl0_mse > 0) and (lpv_sl1_mse < prm_sl1_fcy):
-
-            lpv_sl0_sl1 = lpv_sl0_mse * powf(
-                1 - (lpv_sl1_mse / prm_sl1_fcy), prm_sl1_bt0)
-
-            lpv_sl0_sl1 = min(lpv_sl0_sl1, prm_sl1_fcy - lpv_sl1_mse)
-
-            lpv_sl0_mse -= lpv_sl0_sl1
-            lpv_sl1_mse += lpv_sl0_sl1
-
-            # This lead to numerical errors, somehow.
-            # Possibly due to negative inputs of powf?
-            # if lpv_sl1_mse > prm_sl1_fcy:
-            #     lpv_sl0_mse += lpv_sl1_mse - prm_sl1_fcy
-            #     lpv_sl1_mse = prm_sl1_fcy
-            #
-            #     acts[t, prm_sl1_fcy_i] += 1
-            #
-            #     # Just in case.
-            #     if lpv_sl0_mse > prm_sl0_fcy:
-            #         lpv_sl0_arf += lpv_sl0_mse - prm_sl0_fcy
-            #         lpv_sl0_mse = prm_sl0_fcy
-            #
-            #         acts[t, prm_sl0_fcy_i] += 1
-        #======================================================================
 
         otps[tt, out_sl0_mse_i] = lpv_sl0_mse
         otps[tt, out_sl1_mse_i] = lpv_sl1_mse
         otps[tt, out_sl0_prf_i] = lpv_sl0_prf
         otps[tt, out_sl0_arf_i] = lpv_sl0_arf
         otps[tt, out_sl1_etn_i] = lpv_sl1_etn
-        #======================================================================
-
-        #======================================================================
-        # Runoff routing within cell/catchment (non-channel).
-        #======================================================================
-
-        # Previous upper and lower reservoir states.
-        if t == 0:
-            lpv_urr_dth = prms[prm_urr_dth_i]
-            lpv_lrr_dth = prms[prm_lrr_dth_i]
-
-        elif oflg:
-            lpv_urr_dth = otps[tt, out_urr_dth_i]
-            lpv_lrr_dth = otps[tt, out_lrr_dth_i]
-
-        else:
-            lpv_urr_dth = otps[t - 1, out_urr_dth_i]
-            lpv_lrr_dth = otps[t - 1, out_lrr_dth_i]
-
-        lpv_rnf_sfc = 0
-        lpv_rnf_gnd = 0
-        #======================================================================
-
-        # Upper reservoir.
-        lpv_urr_dth += lpv_sl0_arf * (1 - prm_urr_rsr)
-        #======================================================================
-
-        # Runoff from upper and lower outlets of the upper reservoir.
-        if lpv_urr_dth > prm_urr_tdh:
-
-            lpv_rnf_sfc += (lpv_urr_dth - prm_urr_tdh) * prm_urr_tdr
-            lpv_urr_dth -= (lpv_urr_dth - prm_urr_tdh) * prm_urr_tdr
-
-        lpv_urr_rnf = lpv_urr_dth * prm_urr_cst
-
-        lpv_urr_dth -= lpv_urr_rnf
-
-        lpv_rnf_sfc += lpv_urr_rnf * prm_urr_dro
-        lpv_rnf_gnd += lpv_urr_rnf * (1 - prm_urr_dro)
-        #======================================================================
-
-        # Percolation from upper to lower reservoir.
-        if lpv_lrr_dth < prm_lrr_tdh:
-            lpv_urr_pln = lpv_urr_dth * prm_urr_ulc
-            lpv_urr_pln *= 1 - (lpv_lrr_dth / prm_lrr_tdh)
-
-        else:
-            lpv_urr_pln = 0
-
-        lpv_urr_dth -= lpv_urr_pln
-        #======================================================================
 
         otps[tt, out_urr_rnf_i] = lpv_urr_rnf
         otps[tt, out_urr_pln_i] = lpv_urr_pln
-        #======================================================================
-
-        # Lower reservoir.
-        lpv_lrr_rnf = lpv_lrr_dth * prm_lrr_cst
-
-        lpv_lrr_dth -= lpv_lrr_rnf
-        lpv_lrr_dth += lpv_urr_pln
-
-        lpv_rnf_sfc += lpv_lrr_rnf * prm_lrr_dro
-        lpv_rnf_gnd += lpv_lrr_rnf * (1 - prm_lrr_dro)
-        #======================================================================
 
         otps[tt, out_lrr_dth_i] = lpv_lrr_dth
         otps[tt, out_lrr_rnf_i] = lpv_lrr_rnf
-        #======================================================================
-
-        # Upper reservoir update.
-        lpv_urr_dth += lpv_sl0_arf * prm_urr_rsr
 
         otps[tt, out_urr_dth_i] = lpv_urr_dth
-        #======================================================================
 
-        # Surface and Groundwater runoff update.
         otps[tt, out_rnf_sfc_i] = lpv_rnf_sfc
         otps[tt, out_rnf_gnd_i] = lpv_rnf_gnd
         #======================================================================
@@ -605,3 +555,616 @@ def _hbv1d012a(tems, ppts, pets, otps, diss, prms, oflg, dslr):
                     (lpv_lrr_dth - otps[t - 1, out_lrr_dth_i]))
         #======================================================================
     return
+
+
+def _hbv1d012a_dis(tems, ppts, pets, diss, prms, stts, dslr):
+
+    '''
+    Same model as _hbv1d012a, for optimization runs. Only the discharge is
+    written. The states are carried from one time step to the next in stts,
+    instead of in an outputs array. Being float32, like the outputs array,
+    and with the same _hbv1d012a_stp, the discharge is the same as that of
+    _hbv1d012a.
+
+    Parameters:
+        tems: Temperature [time]
+        ppts: Precipitation [time]
+        pets: Potential evapotranspiration [time]
+        diss: Discharge that flows out on surface [time]
+        prms: Model parameters [parameter]
+        stts: States at the start, overwritten by those at the end [state]
+        dslr: Discharge scaler
+    '''
+
+    nt = diss.shape[0]
+
+    for t in range(nt):
+
+        (lpv_snw_dth,
+         _, _, _, _,
+         lpv_sl0_mse,
+         lpv_sl1_mse,
+         _, _, _,
+         lpv_urr_dth,
+         lpv_lrr_dth,
+         _, _, _,
+         lpv_rnf_sfc,
+         _) = _hbv1d012a_stp(
+            tems[t],
+            ppts[t],
+            pets[t],
+            prms,
+            stts[stt_snw_dth_i],
+            stts[stt_sl0_mse_i],
+            stts[stt_sl1_mse_i],
+            stts[stt_urr_dth_i],
+            stts[stt_lrr_dth_i])
+
+        stts[stt_snw_dth_i] = lpv_snw_dth
+        stts[stt_sl0_mse_i] = lpv_sl0_mse
+        stts[stt_sl1_mse_i] = lpv_sl1_mse
+        stts[stt_urr_dth_i] = lpv_urr_dth
+        stts[stt_lrr_dth_i] = lpv_lrr_dth
+
+        # River discharge.
+        diss[t] = lpv_rnf_sfc * dslr
+    return
+
+
+def _hbv1d012a_sel(
+        tems, ppts, pets, otps, diss, prms, stts, dslr, otps_idxs, aggs_idxs):
+
+    '''
+    Same model as _hbv1d012a, for regular runs where only some of the
+    outputs are needed and/or the outputs are summed over periods of time
+    steps (e.g., days or months). The mass balance is computed only when
+    it is one of the selected outputs.
+
+    Parameters:
+        tems: Temperature [time]
+        ppts: Precipitation [time]
+        pets: Potential evapotranspiration [time]
+        otps: Outputs, zeros at the start [period, selected variable]
+        diss: Discharge that flows out on surface [time]
+        prms: Model parameters [parameter]
+        stts: States at the start, overwritten by those at the end [state]
+        dslr: Discharge scaler
+        otps_idxs: Output index of each column of otps [selected variable]
+        aggs_idxs: Row of otps that each time step is added to [time]
+    '''
+
+    nt = diss.shape[0]
+    no = otps_idxs.shape[0]
+
+    mbal_flg = False
+    for j in range(no):
+        if otps_idxs[j] == out_mod_bal_i:
+            mbal_flg = True
+
+    # All outputs of a time step. Of the same type as otps so that the
+    # states are as precise as those of _hbv1d012a.
+    flxs = np.zeros(out_mod_bal_i + 1, dtype=otps.dtype)
+
+    lpv_snw_dth = stts[stt_snw_dth_i]
+    lpv_sl0_mse = stts[stt_sl0_mse_i]
+    lpv_sl1_mse = stts[stt_sl1_mse_i]
+    lpv_urr_dth = stts[stt_urr_dth_i]
+    lpv_lrr_dth = stts[stt_lrr_dth_i]
+
+    for t in range(nt):
+
+        ppt = ppts[t]
+
+        (flxs[out_snw_dth_i],
+         flxs[out_snw_lpt_i],
+         flxs[out_snw_aim_i],
+         flxs[out_snw_pim_i],
+         flxs[out_snw_mlt_i],
+         flxs[out_sl0_mse_i],
+         flxs[out_sl1_mse_i],
+         flxs[out_sl0_prf_i],
+         flxs[out_sl0_arf_i],
+         flxs[out_sl1_etn_i],
+         flxs[out_urr_dth_i],
+         flxs[out_lrr_dth_i],
+         flxs[out_urr_rnf_i],
+         flxs[out_urr_pln_i],
+         flxs[out_lrr_rnf_i],
+         flxs[out_rnf_sfc_i],
+         flxs[out_rnf_gnd_i]) = _hbv1d012a_stp(
+            tems[t],
+            ppt,
+            pets[t],
+            prms,
+            lpv_snw_dth,
+            lpv_sl0_mse,
+            lpv_sl1_mse,
+            lpv_urr_dth,
+            lpv_lrr_dth)
+
+        # Mass Balance. Values should all be zeros.
+        if mbal_flg:
+            flxs[out_mod_bal_i] = ppt - (
+                flxs[out_sl1_etn_i] +
+                flxs[out_rnf_sfc_i] +
+                flxs[out_rnf_gnd_i])
+
+            flxs[out_mod_bal_i] -= (
+                (flxs[out_snw_dth_i] - lpv_snw_dth) +
+                (flxs[out_sl0_mse_i] - lpv_sl0_mse) +
+                (flxs[out_sl1_mse_i] - lpv_sl1_mse) +
+                (flxs[out_urr_dth_i] - lpv_urr_dth) +
+                (flxs[out_lrr_dth_i] - lpv_lrr_dth))
+
+        lpv_snw_dth = flxs[out_snw_dth_i]
+        lpv_sl0_mse = flxs[out_sl0_mse_i]
+        lpv_sl1_mse = flxs[out_sl1_mse_i]
+        lpv_urr_dth = flxs[out_urr_dth_i]
+        lpv_lrr_dth = flxs[out_lrr_dth_i]
+
+        # River discharge.
+        diss[t] = flxs[out_rnf_sfc_i] * dslr
+
+        for j in range(no):
+            otps[aggs_idxs[t], j] += flxs[otps_idxs[j]]
+
+    stts[stt_snw_dth_i] = lpv_snw_dth
+    stts[stt_sl0_mse_i] = lpv_sl0_mse
+    stts[stt_sl1_mse_i] = lpv_sl1_mse
+    stts[stt_urr_dth_i] = lpv_urr_dth
+    stts[stt_lrr_dth_i] = lpv_lrr_dth
+    return
+
+
+def _hbv1d012a_bh(tems, ppts, pets, diss, prms, stts, dslr):
+
+    '''
+    Same model as _hbv1d012a, but for many units (parameter sets, catchments,
+    cells, etc.) at once. All units are moved forward by one time step
+    before going to the next one. Only the discharge is written.
+
+    Parameters:
+        tems: Temperature [time, unit or 1]
+        ppts: Precipitation [time, unit or 1]
+        pets: Potential evapotranspiration [time, unit or 1]
+        diss: Discharge that flows out on surface [time, unit]
+        prms: Model parameters [unit, parameter]
+        stts: States at the start, overwritten by those at the end
+              [unit, state]
+        dslr: Discharge scaler [unit]
+
+    An input with a single column is shared by all units.
+    '''
+
+    nt = diss.shape[0]
+    nu = diss.shape[1]
+
+    # Column step of each input. Zero, when a column is shared.
+    tem_cst = int(tems.shape[1] > 1)
+    ppt_cst = int(ppts.shape[1] > 1)
+    pet_cst = int(pets.shape[1] > 1)
+
+    for t in range(nt):
+        for u in range(nu):
+
+            (lpv_snw_dth,
+             _, _, _, _,
+             lpv_sl0_mse,
+             lpv_sl1_mse,
+             _, _, _,
+             lpv_urr_dth,
+             lpv_lrr_dth,
+             _, _, _,
+             lpv_rnf_sfc,
+             _) = _hbv1d012a_stp(
+                tems[t, u * tem_cst],
+                ppts[t, u * ppt_cst],
+                pets[t, u * pet_cst],
+                prms[u],
+                stts[u, stt_snw_dth_i],
+                stts[u, stt_sl0_mse_i],
+                stts[u, stt_sl1_mse_i],
+                stts[u, stt_urr_dth_i],
+                stts[u, stt_lrr_dth_i])
+
+            stts[u, stt_snw_dth_i] = lpv_snw_dth
+            stts[u, stt_sl0_mse_i] = lpv_sl0_mse
+            stts[u, stt_sl1_mse_i] = lpv_sl1_mse
+            stts[u, stt_urr_dth_i] = lpv_urr_dth
+            stts[u, stt_lrr_dth_i] = lpv_lrr_dth
+
+            # River discharge.
+            diss[t, u] = lpv_rnf_sfc * dslr[u]
+    return
+
+
+def _hbv1d012a_bh_sse(tems, ppts, pets, diss, prms, stts, dslr, diso, sses):
+
+    '''
+    Same model as _hbv1d012a_bh, for optimization runs where a unit is only
+    of interest while its sum of squared errors (SSE, the numerator of the
+    NSE) against the reference discharge is not above a given bound. The
+    SSE only grows with time. A unit is not moved forward anymore as soon
+    as its SSE goes above its bound. Time steps that were not run keep
+    their values in diss.
+
+    Parameters:
+        tems: Temperature [time, unit or 1]
+        ppts: Precipitation [time, unit or 1]
+        pets: Potential evapotranspiration [time, unit or 1]
+        diss: Discharge that flows out on surface [time, unit]
+        prms: Model parameters [unit, parameter]
+        stts: States at the start, overwritten by those at the end of the
+              last time step that was run [unit, state]
+        dslr: Discharge scaler [unit]
+        diso: Reference discharge, NaN where missing [time]
+        sses: Bound of the SSE, overwritten by the SSE up to the last time
+              step that was run [unit]
+
+    A unit was stopped before the end when its SSE is above its bound.
+    '''
+
+    nt = diss.shape[0]
+    nu = diss.shape[1]
+
+    # Column step of each input. Zero, when a column is shared.
+    tem_cst = int(tems.shape[1] > 1)
+    ppt_cst = int(ppts.shape[1] > 1)
+    pet_cst = int(pets.shape[1] > 1)
+
+    sses_max = sses.copy()
+
+    sses[:] = 0.0
+
+    # Number of units that are still moved forward.
+    na = nu
+
+    for t in range(nt):
+
+        if not na:
+            break
+
+        # NaN references are skipped.
+        dso_flg = diso[t] == diso[t]
+
+        for u in range(nu):
+
+            if sses[u] > sses_max[u]:
+                continue
+
+            (lpv_snw_dth,
+             _, _, _, _,
+             lpv_sl0_mse,
+             lpv_sl1_mse,
+             _, _, _,
+             lpv_urr_dth,
+             lpv_lrr_dth,
+             _, _, _,
+             lpv_rnf_sfc,
+             _) = _hbv1d012a_stp(
+                tems[t, u * tem_cst],
+                ppts[t, u * ppt_cst],
+                pets[t, u * pet_cst],
+                prms[u],
+                stts[u, stt_snw_dth_i],
+                stts[u, stt_sl0_mse_i],
+                stts[u, stt_sl1_mse_i],
+                stts[u, stt_urr_dth_i],
+                stts[u, stt_lrr_dth_i])
+
+            stts[u, stt_snw_dth_i] = lpv_snw_dth
+            stts[u, stt_sl0_mse_i] = lpv_sl0_mse
+            stts[u, stt_sl1_mse_i] = lpv_sl1_mse
+            stts[u, stt_urr_dth_i] = lpv_urr_dth
+            stts[u, stt_lrr_dth_i] = lpv_lrr_dth
+
+            # River discharge.
+            diss[t, u] = lpv_rnf_sfc * dslr[u]
+
+            if dso_flg:
+                sses[u] += (float(diso[t]) - float(diss[t, u])) ** 2
+
+                if sses[u] > sses_max[u]:
+                    na -= 1
+    return
+
+
+def _hbv1d012a_rtg(diss, gges, dnst_idxs, rtg_ordr, lags, mkcs):
+
+    '''
+    Channel routing between the gauges of nested (sub-)catchments. Each
+    unit is the area between its gauge and the gauges upstream of it. The
+    discharge at a gauge is that of its own area plus the discharge of the
+    gauges directly upstream, after routing it along the reach in between.
+
+    A reach delays the discharge by a lag and then passes it through a
+    Muskingum stage. With c0, c1 and c2 as its coefficients, the outflow
+    at time step t is:
+        O[t] = (c0 * I[t]) + (c1 * I[t - 1]) + (c2 * O[t - 1])
+    where I is the lagged inflow. Before the lag, the inflow is taken as
+    that of the first time step. O[0] = I[0].
+
+    Parameters:
+        diss: Discharge of each unit's own area [time, unit]
+        gges: Discharge at each gauge, computed here [time, unit]
+        dnst_idxs: Unit directly downstream of each unit, -1 if none [unit]
+        rtg_ordr: Units from upstream to downstream [unit]
+        lags: Lag of the reach below each unit in time steps [unit]
+        mkcs: c0, c1 and c2 of the reach below each unit [unit, 3]
+    '''
+
+    nt = diss.shape[0]
+    nu = diss.shape[1]
+
+    for t in range(nt):
+        for u in range(nu):
+            gges[t, u] = diss[t, u]
+
+    for i in range(nu):
+
+        # All upstream units were added to gges[:, u] before.
+        u = rtg_ordr[i]
+        d = dnst_idxs[u]
+
+        if d < 0:
+            continue
+
+        lag = lags[u]
+
+        c0 = mkcs[u, 0]
+        c1 = mkcs[u, 1]
+        c2 = mkcs[u, 2]
+
+        inf_pre = gges[0, u]
+        otf_pre = inf_pre
+
+        for t in range(nt):
+
+            inf = gges[max(t - lag, 0), u]
+
+            if t == 0:
+                otf = inf
+
+            else:
+                otf = (c0 * inf) + (c1 * inf_pre) + (c2 * otf_pre)
+
+            gges[t, d] += otf
+
+            inf_pre = inf
+            otf_pre = otf
+    return
+
+
+def _hbv1d012a_stp(
+        tem,
+        ppt,
+        pet,
+        prms,
+        lpv_snw_dth,
+        lpv_sl0_mse,
+        lpv_sl1_mse,
+        lpv_urr_dth,
+        lpv_lrr_dth):
+
+    '''
+    A single time step of the model. All kernels here call this, so that
+    the process equations exist only once.
+
+    Parameters:
+        tem: Temperature
+        ppt: Precipitation
+        pet: Potential evapotranspiration
+        prms: Model parameters [parameter]
+        lpv_*: States at the end of the previous time step
+
+    Returns all the output variables of the time step in the order of the
+    output indices (i.e., the columns of otps), except the mass balance.
+    '''
+
+    #==========================================================================
+    # Snowpack formation and melt.
+    #==========================================================================
+
+    prm_snw_ast = prms[prm_snw_ast_i]
+    prm_snw_amt = prms[prm_snw_amt_i]
+    prm_snw_amf = prms[prm_snw_amf_i]
+    prm_snw_pmf = prms[prm_snw_pmf_i]
+
+    lpv_snw_aim = ZERO
+    lpv_snw_pim = ZERO
+    lpv_snw_mlt = ZERO
+    lpv_snw_lpt = ZERO
+
+    if (lpv_snw_dth > 0) and (tem > prm_snw_amt):
+
+        # Air induced snow melt.
+        lpv_snw_aim = tem - prm_snw_amt
+        lpv_snw_aim *= prm_snw_amf
+        lpv_snw_aim = min(lpv_snw_dth, lpv_snw_aim)
+
+        if lpv_snw_aim > 0:
+
+            lpv_snw_dth -= lpv_snw_aim
+            lpv_snw_mlt += lpv_snw_aim
+
+        if ppt > 0:
+
+            lpv_snw_lpt = ppt
+
+            if (prm_snw_pmf > 0) and (lpv_snw_dth > 0):
+
+                # Precipitation induced snow melt.
+                # TODO: ppt can also freeze when little!
+                lpv_snw_pim = tem - prm_snw_amt
+                lpv_snw_pim *= prm_snw_pmf * ppt
+                lpv_snw_pim = min(lpv_snw_dth, lpv_snw_pim)
+
+                if lpv_snw_pim > 0:
+
+                    lpv_snw_dth -= lpv_snw_pim
+                    lpv_snw_mlt += lpv_snw_pim
+
+    elif (tem <= prm_snw_ast) and (ppt > 0):
+
+        lpv_snw_dth += ppt
+
+    elif (tem > prm_snw_ast) and (ppt > 0):
+
+        # Liquid precipitation.
+        lpv_snw_lpt = ppt
+    #==========================================================================
+
+    #==========================================================================
+    # Evapotranspiration, infiltration, soil moisture and runoff.
+    #==========================================================================
+
+    prm_sl0_fcy = prms[prm_sl0_fcy_i]
+    prm_sl0_bt0 = prms[prm_sl0_bt0_i]
+
+    prm_sl1_pwp = prms[prm_sl1_pwp_i]
+    prm_sl1_fcy = prms[prm_sl1_fcy_i]
+    prm_sl1_bt0 = prms[prm_sl1_bt0_i]
+
+    # Potential runoff from snow melt and liquid water.
+    lpv_sl0_prf = lpv_snw_lpt + lpv_snw_mlt
+
+    # Actual runoff.
+    lpv_sl0_arf = ZERO
+
+    # Remaining runoff.
+    lpv_sl0_rrm = lpv_sl0_prf
+
+    if lpv_sl0_rrm:
+
+        # Relative amount that becomes runoff.
+        lpv_sl0_ror = powf(
+            np.float64(lpv_sl0_mse / prm_sl0_fcy), np.float64(prm_sl0_bt0))
+
+        if lpv_sl0_ror > 1: lpv_sl0_ror = 1
+
+        # Infiltration.
+        lpv_sl0_iln = min(
+            lpv_sl0_rrm * np.float32(1 - lpv_sl0_ror),
+            prm_sl0_fcy - lpv_sl0_mse)
+
+        if lpv_sl0_iln < 0: lpv_sl0_iln = ZERO
+
+        lpv_sl0_mse += lpv_sl0_iln
+        lpv_sl0_rrm -= lpv_sl0_iln
+
+        lpv_sl0_arf += lpv_sl0_rrm
+        lpv_sl0_rrm = ZERO
+
+    # Evapotranspiration.
+    lpv_sl1_epr = lpv_sl1_mse / prm_sl1_pwp
+
+    if lpv_sl1_epr > 1: lpv_sl1_epr = ONE
+
+    lpv_sl1_etn = lpv_sl1_epr * pet
+    lpv_sl1_etn = min(lpv_sl1_mse, lpv_sl1_etn)
+
+    lpv_sl1_mse -= lpv_sl1_etn
+
+    # Transfer of moisture from layer 0 to 1.
+    if (lpv_sl0_mse > 0) and (lpv_sl1_mse < prm_sl1_fcy):
+
+        lpv_sl0_sl1 = lpv_sl0_mse * np.float32(powf(
+            np.float64(ONE - (lpv_sl1_mse / prm_sl1_fcy)),
+            np.float64(prm_sl1_bt0)))
+
+        lpv_sl0_sl1 = min(lpv_sl0_sl1, prm_sl1_fcy - lpv_sl1_mse)
+
+        lpv_sl0_mse -= lpv_sl0_sl1
+        lpv_sl1_mse += lpv_sl0_sl1
+
+        # This lead to numerical errors, somehow.
+        # Possibly due to negative inputs of powf?
+        # if lpv_sl1_mse > prm_sl1_fcy:
+        #     lpv_sl0_mse += lpv_sl1_mse - prm_sl1_fcy
+        #     lpv_sl1_mse = prm_sl1_fcy
+        #
+        #     acts[t, prm_sl1_fcy_i] += 1
+        #
+        #     # Just in case.
+        #     if lpv_sl0_mse > prm_sl0_fcy:
+        #         lpv_sl0_arf += lpv_sl0_mse - prm_sl0_fcy
+        #         lpv_sl0_mse = prm_sl0_fcy
+        #
+        #         acts[t, prm_sl0_fcy_i] += 1
+    #==========================================================================
+
+    #==========================================================================
+    # Runoff routing within cell/catchment (non-channel).
+    #==========================================================================
+
+    prm_urr_rsr = prms[prm_urr_rsr_i]
+    prm_urr_tdh = prms[prm_urr_tdh_i]
+    prm_urr_tdr = prms[prm_urr_tdr_i]
+    prm_urr_cst = prms[prm_urr_cst_i]
+    prm_urr_dro = prms[prm_urr_dro_i]
+    prm_urr_ulc = prms[prm_urr_ulc_i]
+
+    prm_lrr_tdh = prms[prm_lrr_tdh_i]
+    prm_lrr_cst = prms[prm_lrr_cst_i]
+    prm_lrr_dro = prms[prm_lrr_dro_i]
+
+    lpv_rnf_sfc = ZERO
+    lpv_rnf_gnd = ZERO
+
+    # Upper reservoir.
+    lpv_urr_dth += lpv_sl0_arf * (ONE - prm_urr_rsr)
+
+    # Runoff from upper and lower outlets of the upper reservoir.
+    if lpv_urr_dth > prm_urr_tdh:
+
+        lpv_rnf_sfc += (lpv_urr_dth - prm_urr_tdh) * prm_urr_tdr
+        lpv_urr_dth -= (lpv_urr_dth - prm_urr_tdh) * prm_urr_tdr
+
+    lpv_urr_rnf = lpv_urr_dth * prm_urr_cst
+
+    lpv_urr_dth -= lpv_urr_rnf
+
+    lpv_rnf_sfc += lpv_urr_rnf * prm_urr_dro
+    lpv_rnf_gnd += lpv_urr_rnf * (ONE - prm_urr_dro)
+
+    # Percolation from upper to lower reservoir.
+    if lpv_lrr_dth < prm_lrr_tdh:
+        lpv_urr_pln = lpv_urr_dth * prm_urr_ulc
+        lpv_urr_pln *= ONE - (lpv_lrr_dth / prm_lrr_tdh)
+
+    else:
+        lpv_urr_pln = ZERO
+
+    lpv_urr_dth -= lpv_urr_pln
+
+    # Lower reservoir.
+    lpv_lrr_rnf = lpv_lrr_dth * prm_lrr_cst
+
+    lpv_lrr_dth -= lpv_lrr_rnf
+    lpv_lrr_dth += lpv_urr_pln
+
+    lpv_rnf_sfc += lpv_lrr_rnf * prm_lrr_dro
+    lpv_rnf_gnd += lpv_lrr_rnf * (ONE - prm_lrr_dro)
+
+    # Upper reservoir update.
+    lpv_urr_dth += lpv_sl0_arf * prm_urr_rsr
+    #==========================================================================
+
+    return (
+        lpv_snw_dth,
+        lpv_snw_lpt,
+        lpv_snw_aim,
+        lpv_snw_pim,
+        lpv_snw_mlt,
+        lpv_sl0_mse,
+        lpv_sl1_mse,
+        lpv_sl0_prf,
+        lpv_sl0_arf,
+        lpv_sl1_etn,
+        lpv_urr_dth,
+        lpv_lrr_dth,
+        lpv_urr_rnf,
+        lpv_urr_pln,
+        lpv_lrr_rnf,
+        lpv_rnf_sfc,
+        lpv_rnf_gnd)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+'''
+Shared fixtures of the tests of HBV_setup.
+
+The modules are imported as HBV_setup.*, like in the notebook. Hence, the
+parent of HBV_setup is put on the path.
+'''
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parents[2]))
+
+from HBV_setup.hmg import HBV1D012A
+
+# The bounds of the notebook (os_hydmod.ipynb).
+PRMS_BUDS_DICT = {
+    'snw_dth': (33.00, 33.00),
+    'snw_ast': (-0.62, -0.62),
+    'snw_amt': (-0.54, -0.54),
+    'snw_amf': (1.9, 1.9),
+    'snw_pmf': (0.65, 0.65),
+    'sl0_mse': (5.66, 5.66),
+    'sl1_mse': (197.00, 197),
+    'sl0_fcy': (0.00, 2e+2),
+    'sl0_bt0': (0.00, 3.00),
+    'sl1_pwp': (0.00, 4e+2),
+    'sl1_fcy': (0.00, 4e+2),
+    'sl1_bt0': (2.5, 2.50),
+    'urr_dth': (6.1, 6.1),
+    'urr_rsr': (0.00, 1.00),
+    'urr_tdh': (0.00, 1e+2),
+    'urr_tdr': (0.00, 1.00),
+    'urr_cst': (0.00, 1.00),
+    'urr_dro': (0.00, 1.00),
+    'urr_ulc': (0.00, 1.00),
+    'lrr_dth': (1.14, 1.14),
+    'lrr_tdh': (0.00, 1e+4),
+    'lrr_cst': (0.00, 1.00),
+    'lrr_dro': (0.00, 1.00),
+    }
+
+
+@pytest.fixture(scope='session')
+def inps():
+
+    '''
+    Synthetic daily inputs (temperature, precipitation and potential
+    evapotranspiration) of three years with a winter (snow) season.
+    '''
+
+    rng = np.random.default_rng(18)
+
+    tsps = 3 * 365
+
+    tems = (
+        8.0 - (10.0 * np.cos(2 * np.pi * np.arange(tsps) / 365.0)) +
+        (3.0 * rng.standard_normal(tsps)))
+
+    ppts = rng.gamma(0.6, 6.0, tsps) * (rng.random(tsps) < 0.55)
+    pets = np.clip(0.15 * (tems + 5.0), 0.0, None)
+
+    return (
+        tems.astype(np.float32),
+        ppts.astype(np.float32),
+        pets.astype(np.float32))
+
+
+@pytest.fixture(scope='session')
+def prms_buds():
+
+    return HBV1D012A('py').get_parameter_bounds_in_correct_order(
+        PRMS_BUDS_DICT)
+
+
+@pytest.fixture(scope='session')
+def prms_sets(prms_buds):
+
+    '''
+    Random parameter sets within the bounds [set, parameter].
+    '''
+
+    rng = np.random.default_rng(25)
+
+    prms = prms_buds[:, 0] + (
+        rng.random((16, prms_buds.shape[0])) *
+        (prms_buds[:, 1] - prms_buds[:, 0]))
+
+    return prms.astype(np.float32)
+
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+'''
+Tests of the efficiencies (HMG3DModelEffsNaNs and HMG3DModelEffsAccs).
+'''
+
+import numpy as np
+import pytest
+from scipy.stats import spearmanr
+
+from HBV_setup.ba_effs_nans import (
+    HMG3DModelEffsNaNs, HMG3DModelEffsAccs, _get_bs_wts)
+
+
+@pytest.fixture(autouse=True)
+def cmpt_effs(monkeypatch):
+
+    monkeypatch.setattr(HMG3DModelEffsNaNs, '_cmpt_effs_flag', True)
+    return
+
+
+@pytest.fixture(scope='module')
+def ref_sim():
+
+    '''
+    A positive reference with NaNs [time step, column] and a noisy
+    simulation of it with some zeros.
+    '''
+
+    rng = np.random.default_rng(31)
+
+    ref = (1.0 + rng.gamma(2.0, 1.5, (500, 4))).astype(np.float32)
+    sim = (ref * rng.lognormal(0.0, 0.3, ref.shape)).astype(np.float32)
+
+    sim[[7, 300], 2] = 0.0
+
+    ref[rng.random(ref.shape) < 0.05] = np.nan
+
+    return ref, sim
+
+
+def get_effs_objt(ref, sim):
+
+    effs_objt = HMG3DModelEffsNaNs(
+        ref, True, True, True, True, True, True, True)
+
+    effs_objt.set_sim(sim, None)
+
+    return effs_objt
+
+
+def test_bs_seeded_same(ref_sim):
+
+    effs_objt = get_effs_objt(*ref_sim)
+
+    bs_dicts = [effs_objt.get_bs_dict(200, 7, seed=5) for _ in range(2)]
+
+    assert list(bs_dicts[0]) == list(bs_dicts[1])
+
+    for eff_lbl in bs_dicts[0]:
+        assert np.array_equal(
+            bs_dicts[0][eff_lbl], bs_dicts[1][eff_lbl], equal_nan=True)
+
+
+@pytest.mark.parametrize('blk_len', [1, 7])
+def test_bs_same_as_resampled(ref_sim, blk_len):
+
+    ref, sim = ref_sim
+
+    n_rsps = 5
+
+    bs_dict = get_effs_objt(ref, sim).get_bs_dict(n_rsps, blk_len, seed=5)
+
+    # The same counts of the time steps, in a single chunk.
+    wts = _get_bs_wts(
+        np.random.default_rng(5), n_rsps, ref.shape[0], blk_len)
+
+    for i in range(n_rsps):
+        rsp_idxs = np.repeat(np.arange(ref.shape[0]), wts[i].astype(int))
+
+        effs_dict = get_effs_objt(ref[rsp_idxs], sim[rsp_idxs]).get_all_dict()
+
+        for eff_lbl in bs_dict:
+            # Ln. NS of the resample is -inf where sim has zeros in it.
+            if eff_lbl == 'lns' and (sim[rsp_idxs, 2] == 0).any():
+                cols = [0, 1, 3]
+
+                assert np.isneginf(effs_dict[eff_lbl][2])
+                assert np.isfinite(bs_dict[eff_lbl][i, 2])
+
+            else:
+                cols = slice(None)
+
+            assert np.allclose(
+                bs_dict[eff_lbl][i, cols],
+                effs_dict[eff_lbl][cols],
+                rtol=1e-5), (eff_lbl, i)
+
+
+def test_accs_merge_same_as_single(ref_sim):
+
+    ref, sim = ref_sim
+
+    accs = HMG3DModelEffsAccs(ref.shape[1], True, True, True, True, True)
+    accs.update(ref, sim)
+
+    # Chunks of other lengths, merged in the order of the series.
+    accs_mrgd = None
+    for beg, end in ((0, 1), (1, 120), (120, 120), (120, 333), (333, 500)):
+        accs_chnk = HMG3DModelEffsAccs(
+            ref.shape[1], True, True, True, True, True)
+
+        accs_chnk.update(ref[beg:end], sim[beg:end])
+
+        if accs_mrgd is None:
+            accs_mrgd = accs_chnk
+
+        else:
+            accs_mrgd.merge(accs_chnk)
+
+    effs_dict = accs.get_all_dict()
+    effs_mrgd_dict = accs_mrgd.get_all_dict()
+
+    for eff_lbl in effs_dict:
+        assert np.allclose(
+            effs_dict[eff_lbl], effs_mrgd_dict[eff_lbl], rtol=1e-12), eff_lbl
+
+    # Same as HMG3DModelEffsNaNs, except for Ln. NS of the column with
+    # zeros in sim and NS_DC (see HMG3DModelEffsAccs).
+    effs_nans_dict = get_effs_objt(ref, sim).get_all_dict()
+
+    for eff_lbl in ('ns', 'lns', 'kg', 'pc'):
+        cols = [0, 1, 3] if eff_lbl == 'lns' else slice(None)
+
+        assert np.allclose(
+            effs_dict[eff_lbl][cols],
+            effs_nans_dict[eff_lbl][cols],
+            rtol=1e-5), eff_lbl
+
+    assert np.isneginf(effs_nans_dict['lns'][2])
+    assert np.isfinite(effs_dict['lns'][2])
+
+
+@pytest.mark.parametrize('nans_same', [True, False])
+def test_fsd_same_as_separate(ref_sim, monkeypatch, nans_same):
+
+    if not HMG3DModelEffsNaNs._fsd_effs_flag:
+        pytest.skip('numba is not available!')
+
+    ref, sim = ref_sim
+
+    if nans_same:
+        # NaNs at the same time steps in all columns.
+        ref = np.where(np.isnan(ref).any(axis=1)[:, None], np.nan, ref)
+
+    effs_objt = get_effs_objt(ref, sim)
+
+    fsd_dict = effs_objt.get_fsd_dict()
+
+    monkeypatch.setattr(HMG3DModelEffsNaNs, '_fsd_effs_flag', False)
+
+    sprt_dict = effs_objt.get_all_dict()
+
+    assert list(fsd_dict) == ['ns', 'lns', 'kg', 'pc', 'sp', 'ns_dc']
+
+    for eff_lbl in fsd_dict:
+        # The separate methods sum some terms in float32.
+        assert np.allclose(
+            fsd_dict[eff_lbl], sprt_dict[eff_lbl], rtol=1e-5), eff_lbl
+
+
+def test_vectorized_same_as_per_column(ref_sim):
+
+    ref, sim = ref_sim
+
+    effs_objt = get_effs_objt(ref, sim)
+
+    for col in range(ref.shape[1]):
+        nnan_idxs = ~np.isnan(ref[:, col])
+
+        ref_col = ref[nnan_idxs, col].astype(np.float64)
+        sim_col = sim[nnan_idxs, col].astype(np.float64)
+
+        pc = np.corrcoef(ref_col, sim_col)[0, 1]
+        sp = np.polyfit(ref_col, sim_col, 1)[0]
+
+        kg = 1 - (
+            (pc - 1) ** 2 +
+            ((sim_col.mean() / ref_col.mean()) - 1) ** 2 +
+            ((sim_col.std() / ref_col.std()) - 1) ** 2) ** 0.5
+
+        assert np.isclose(effs_objt.get_pc()[col], pc, rtol=1e-6)
+        assert np.isclose(effs_objt.get_sp()[col], sp, rtol=1e-6)
+        assert np.isclose(effs_objt.get_kg()[col], kg, rtol=1e-5)
+
+
+@pytest.mark.parametrize('fsd_flag', [True, False])
+def test_sc_same_as_spearmanr(ref_sim, monkeypatch, fsd_flag):
+
+    if fsd_flag and not HMG3DModelEffsNaNs._fsd_effs_flag:
+        pytest.skip('numba is not available!')
+
+    monkeypatch.setattr(HMG3DModelEffsNaNs, '_fsd_effs_flag', fsd_flag)
+
+    ref, sim = ref_sim
+
+    # Ties in both.
+    ref = np.round(ref)
+    sim = np.round(sim)
+
+    sc = get_effs_objt(ref, sim).get_sc()
+
+    for col in range(ref.shape[1]):
+        nnan_idxs = ~np.isnan(ref[:, col])
+
+        assert np.isclose(
+            sc[col],
+            spearmanr(ref[nnan_idxs, col], sim[nnan_idxs, col])[0],
+            rtol=1e-10)
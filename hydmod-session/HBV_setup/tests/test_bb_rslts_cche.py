@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+'''
+Tests of the cache of results (RSLTSCCHE).
+'''
+
+import os
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from HBV_setup import bb_rslts_cche
+from HBV_setup.bb_rslts_cche import CODE_PATHS, RSLTSCCHE
+
+
+def save_run(rslts_cche, key, ot_dir, size):
+
+    ot_dir.mkdir(exist_ok=True)
+
+    (ot_dir / 'a.bin').write_bytes(b'\x01' * size)
+
+    rslts_cche.save_entry(key, ot_dir, ['a.bin'], rtrn={'key': key})
+    return
+
+
+def test_save_load_evict(tmp_path):
+
+    rslts_cche = RSLTSCCHE(tmp_path / 'cche', max_size=2500)
+
+    key_1 = rslts_cche.get_key(np.arange(3), 'nb')
+    key_2 = rslts_cche.get_key(np.arange(3), 'py')
+
+    assert key_1 != key_2
+    assert key_1 == RSLTSCCHE(tmp_path / 'cche').get_key(np.arange(3), 'nb')
+
+    save_run(rslts_cche, key_1, tmp_path / 'run', 1000)
+
+    assert rslts_cche.load_entry(key_1, tmp_path / 'ld_1') == {'key': key_1}
+    assert (tmp_path / 'ld_1' / 'a.bin').read_bytes() == b'\x01' * 1000
+
+    # The first entry is the least recently used one.
+    os.utime(tmp_path / 'cche' / key_1, (0, 0))
+
+    save_run(rslts_cche, key_2, tmp_path / 'run', 2000)
+
+    assert list(rslts_cche.get_entries().index) == [key_2]
+
+    with pytest.raises(FileNotFoundError):
+        rslts_cche.load_entry(key_1, tmp_path / 'ld_2')
+
+    rslts_cche.invalidate()
+
+    assert rslts_cche.get_entries().shape[0] == 0
+
+
+def test_removed_entries_tolerated(tmp_path, monkeypatch):
+
+    rslts_cche = RSLTSCCHE(tmp_path / 'cche', max_size=2000)
+
+    keys = [rslts_cche.get_key(i) for i in range(3)]
+
+    for key in keys[:2]:
+        save_run(rslts_cche, key, tmp_path / 'run', 500)
+
+    # As if another process removed an entry while this one evicts.
+    rmtree = shutil.rmtree
+
+    def rmtree_twce(path, *args, **kwargs):
+        rmtree(path, *args, **kwargs)
+        rmtree(path, *args, **kwargs)
+        return
+
+    monkeypatch.setattr(shutil, 'rmtree', rmtree_twce)
+
+    save_run(rslts_cche, keys[2], tmp_path / 'run', 1000)
+
+    ntrs_dfe = rslts_cche.get_entries()
+
+    assert len(ntrs_dfe.index) == 2
+    assert keys[2] in ntrs_dfe.index
+
+    for key in keys:
+        rslts_cche.invalidate(key)
+
+    assert rslts_cche.get_entries().shape[0] == 0
+
+
+def test_code_paths_cover_imports():
+
+    # The modules of HBV_setup that the cached scripts import.
+    code_dir = Path(bb_rslts_cche.__file__).parent
+
+    for code_path in ('daa_optimize.py', 'dab_validate.py'):
+        code = (code_dir / code_path).read_text()
+
+        for mdl_nm in re.findall(
+                r'^from HBV_setup\.(\w+) import', code, re.MULTILINE):
+
+            if mdl_nm == 'hmg':
+                continue
+
+            assert f'{mdl_nm}.py' in CODE_PATHS, (code_path, mdl_nm)
+
+    for code_path in CODE_PATHS:
+        assert (code_dir / code_path).is_file(), code_path
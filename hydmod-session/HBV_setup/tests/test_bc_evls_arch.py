@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+'''
+Tests of the archive of evaluations (EVLSARCH).
+'''
+
+import numpy as np
+
+from HBV_setup.bc_evls_arch import EVLSARCH, read_evls_arch
+
+
+def test_rows_found_and_resumed(tmp_path):
+
+    path = tmp_path / 'evls.npy'
+    lbls = ['a', 'b', 'obj']
+
+    rng = np.random.default_rng(20)
+
+    rows = rng.random((50, 3))
+
+    # The same parameters twice. The first row is found.
+    rows[30, :2] = rows[10, :2]
+
+    evls_arch = EVLSARCH(path, lbls, 2)
+
+    evls_arch.add_rows(rows[:20])
+    evls_arch.add_rows(rows[20:])
+
+    prms = np.concatenate((rows[[5, 30, 49], :2], rng.random((1, 2))))
+
+    assert (evls_arch.get_rows_idxs(prms) == [5, 10, 49, -1]).all()
+
+    assert np.array_equal(evls_arch.get_rows([5, 49]), rows[[5, 49]])
+
+    evls_arch.close()
+
+    evls_arr = read_evls_arch(path)
+
+    assert evls_arr.dtype.names == tuple(lbls)
+    assert np.array_equal(
+        evls_arr.view(np.float64).reshape(-1, 3), rows)
+
+    del evls_arr
+
+    # The rows of the file are found again after resuming.
+    evls_arch = EVLSARCH(path, lbls, 2, True)
+
+    assert evls_arch.get_number_of_rows() == rows.shape[0]
+
+    assert (evls_arch.get_rows_idxs(prms) == [5, 10, 49, -1]).all()
+
+    evls_arch.add_rows(rng.random((2, 3)))
+
+    evls_arch.close()
+
+    assert read_evls_arch(path).shape == (52,)
@@ -0,0 +1,541 @@
+# -*- coding: utf-8 -*-
+
+'''
+Tests of the optimizer of daa_optimize.
+'''
+
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize._differentialevolution import DifferentialEvolutionSolver
+
+from HBV_setup import daa_optimize
+from HBV_setup.hmg import HBV1D012A
+from HBV_setup.ba_effs_nans import HMG3DModelEffsNaNs
+from HBV_setup.bc_evls_arch import EVLSARCH
+from HBV_setup.daa_optimize import (
+    CVGMNTR,
+    SRCHSPCE,
+    SRGTMODL,
+    main,
+    get_optn_args,
+    get_optn_ress,
+    get_objv_fntn_vlue,
+    get_objv_fntn_vlue_bh,
+    _set_dfev_pop_size)
+
+# Number of seconds per time step and area of the catchment, for a
+# discharge scaler of 8.67.
+SECS_PER_STEP = 86400
+CAT_AREA = 8.67 * 1000 * SECS_PER_STEP
+
+
+@pytest.fixture(scope='module')
+def optn_args(inps, prms_buds, prms_sets):
+
+    '''
+    Arguments of the objective functions (NSE only), for a reference
+    discharge that is the simulation of a parameter set.
+    '''
+
+    tems, ppts, pets = (inp[:2 * 365] for inp in inps)
+
+    modl_objt = HBV1D012A()
+    modl_objt.set_inputs(tems, ppts, pets)
+    modl_objt.set_discharge_scaler(8.67)
+
+    diso = modl_objt.run_batch(prms_sets[:1])[0]
+
+    # As in daa_optimize.main.
+    with pytest.MonkeyPatch.context() as mpch:
+        mpch.setattr(HMG3DModelEffsNaNs, '_cmpt_effs_flag', True)
+
+        yield get_optn_args(
+            tems,
+            ppts,
+            pets,
+            diso,
+            8.67,
+            prms_buds,
+            (True, False, False, False, False),
+            SRCHSPCE(prms_buds))
+
+
+@pytest.fixture(scope='module')
+def inp_dfe(inps, prms_sets):
+
+    '''
+    Inputs of main, with the reference discharge of optn_args.
+    '''
+
+    tems, ppts, pets = (inp[:2 * 365] for inp in inps)
+
+    modl_objt = HBV1D012A()
+    modl_objt.set_inputs(tems, ppts, pets)
+    modl_objt.set_discharge_scaler(CAT_AREA / (1000 * SECS_PER_STEP))
+
+    return pd.DataFrame(
+        index=pd.date_range('2001-01-01', periods=tems.size, freq='D'),
+        data={
+            'tem': tems,
+            'ppt': ppts,
+            'pet': pets,
+            'dis_ref': modl_objt.run_batch(prms_sets[:1])[0],
+            })
+
+
+@pytest.fixture
+def main_kwds(monkeypatch, inp_dfe, prms_buds):
+
+    '''
+    Arguments of main, for a short run.
+    '''
+
+    # main sets it.
+    monkeypatch.setattr(
+        HMG3DModelEffsNaNs,
+        '_cmpt_effs_flag',
+        HMG3DModelEffsNaNs._cmpt_effs_flag)
+
+    return {
+        'prms_buds_dict': {
+            prm_lbl: tuple(prms_buds[i])
+            for prm_lbl, i in HBV1D012A().get_parameter_labels().items()},
+        'inp_dfe': inp_dfe,
+        'cat_area': CAT_AREA,
+        'secs_per_step': SECS_PER_STEP,
+        'cat_label': 'test',
+        'max_gens': 3,
+        }
+
+
+def test_srch_spce_round_trip(prms_buds):
+
+    idxs_prms = HBV1D012A().get_parameter_labels()
+
+    srch_spce = SRCHSPCE(
+        prms_buds, [idxs_prms['lrr_tdh'], idxs_prms['urr_tdh']])
+
+    srch_idxs = srch_spce.get_search_indices()
+
+    assert np.array_equal(
+        srch_idxs, np.flatnonzero(prms_buds[:, 0] < prms_buds[:, 1]))
+
+    assert srch_spce.get_bounds().shape == (srch_idxs.size, 2)
+
+    srch_prms = np.random.default_rng(3).random((srch_idxs.size, 10))
+
+    prms = srch_spce.get_prms(srch_prms)
+
+    # Fixed parameters at their bounds, the rest within them.
+    assert (prms >= prms_buds[:, [0]]).all()
+    assert (prms <= prms_buds[:, [1]]).all()
+
+    assert np.allclose(srch_spce.get_srch_prms(prms), srch_prms, atol=1e-12)
+
+    assert np.array_equal(srch_spce.get_prms(srch_prms[:, 0]), prms[:, 0])
+
+    # Half of the normalized range is below sqrt(1 + upper bound) - 1 on
+    # the log scale.
+    lrr_tdh_max = prms_buds[idxs_prms['lrr_tdh'], 1]
+
+    assert np.isclose(
+        srch_spce.get_prms(np.full(srch_idxs.size, 0.5))[
+            idxs_prms['lrr_tdh']],
+        np.sqrt(1 + lrr_tdh_max) - 1)
+
+
+def test_main_one_free_parameter(tmp_path, main_kwds):
+
+    # Fewer than five members from pop_size, with an initial population
+    # around the given parameters.
+    prms_buds_dict = {
+        prm_lbl: (prm_buds[0], prm_buds[0])
+        for prm_lbl, prm_buds in main_kwds['prms_buds_dict'].items()}
+
+    prms_buds_dict['urr_tdh'] = main_kwds['prms_buds_dict']['urr_tdh']
+
+    prms_init = pd.Series(
+        {prm_lbl: prm_buds[0]
+         for prm_lbl, prm_buds in prms_buds_dict.items()})
+
+    prms_init['urr_tdh'] = 0.5 * prms_buds_dict['urr_tdh'][1]
+
+    prms_sr = main(**{
+        **main_kwds,
+        'prms_buds_dict': prms_buds_dict,
+        'output_dir': tmp_path,
+        'seed': 3,
+        'prms_init': prms_init,
+        'max_gens': 2})
+
+    assert prms_sr.drop('urr_tdh').equals(
+        prms_init.drop('urr_tdh').astype(np.float32))
+
+
+def test_main_same_for_any_n_cpus(tmp_path, main_kwds):
+
+    # With a seed, candidates are evaluated together for a generation,
+    # with one process or many.
+    prms_srs = [
+        main(**main_kwds, output_dir=tmp_path / f'{n_cpus}', n_cpus=n_cpus,
+             seed=3)
+        for n_cpus in (1, 2)]
+
+    assert prms_srs[0].equals(prms_srs[1])
+
+    prfs_srs = [
+        pd.read_csv(tmp_path / f'{n_cpus}' / 'prf_test_sr.csv', sep=';')
+        for n_cpus in (1, 2)]
+
+    assert prfs_srs[0].equals(prfs_srs[1])
+
+
+def test_main_shms_unlinked_on_failure(tmp_path, monkeypatch, main_kwds):
+
+    shms_nms = []
+
+    def get_shm_arr(arr):
+        shm, shm_arr = get_shm_arr_orig(arr)
+
+        shms_nms.append(shm.name)
+        return shm, shm_arr
+
+    def pool(*args, **kwargs):
+        raise OSError('No pool!')
+
+    get_shm_arr_orig = daa_optimize._get_shm_arr
+
+    monkeypatch.setattr(daa_optimize, '_get_shm_arr', get_shm_arr)
+    monkeypatch.setattr(daa_optimize, 'Pool', pool)
+
+    with pytest.raises(OSError, match='No pool!'):
+        main(**main_kwds, output_dir=tmp_path, n_cpus=2, seed=3)
+
+    assert len(shms_nms) == 4
+
+    for shm_nm in shms_nms:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=shm_nm)
+
+
+@pytest.mark.parametrize('bch_flag', [False, True])
+def test_resume_same_as_uninterrupted(tmp_path, optn_args, bch_flag):
+
+    # A run that is stopped and resumed from its checkpoint gives the same
+    # result as one that was never stopped.
+    dfev_kwds = {'popsize': 3, 'polish': False, 'seed': 7, 'tol': 0.0}
+
+    if bch_flag:
+        objv_fntn = get_objv_fntn_vlue_bh
+
+        dfev_kwds['updating'] = 'deferred'
+        dfev_kwds['vectorized'] = True
+
+    else:
+        objv_fntn = get_objv_fntn_vlue
+
+    bounds = optn_args.srch_spce.get_bounds()
+
+    optn_ress_ref = get_optn_ress(
+        objv_fntn,
+        bounds,
+        (optn_args,),
+        {**dfev_kwds, 'maxiter': 6},
+        tmp_path / 'ref.npz',
+        2,
+        False,
+        None,
+        CVGMNTR(mbrs_min=5))
+
+    ckps_path = tmp_path / 'ckpt.npz'
+
+    get_optn_ress(
+        objv_fntn,
+        bounds,
+        (optn_args,),
+        {**dfev_kwds, 'maxiter': 3},
+        ckps_path,
+        1,
+        False,
+        None,
+        CVGMNTR(mbrs_min=5))
+
+    optn_ress = get_optn_ress(
+        objv_fntn,
+        bounds,
+        (optn_args,),
+        {**dfev_kwds, 'maxiter': 6},
+        ckps_path,
+        1,
+        True,
+        None,
+        CVGMNTR(mbrs_min=5))
+
+    assert optn_ress.nit == optn_ress_ref.nit == 6
+
+    assert np.array_equal(optn_ress.x, optn_ress_ref.x)
+    assert optn_ress.fun == optn_ress_ref.fun
+
+    assert np.array_equal(optn_ress.population, optn_ress_ref.population)
+
+    assert np.array_equal(
+        optn_ress.population_energies, optn_ress_ref.population_energies)
+
+    assert optn_ress.cvgs.equals(optn_ress_ref.cvgs)
+
+
+def get_dfev_args(bch_flag):
+
+    dfev_kwds = {'popsize': 3, 'polish': False, 'seed': 7, 'tol': 0.0}
+
+    if bch_flag:
+        objv_fntn = get_objv_fntn_vlue_bh
+
+        dfev_kwds['updating'] = 'deferred'
+        dfev_kwds['vectorized'] = True
+
+    else:
+        objv_fntn = get_objv_fntn_vlue
+
+    return objv_fntn, dfev_kwds
+
+
+@pytest.mark.parametrize('bch_flag', [False, True])
+def test_cvg_mntr_shrinks_and_stalls(optn_args, bch_flag):
+
+    objv_fntn, dfev_kwds = get_dfev_args(bch_flag)
+
+    bounds = optn_args.srch_spce.get_bounds()
+
+    # Spread is always small enough for the smallest population.
+    n_runs_beg = optn_args.n_runs
+
+    optn_ress = get_optn_ress(
+        objv_fntn,
+        bounds,
+        (optn_args,),
+        {**dfev_kwds, 'maxiter': 4},
+        None,
+        0,
+        False,
+        None,
+        CVGMNTR(mbrs_min=5, sprd_rtol=1e3),
+        optn_args)
+
+    n_mbrs = optn_ress.cvgs['n_mbrs'].values
+
+    assert n_mbrs[0] > 5
+    assert n_mbrs[-1] == 5
+    assert np.all(np.diff(n_mbrs) <= 0)
+
+    # The best member is kept.
+    assert np.all(np.diff(optn_ress.cvgs['best'].values) <= 0)
+
+    # Each member of a generation is a new candidate that was run.
+    n_runs = optn_ress.cvgs['n_runs'].values
+
+    assert n_runs[0] == n_mbrs[0]
+    assert np.array_equal(np.diff(n_runs), n_mbrs[1:])
+
+    assert optn_ress.n_runs == optn_args.n_runs - n_runs_beg == n_runs[-1]
+
+    # Any improvement is too small.
+    optn_ress = get_optn_ress(
+        objv_fntn,
+        bounds,
+        (optn_args,),
+        {**dfev_kwds, 'maxiter': 10},
+        None,
+        0,
+        False,
+        None,
+        CVGMNTR(stal_gens=2, stal_tol=1e9),
+        optn_args)
+
+    assert optn_ress.nit == 2
+    assert optn_ress.success
+    assert optn_ress.message.startswith('Improvement stayed below')
+
+
+@pytest.mark.parametrize('bch_flag', [False, True])
+def test_archived_candidates_not_run(tmp_path, optn_args, bch_flag):
+
+    objv_fntn, dfev_kwds = get_dfev_args(bch_flag)
+
+    bounds = optn_args.srch_spce.get_bounds()
+
+    n_prms = optn_args.srch_spce.get_prms(bounds[:, 0]).size
+
+    optn_args.evls_arch = EVLSARCH(
+        tmp_path / 'evls.npy',
+        [f'prm_{i}' for i in range(n_prms)] + ['obj', 'true', 'ns'],
+        n_prms)
+
+    try:
+        optn_ress_1, optn_ress_2 = [get_optn_ress(
+            objv_fntn,
+            bounds,
+            (optn_args,),
+            {**dfev_kwds, 'maxiter': 3},
+            None,
+            0,
+            False,
+            None,
+            CVGMNTR(),
+            optn_args) for _ in range(2)]
+
+    finally:
+        optn_args.evls_arch.close()
+        optn_args.evls_arch = None
+
+    assert optn_ress_1.n_runs == optn_ress_1.cvgs['n_runs'].values[-1] > 0
+
+    # All candidates are the same as those of the first run.
+    assert optn_ress_2.n_runs == 0
+    assert np.array_equal(optn_ress_2.x, optn_ress_1.x)
+
+
+@pytest.mark.parametrize('bch_flag', [False, True])
+def test_private_same_as_public(tmp_path, monkeypatch, optn_args, bch_flag):
+
+    objv_fntn, dfev_kwds = get_dfev_args(bch_flag)
+
+    bounds = optn_args.srch_spce.get_bounds()
+
+    n_runs_beg = optn_args.n_runs
+
+    # scipy's differential_evolution.
+    optn_ress_pblc = get_optn_ress(
+        objv_fntn,
+        bounds,
+        (optn_args,),
+        {**dfev_kwds, 'maxiter': 4})
+
+    assert optn_ress_pblc.n_runs == optn_args.n_runs - n_runs_beg
+
+    # The checkpoints need the private attributes.
+    monkeypatch.setattr(daa_optimize, 'SCIPY_VRSNS', ('0.0',))
+
+    with pytest.warns(UserWarning, match='Private attributes of scipy'):
+        optn_ress_prvt = get_optn_ress(
+            objv_fntn,
+            bounds,
+            (optn_args,),
+            {**dfev_kwds, 'maxiter': 4},
+            tmp_path / 'ckpt.npz')
+
+    assert optn_ress_prvt.nit == optn_ress_pblc.nit == 4
+
+    assert np.array_equal(optn_ress_prvt.x, optn_ress_pblc.x)
+    assert optn_ress_prvt.fun == optn_ress_pblc.fun
+
+    assert np.array_equal(
+        optn_ress_prvt.population, optn_ress_pblc.population)
+
+    assert np.array_equal(
+        optn_ress_prvt.population_energies,
+        optn_ress_pblc.population_energies)
+
+    # No record of the initial population with differential_evolution.
+    assert optn_ress_prvt.n_runs == optn_ress_pblc.n_runs
+    assert optn_ress_prvt.cvgs.iloc[1:].equals(optn_ress_pblc.cvgs)
+
+
+def test_srgt_screens_and_falls_back():
+
+    def get_objv_vles(srch_prms):
+        return 1.0 + (((srch_prms - 0.3) ** 2).sum(axis=1))
+
+    rng = np.random.default_rng(9)
+
+    srgt = SRGTMODL(n_pts_min=50, n_errs=20, chks_rato=0.0, seed=4)
+
+    srch_prms = rng.random((50, 3))
+    srgt.update(srch_prms, get_objv_vles(srch_prms), np.ones(50, bool))
+
+    # Errors of the predictions of evaluated candidates.
+    srch_prms = rng.random((20, 3))
+
+    evln_flgs, prds = srgt.get_evaluation_flags(srch_prms, np.zeros(20))
+
+    assert evln_flgs.all()
+
+    srgt.update(
+        srch_prms, get_objv_vles(srch_prms), np.ones(20, bool), prds)
+
+    assert srgt.get_rmse() < 0.05
+
+    # Better and worse than their members, by far.
+    srch_prms = np.vstack((np.full((1, 3), 0.3), np.full((1, 3), 0.95)))
+    objv_thds = np.array([1.5, 1.1])
+
+    evln_flgs, prds = srgt.get_evaluation_flags(srch_prms, objv_thds)
+
+    assert evln_flgs.tolist() == [True, False]
+    assert np.allclose(prds, get_objv_vles(srch_prms), rtol=0.05)
+
+    # Without predictions, all are evaluated.
+    class RBFIFLR:
+
+        def __init__(self, prds=None):
+
+            self.prds = prds
+            return
+
+        def __call__(self, srch_prms):
+
+            if self.prds is None:
+                raise np.linalg.LinAlgError('Singular matrix')
+
+            return self.prds
+
+    srgt._rbfi = RBFIFLR()
+
+    evln_flgs, prds = srgt.get_evaluation_flags(srch_prms, objv_thds)
+
+    assert evln_flgs.all()
+    assert prds is None
+
+    srgt._rbfi = RBFIFLR(np.array([np.nan, np.inf]))
+
+    with np.errstate(over='ignore'):
+        evln_flgs, prds = srgt.get_evaluation_flags(srch_prms, objv_thds)
+
+    assert evln_flgs.all()
+
+    # The running error stays finite.
+    srgt.update(
+        srch_prms, get_objv_vles(srch_prms), np.ones(2, bool), prds)
+
+    assert np.isfinite(srgt.get_rmse())
+
+
+def test_set_dfev_pop_size_keeps_best():
+
+    dfev_slvr = DifferentialEvolutionSolver(
+        lambda x: ((x - 0.3) ** 2).sum(), [(0, 1)] * 3, popsize=4, rng=2)
+
+    dfev_slvr.population_energies[:] = (
+        dfev_slvr._calculate_population_energies(dfev_slvr.population))
+
+    enes = dfev_slvr.population_energies.copy()
+    popn = dfev_slvr.population.copy()
+
+    _set_dfev_pop_size(dfev_slvr, 5)
+
+    assert dfev_slvr.num_population_members == 5
+    assert dfev_slvr.population.shape == (5, 3)
+
+    assert dfev_slvr.population_energies[0] == enes.min()
+    assert np.array_equal(dfev_slvr.population[0], popn[enes.argmin()])
+
+    assert np.array_equal(
+        np.sort(dfev_slvr.population_energies), np.sort(enes)[:5])
+
+    # Another generation with the smaller population.
+    next(dfev_slvr)
+
+    assert dfev_slvr.population_energies.min() <= enes.min()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+'''
+Tests of the helpers of the multi-fidelity optimizer (dad_optimize_mf).
+'''
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from HBV_setup.hmg import HBV1D012A
+from HBV_setup.dad_optimize_mf import (
+    get_coarse_inputs, get_time_scaled_buds_dict)
+
+
+@pytest.fixture(scope='module')
+def prms_buds_dict(prms_buds):
+
+    return {
+        prm_lbl: tuple(prms_buds[i])
+        for prm_lbl, i in HBV1D012A().get_parameter_labels().items()}
+
+
+def test_coarse_inputs():
+
+    # Hourly inputs from the middle of a day to the middle of another one.
+    rng = np.random.default_rng(11)
+
+    n_stps = 24 * 4
+
+    inp_dfe = pd.DataFrame(
+        data=rng.random((n_stps, 4)),
+        columns=['tem', 'ppt', 'pet', 'dis_ref'],
+        index=pd.date_range('2020-01-01 12:00', periods=n_stps, freq='h'))
+
+    # The second full day has one reference value, the third one none.
+    inp_dfe.loc['2020-01-03 01:00':'2020-01-03 23:00', 'dis_ref'] = np.nan
+    inp_dfe.loc['2020-01-04', 'dis_ref'] = np.nan
+
+    inp_dfe_crs = get_coarse_inputs(inp_dfe, 3600, 86400)
+
+    assert list(inp_dfe_crs.index) == list(
+        pd.date_range('2020-01-02', periods=3, freq='D'))
+
+    for day in inp_dfe_crs.index:
+        inp_dfe_day = inp_dfe.loc[day:day + pd.Timedelta(hours=23)]
+
+        assert inp_dfe_day.shape[0] == 24
+
+        assert np.isclose(
+            inp_dfe_crs.loc[day, 'tem'], inp_dfe_day['tem'].mean())
+
+        assert np.isclose(
+            inp_dfe_crs.loc[day, 'ppt'], inp_dfe_day['ppt'].sum())
+
+        assert np.isclose(
+            inp_dfe_crs.loc[day, 'pet'], inp_dfe_day['pet'].sum())
+
+    assert inp_dfe_crs['dis_ref'].iloc[1] == inp_dfe.loc[
+        '2020-01-03 00:00', 'dis_ref']
+
+    assert np.isnan(inp_dfe_crs['dis_ref'].iloc[2])
+
+    with pytest.raises(AssertionError):
+        get_coarse_inputs(inp_dfe.iloc[:20], 3600, 86400)
+
+
+def test_time_scaled_buds_dict(prms_buds_dict):
+
+    prms_buds_dict_hly = get_time_scaled_buds_dict(prms_buds_dict, 1 / 24)
+
+    assert list(prms_buds_dict_hly) == list(
+        HBV1D012A().get_parameter_labels())
+
+    # Storage constants: the same fraction leaves in a day.
+    urr_cst_buds = get_time_scaled_buds_dict(
+        {**prms_buds_dict, 'urr_cst': (0.2, 0.5)}, 1 / 24)['urr_cst']
+
+    assert urr_cst_buds[0] < urr_cst_buds[1]
+
+    assert np.allclose(
+        1 - ((1 - np.array(urr_cst_buds)) ** 24), (0.2, 0.5), rtol=1e-6)
+
+    # The air melt factor per hour.
+    assert np.isclose(
+        prms_buds_dict_hly['snw_amf'][0], prms_buds_dict['snw_amf'][0] / 24)
+
+    # Depths, temperatures and ratios stay the same.
+    for prm_lbl in ('snw_dth', 'snw_ast', 'sl1_fcy', 'urr_dro'):
+        assert np.allclose(
+            prms_buds_dict_hly[prm_lbl], prms_buds_dict[prm_lbl])
+
+    # Back to days.
+    prms_buds_dict_dly = get_time_scaled_buds_dict(prms_buds_dict_hly, 24)
+
+    for prm_lbl, prm_buds in prms_buds_dict.items():
+        assert np.allclose(prms_buds_dict_dly[prm_lbl], prm_buds), prm_lbl
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+
+'''
+Tests of the HBV1D012A kernels and their backends.
+'''
+
+import numpy as np
+import pytest
+
+from HBV_setup.hmg import HBV1D012A, HBV1D012ACats, HBV1D012ANest, HBV2D012A
+
+
+def get_modl_objt(bknd, inps, prms, oflg=0):
+
+    '''
+    A HBV1D012A with the inputs, outputs, parameters and a discharge scaler,
+    ready to run.
+    '''
+
+    modl_objt = HBV1D012A(bknd)
+
+    if modl_objt.get_backend() != bknd:
+        pytest.skip(f'The {bknd} backend is not available!')
+
+    modl_objt.set_inputs(*inps)
+    modl_objt.set_outputs(inps[0].shape[0])
+    modl_objt.set_discharge_scaler(8.67)
+    modl_objt.set_optimization_flag(oflg)
+    modl_objt.set_parameters(prms)
+
+    return modl_objt
+
+
+@pytest.mark.parametrize('oflg', [0, 1])
+def test_zero_bounds_give_nan(inps, prms_sets, oflg):
+
+    # sl0_fcy and sl1_pwp have zero as the lower bound. Divisions by them
+    # give NaN in both backends, instead of an exception.
+    prms = prms_sets[0].copy()
+
+    idxs_prms = HBV1D012A('py').get_parameter_labels()
+
+    prms[idxs_prms['sl0_fcy']] = 0
+    prms[idxs_prms['sl1_pwp']] = 0
+
+    diss = {}
+    for bknd in ('py', 'nb'):
+        modl_objt = get_modl_objt(bknd, inps, prms, oflg)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            modl_objt.run_model()
+
+        diss[bknd] = modl_objt.get_discharge()
+
+    assert np.isnan(diss['py']).any()
+
+    assert (np.isnan(diss['py']) == np.isnan(diss['nb'])).all()
+
+
+@pytest.mark.parametrize('bknd', ['py', 'nb'])
+def test_kernels_same_discharge(inps, prms_sets, bknd):
+
+    # All kernels call _hbv1d012a_stp with float32 states. The regular
+    # (full outputs), the discharge-only and the batch runs give the same
+    # discharge.
+    prms_sets = prms_sets[:4]
+
+    diss_rglr = []
+    for prms in prms_sets:
+        modl_objt = get_modl_objt(bknd, inps, prms, 0)
+        modl_objt.run_model()
+
+        diss_rglr.append(modl_objt.get_discharge().copy())
+
+        modl_objt.set_optimization_flag(1)
+        modl_objt.run_model()
+
+        assert np.array_equal(modl_objt.get_discharge(), diss_rglr[-1])
+
+    diss_rglr = np.array(diss_rglr)
+
+    diss_bh = modl_objt.run_batch(prms_sets)
+
+    assert np.array_equal(diss_bh, diss_rglr)
+
+    # Without a bound, no set is stopped.
+    diss_bd, sses = modl_objt.run_batch_bounded(
+        prms_sets,
+        np.zeros(inps[0].shape[0], dtype=np.float32),
+        np.full(prms_sets.shape[0], np.inf))
+
+    assert np.array_equal(diss_bd, diss_rglr)
+
+    assert np.allclose(
+        sses, (diss_rglr.astype(np.float64) ** 2).sum(axis=1), rtol=1e-6)
+
+
+@pytest.mark.parametrize('bknd', ['py', 'nb'])
+def test_selected_outputs_same(inps, prms_sets, bknd):
+
+    modl_objt = get_modl_objt(bknd, inps, prms_sets[1])
+    modl_objt.run_model()
+
+    otps = modl_objt.get_outputs().copy()
+    diss = modl_objt.get_discharge().copy()
+
+    otps_lbls = ('snw_dth', 'sl1_mse', 'mod_bal')
+
+    modl_objt.set_outputs(inps[0].shape[0], otps_lbls)
+    modl_objt.run_model()
+
+    idxs_otps = modl_objt.get_output_labels()
+
+    assert np.array_equal(modl_objt.get_discharge(), diss)
+
+    assert np.array_equal(
+        modl_objt.get_outputs()[:, :2],
+        otps[:, [idxs_otps['snw_dth'], idxs_otps['sl1_mse']]])
+
+    assert np.allclose(
+        modl_objt.get_outputs()[:, 2], otps[:, idxs_otps['mod_bal']],
+        atol=1e-3)
+
+
+@pytest.mark.parametrize('bknd', ['py', 'nb'])
+def test_restart_checkpoints_spin_up(tmp_path, inps, prms_sets, bknd):
+
+    # A run that starts from the states of another run at some time step
+    # continues it exactly. So do the states of the checkpoints of an
+    # optimization run and of the (cached) spin-up.
+    tstp = 400
+
+    modl_objt = get_modl_objt(bknd, inps, prms_sets[1])
+    modl_objt.run_model()
+
+    diss = modl_objt.get_discharge().copy()
+    stts = modl_objt.get_state(tstp - 1)
+
+    modl_objt_rstt = get_modl_objt(
+        bknd, [inp[tstp:] for inp in inps], prms_sets[1])
+
+    modl_objt_rstt.set_state(stts)
+    modl_objt_rstt.run_model()
+
+    assert np.array_equal(modl_objt_rstt.get_discharge(), diss[tstp:])
+
+    assert np.array_equal(
+        modl_objt_rstt.get_state(), modl_objt.get_state())
+
+    modl_objt.set_optimization_flag(1)
+    modl_objt.set_checkpoint_steps(100)
+    modl_objt.run_model()
+
+    assert np.array_equal(modl_objt.get_state(tstp - 1), stts)
+
+    with pytest.raises(AssertionError, match='No checkpoint'):
+        modl_objt.get_state(tstp)
+
+    assert np.array_equal(
+        modl_objt.run_spin_up(tstp, tmp_path), stts)
+
+    assert len(list(tmp_path.glob('stts_*.npy'))) == 1
+
+    # Taken from the cache now.
+    modl_objt._modl_dis = None
+
+    assert np.array_equal(
+        modl_objt.run_spin_up(tstp, tmp_path), stts)
+
+
+@pytest.mark.parametrize('bknd', ['py', 'nb'])
+def test_online_same_as_full(inps, prms_sets, bknd):
+
+    # Chunks of any length, one after the other, give the discharge and the
+    # states of a single run.
+    modl_objt = get_modl_objt(bknd, inps, prms_sets[1])
+    modl_objt.run_model()
+
+    diss = modl_objt.get_discharge().copy()
+
+    diss_onl = []
+    for beg, end in ((0, 1), (1, 24), (24, 24), (24, 700), (700, None)):
+        diss_onl.append(
+            modl_objt.run_model_online(*[inp[beg:end] for inp in inps]))
+
+    assert np.array_equal(np.concatenate(diss_onl), diss)
+
+    stts_onl, tsps_onl = modl_objt.get_online_state()
+
+    assert tsps_onl == inps[0].shape[0]
+    assert np.array_equal(stts_onl, modl_objt.get_state())
+
+    # The inputs and outputs of run_model are not touched.
+    assert np.array_equal(modl_objt.get_discharge(), diss)
+
+
+def test_2d_same_as_lumped(inps, prms_sets):
+
+    # Each cell of the grid is a lumped model with its own inputs and
+    # parameters. Cells outside the mask are not simulated.
+    tems, ppts, pets = inps
+
+    ppts_grd = ppts[:, None, None] * np.array(
+        [[0.5, 1.0, 1.5], [2.0, 0.0, 1.2]], dtype=np.float32)
+
+    cels_mask = np.ones((2, 3), dtype=bool)
+    cels_mask[1, 2] = False
+
+    prms_grd = prms_sets[1:7].reshape(2, 3, -1)
+
+    modl_objt = HBV2D012A('py')
+    modl_objt.set_inputs(tems, ppts_grd, pets, cels_mask)
+    modl_objt.set_discharge_scaler(8.67)
+    modl_objt.set_parameters(prms_grd)
+    modl_objt.run_model()
+
+    assert modl_objt.get_number_of_cells() == 5
+
+    diss_grd = modl_objt.get_discharge_grid()
+
+    assert np.isnan(diss_grd[:, 1, 2]).all()
+
+    for y, x in zip(*np.nonzero(cels_mask)):
+        modl_objt_lpd = get_modl_objt(
+            'py', (tems, ppts_grd[:, y, x], pets), prms_grd[y, x])
+
+        modl_objt_lpd.run_model()
+
+        assert np.array_equal(
+            diss_grd[:, y, x], modl_objt_lpd.get_discharge()), (y, x)
+
+    assert np.allclose(
+        modl_objt.get_outlet_discharge(),
+        np.nansum(diss_grd, axis=(1, 2)),
+        rtol=1e-6)
+
+
+def test_cats_same_as_lumped(inps, prms_sets):
+
+    # Each catchment is a lumped model with its own inputs, parameters and
+    # discharge scaler. A run from the states of the end of another run
+    # continues it.
+    tems, ppts, pets = inps
+
+    ppts_cats = np.stack((ppts, 0.5 * ppts, 2.0 * ppts))
+    prms_cats = prms_sets[1:4]
+    dslrs = np.array([8.67, 1.0, 25.0], dtype=np.float32)
+
+    tstp = 500
+
+    modl_objt = HBV1D012ACats('py')
+    modl_objt.set_inputs(tems[:tstp], ppts_cats[:, :tstp], pets[:tstp])
+    modl_objt.set_discharge_scaler(dslrs)
+    modl_objt.set_parameters(prms_cats)
+    modl_objt.run_model()
+
+    assert modl_objt.get_number_of_catchments() == 3
+
+    diss_cats = [modl_objt.get_discharge().copy()]
+
+    stts = modl_objt.get_state()
+
+    modl_objt.set_inputs(tems[tstp:], ppts_cats[:, tstp:], pets[tstp:])
+    modl_objt.set_discharge_scaler(dslrs)
+    modl_objt.set_parameters(prms_cats)
+    modl_objt.set_state(stts)
+    modl_objt.run_model()
+
+    diss_cats.append(modl_objt.get_discharge())
+
+    diss_cats = np.concatenate(diss_cats, axis=1)
+
+    for i in range(3):
+        modl_objt_lpd = get_modl_objt(
+            'py', (tems, ppts_cats[i], pets), prms_cats[i])
+
+        modl_objt_lpd.set_discharge_scaler(dslrs[i])
+        modl_objt_lpd.run_model()
+
+        assert np.array_equal(
+            diss_cats[i], modl_objt_lpd.get_discharge()), i
+
+
+@pytest.mark.parametrize('oflg', [0, 1])
+def test_prepared_run_same(inps, prms_buds, prms_sets, oflg):
+
+    # Same discharge as set_parameters and run_model, also from states that
+    # were set before.
+    modl_objt = get_modl_objt('py', inps, prms_sets[1], oflg)
+    modl_objt.run_model()
+
+    modl_objt.set_state(modl_objt.get_state())
+
+    modl_prep = modl_objt.get_prepared_run(prms_buds)
+
+    assert modl_prep.get_parameter_bounds() is prms_buds
+
+    for prms in prms_sets[1:5]:
+        modl_objt.set_parameters(prms)
+        modl_objt.run_model()
+
+        assert np.array_equal(
+            modl_prep.run(prms), modl_objt.get_discharge())
+
+
+def test_py_nb_same(inps, prms_sets):
+
+    # Both backends run the same float32 arithmetic. The only allowed
+    # difference is that of the pow of the C library (relative 1e-6).
+    rtol = 1e-6
+
+    for prms in prms_sets:
+        otps = {}
+        diss = {}
+        for bknd in ('py', 'nb'):
+            modl_objt = get_modl_objt(bknd, inps, prms)
+            modl_objt.run_model()
+
+            otps[bknd] = modl_objt.get_outputs().copy()
+            diss[bknd] = modl_objt.get_discharge().copy()
+
+        np.testing.assert_allclose(diss['nb'], diss['py'], rtol=rtol)
+        np.testing.assert_allclose(
+            otps['nb'], otps['py'], rtol=rtol, atol=1e-5)
+
+    diss_bh = {}
+    for bknd in ('py', 'nb'):
+        modl_objt = get_modl_objt(bknd, inps, prms_sets[0])
+
+        diss_bh[bknd] = modl_objt.run_batch(prms_sets)
+
+    np.testing.assert_allclose(diss_bh['nb'], diss_bh['py'], rtol=rtol)
+
+
+def test_nest_set_inputs_resets_network(inps, prms_sets):
+
+    # prms_sets[1] has no divisions by zero.
+    modl_objt = HBV1D012ANest('py')
+
+    modl_objt.set_inputs(*inps)
+    modl_objt.set_network((-1,))
+    modl_objt.set_discharge_scaler(8.67)
+    modl_objt.set_parameters(prms_sets[1])
+    modl_objt.run_model()
+
+    # Two units now. The network of one unit must not be used.
+    modl_objt.set_inputs(*[np.stack((inp, inp)) for inp in inps])
+    modl_objt.set_discharge_scaler(8.67)
+    modl_objt.set_parameters(prms_sets[1])
+
+    with pytest.raises(AssertionError, match='Network not set!'):
+        modl_objt.run_model()
+
+    modl_objt.set_network((1, -1))
+    modl_objt.run_model()
+
+    # No lag and no attenuation. The outlet gets both units.
+    diss = modl_objt.get_local_discharge()
+
+    assert np.allclose(
+        modl_objt.get_discharge()[1], diss.sum(axis=0), rtol=1e-6)